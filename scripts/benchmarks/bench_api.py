@@ -0,0 +1,180 @@
+"""
+Load test for the classification API (scripts/run_api.py): concurrent clients
+send single-log POST /classify requests over keep-alive connections and the
+script reports p50 / p95 / p99 latency, throughput and the mean micro-batch
+size for each batching setting.
+By default it starts one server per --configs entry ("max_batch_size:max_wait_ms";
+"1:0" disables batching) against the production models; --url load-tests an
+already running server instead.
+
+Usage:
+    python scripts/benchmarks/bench_api.py --clients 32 --duration 20 --configs 1:0,64:5,64:10
+    python scripts/benchmarks/bench_api.py --url http://127.0.0.1:8000 --clients 16
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+from synthetic_logs import generate_logs
+
+REPO_ROOT = os.path.abspath(os.path.join(sys.path[0], "..", ".."))
+
+
+def get_json(host, port, path, timeout=5):
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def wait_until_up(host, port, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return get_json(host, port, "/health")
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"API on {host}:{port} did not come up within {timeout}s")
+
+
+def client(host, port, bodies, stop_at, latencies, errors):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {"Content-Type": "application/json"}
+    i = 0
+    while time.monotonic() < stop_at:
+        body = bodies[i % len(bodies)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/classify", body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except OSError:
+            errors.append(1)
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        if response.status != 200:
+            errors.append(response.status)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def load_test(host, port, bodies, clients, duration):
+    # Warm up: first requests pay for lazy initialisation
+    client(host, port, bodies[:20], time.monotonic() + 1.0, [], [])
+
+    latencies, errors = [], []
+    stop_at = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=client, args=(host, port, bodies[c::clients], stop_at, latencies, errors)
+        )
+        for c in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000.0
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "req_per_sec": round(len(latencies) / wall, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 1) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 1) if len(ms) else None,
+        "batching": get_json(host, port, "/health")["batching"],
+    }
+
+
+def start_server(port, max_batch_size, max_wait_ms):
+    env = dict(
+        os.environ,
+        API_HOST="127.0.0.1",
+        API_PORT=str(port),
+        API_MAX_BATCH_SIZE=str(max_batch_size),
+        API_MAX_WAIT_MS=str(max_wait_ms),
+    )
+    return subprocess.Popen(
+        [sys.executable, "scripts/run_api.py"],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def print_row(label, result):
+    batching = result["batching"]
+    print(
+        f"{label:<12} {result['req_per_sec']:>9} req/s  p50={result['p50_ms']}ms  "
+        f"p95={result['p95_ms']}ms  p99={result['p99_ms']}ms  "
+        f"mean_batch={batching['mean_batch_size']}  errors={result['errors']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--configs", default="1:0,64:5,64:10")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", default=None, help="Load-test a running server instead")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    bodies = [
+        json.dumps(
+            {
+                "message": log["message"],
+                "level": log["level"],
+                "source": log["source"],
+                "parsed_data": log["parsed_data"],
+                "app_id": str(log["app_id"]),
+            }
+        )
+        for log in generate_logs(5000)
+    ]
+    print(f"{args.clients} clients, {args.duration:.0f}s per run, single-log requests")
+
+    results = {}
+    if args.url:
+        target = urlparse(args.url)
+        wait_until_up(target.hostname, target.port)
+        results[args.url] = load_test(target.hostname, target.port, bodies, args.clients, args.duration)
+        print_row("server", results[args.url])
+    else:
+        for config in args.configs.split(","):
+            max_batch_size, max_wait_ms = config.split(":")
+            server = start_server(args.port, max_batch_size, max_wait_ms)
+            try:
+                wait_until_up("127.0.0.1", args.port)
+                results[config] = load_test("127.0.0.1", args.port, bodies, args.clients, args.duration)
+            finally:
+                server.terminate()
+                server.wait()
+            print_row(config, results[config])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Recall / latency sweep of the approximate centroid indexes against the exact
+scan, using a saved vector_centroids.pkl as the centroid set.
+Queries are jittered copies of existing centroids, i.e. logs that should
+land in a known group.
+
+Usage:
+    python scripts/benchmarks/bench_centroid_index.py --centroids scripts/models/production/vector_centroids.pkl
+"""
+
+import argparse
+import sys
+import time
+
+import joblib
+import numpy as np
+
+sys.path.append(sys.path[0] + "/../..")
+
+from src.ml.centroid_index import measure_recall
+from src.ml.vector_engine import SemanticVectorEngine
+
+CONFIGS = [
+    ("ivf", {"n_probe": 1}),
+    ("ivf", {"n_probe": 4}),
+    ("ivf", {"n_probe": 16}),
+    ("lsh", {"n_tables": 8, "n_bits": 12}),
+    ("lsh", {"n_tables": 16, "n_bits": 10}),
+]
+
+
+def build_engine(centroids, index, params):
+    engine = SemanticVectorEngine(minkowski_p=1.5, threshold=0.35, index=index, index_params=params)
+    start = time.perf_counter()
+    engine.active_centroids = centroids
+    return engine, time.perf_counter() - start
+
+
+def time_search(engine, queries):
+    start = time.perf_counter()
+    engine._nearest_existing(queries)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--centroids", default="scripts/models/production/vector_centroids.pkl")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.01)
+    args = parser.parse_args()
+
+    centroids = joblib.load(args.centroids)
+    matrix = np.stack(list(centroids.values())).astype(np.float32)
+    rng = np.random.default_rng(42)
+    queries = matrix[rng.choice(len(matrix), args.queries)]
+    queries = (queries + rng.normal(0, args.noise, queries.shape)).astype(np.float32)
+
+    print(f"--- CENTROID INDEX SWEEP ({len(matrix)} centroids, {len(queries)} queries) ---")
+    exact, _ = build_engine(centroids, "exact", None)
+    print(f"  exact                              : {time_search(exact, queries):7.3f} ms/query")
+
+    for index, params in CONFIGS:
+        engine, build_secs = build_engine(centroids, index, params)
+        latency = time_search(engine, queries)
+        recall = measure_recall(engine, queries)
+        print(
+            f"  {index} {str(params):<30}: {latency:7.3f} ms/query  "
+            f"recall={recall:.3f}  build={build_secs:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Load time and resident memory of the semantic centroids: the vector_centroids.pkl
+dict versus the memory-mapped CentroidStore in float32 and float16.
+Each variant is measured in a fresh subprocess (load + one search over all
+centroids, so every page is touched).
+
+Usage:
+    python scripts/benchmarks/bench_centroid_store.py --centroids scripts/models/production/vector_centroids.pkl
+    python scripts/benchmarks/bench_centroid_store.py --synthetic 200000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import joblib
+import numpy as np
+
+sys.path.append(sys.path[0] + "/../..")
+
+from src.ml.vector_engine import SemanticVectorEngine
+
+# Runs in the child: prints "load_secs|rss_delta_bytes|n_centroids"
+PROBE = """
+import sys, time
+sys.path.insert(0, {root!r})
+import numpy as np
+from src.ml.centroid_store import CentroidStore
+from src.ml.vector_engine import SemanticVectorEngine
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * {page_size}
+
+engine = SemanticVectorEngine()
+query = np.load({query!r})
+before = rss()
+start = time.perf_counter()
+if {variant!r} == "pickle":
+    engine.load({pickle_path!r})
+else:
+    engine.use_store(CentroidStore.load({store_dir!r}))
+secs = time.perf_counter() - start
+engine.get_semantic_groups(query, [0])
+print(f"{{secs}}|{{rss() - before}}|{{len(engine.centroid_ids)}}")
+"""
+
+
+def probe(variant, pickle_path, store_dir, query_path):
+    code = PROBE.format(
+        root=os.path.abspath(sys.path[0] + "/../.."),
+        page_size=os.sysconf("SC_PAGE_SIZE"),
+        query=query_path,
+        variant=variant,
+        pickle_path=pickle_path,
+        store_dir=store_dir,
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    secs, rss, n = out.stdout.strip().splitlines()[-1].split("|")
+    return float(secs), int(rss), int(n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--centroids", default="scripts/models/production/vector_centroids.pkl")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N random centroids instead")
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        rng = np.random.default_rng(42)
+        matrix = rng.normal(0, 0.05, (args.synthetic, args.dim)).astype(np.float32)
+        ids = [f"sem_grp_{i}" for i in range(args.synthetic)]
+    else:
+        centroids = joblib.load(args.centroids)
+        ids = list(centroids.keys())
+        matrix = np.stack(list(centroids.values())).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = os.path.join(tmp, "vector_centroids.pkl")
+        query_path = os.path.join(tmp, "query.npy")
+        np.save(query_path, matrix[:1])
+
+        engine = SemanticVectorEngine()
+        engine.set_centroids(ids, matrix)
+        engine.save(pickle_path)
+
+        print(f"--- CENTROID STORE ({len(ids)} centroids x {matrix.shape[1]}) ---")
+        variants = [("pickle", None, pickle_path)]
+        for dtype in ("float32", "float16"):
+            store_dir = os.path.join(tmp, dtype)
+            engine = SemanticVectorEngine(storage_dtype=dtype)
+            engine.set_centroids(ids, matrix)
+            engine.save_arrays(store_dir)
+            variants.append((f"store {dtype}", store_dir, os.path.join(store_dir, "centroids.npy")))
+
+        for name, store_dir, path in variants:
+            variant = "pickle" if store_dir is None else "store"
+            secs, rss, n = probe(variant, pickle_path, store_dir, query_path)
+            print(
+                f"  {name:<14}: load {secs * 1000:8.1f} ms  rss +{rss / 1e6:7.1f} MB  "
+                f"file {os.path.getsize(path) / 1e6:7.1f} MB  ({n} centroids)"
+            )
+
+
+if __name__ == "__main__":
+    main()
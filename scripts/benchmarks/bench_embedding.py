@@ -0,0 +1,85 @@
+"""
+Compares embedding throughput of the old per-row loop (one
+`get_text_embedding` call per log) against the batched
+`get_text_embeddings` path used by run_incremental_batch.py.
+
+Usage:
+    python scripts/benchmarks/bench_embedding.py --logs 2000 --batch-sizes 16 32 64 128
+"""
+
+import argparse
+import random
+import sys
+import time
+
+sys.path.append(sys.path[0] + "/../..")
+
+from src.ml import build_log_text, get_text_embedding, get_text_embeddings
+
+SOURCES = ["api-gateway", "auth-service", "payment-service", "db-proxy", "worker"]
+MESSAGES = [
+    "Connection to upstream {host} timed out after {ms}ms",
+    "User {user} failed authentication from {ip}",
+    "Payment {txn} declined with code {code}",
+    "Slow query detected on table orders ({ms}ms)",
+    "Worker {user} crashed while processing job {txn}",
+]
+
+
+def make_texts(n, seed=42):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        message = rng.choice(MESSAGES).format(
+            host=f"10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+            ms=rng.randint(100, 30000),
+            user=rng.randint(1000, 9999),
+            ip=f"192.168.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+            txn=f"txn_{rng.randint(10**6, 10**7)}",
+            code=rng.choice(["E101", "E204", "E500"]),
+        )
+        parsed = {"source": rng.choice(SOURCES), "retry": rng.randint(0, 3)}
+        texts.append(build_log_text(message, parsed))
+    return texts
+
+
+def bench_per_row(texts):
+    start = time.perf_counter()
+    for text in texts:
+        get_text_embedding(text)
+    return time.perf_counter() - start
+
+
+def bench_batched(texts, batch_size):
+    start = time.perf_counter()
+    get_text_embeddings(texts, batch_size=batch_size)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logs", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64, 128])
+    args = parser.parse_args()
+
+    texts = make_texts(args.logs)
+
+    # Warm-up so the first measured run doesn't pay for lazy init
+    get_text_embeddings(texts[:8])
+
+    print(f"--- EMBEDDING THROUGHPUT ({len(texts)} logs) ---")
+    secs = bench_per_row(texts)
+    baseline = len(texts) / secs
+    print(f"  per-row loop          : {baseline:8.1f} logs/sec ({secs:.2f}s)")
+
+    for batch_size in args.batch_sizes:
+        secs = bench_batched(texts, batch_size)
+        rate = len(texts) / secs
+        print(
+            f"  batched (size={batch_size:<4})   : {rate:8.1f} logs/sec "
+            f"({secs:.2f}s, {rate / baseline:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Parity + throughput of the embedding backends against the current fp32
+SentenceTransformer. For each backend it reports:
+  - cosine similarity of its vectors to the reference vectors (mean / p01 / min)
+  - how many logs land in the same SemanticVectorEngine group as with the
+    reference vectors (fresh engine, or --centroids to start from saved ones)
+  - logs/sec
+and exits 1 if a backend's p01 cosine or same-group rate is below
+--min-cosine / --min-same-group.
+
+Usage:
+    python scripts/export_onnx_embedding.py
+    python scripts/benchmarks/bench_embedding_backends.py --logs 2000 --backends int8 onnx onnx-int8
+"""
+
+import argparse
+import sys
+import time
+
+import joblib
+
+sys.path.append(sys.path[0] + "/../..")
+
+from src.ml import SemanticVectorEngine, compare_embeddings, get_text_embeddings, make_backend
+from src.ml.embedding_backends import BACKEND_TYPES, DEFAULT_MODEL, ONNX_DIR
+
+from bench_embedding import make_texts
+
+
+def encode(backend, texts, batch_size):
+    # Warm-up so lazy model loading isn't timed
+    get_text_embeddings(texts[:8], batch_size=batch_size, backend=backend)
+    start = time.perf_counter()
+    vectors = get_text_embeddings(texts, batch_size=batch_size, backend=backend)
+    return vectors, time.perf_counter() - start
+
+
+def group(vectors, centroids):
+    engine = SemanticVectorEngine(minkowski_p=1.5, threshold=0.35)
+    if centroids:
+        engine.active_centroids = centroids
+    return engine.get_semantic_groups(vectors, list(range(len(vectors))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logs", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx", "onnx-int8"], choices=BACKEND_TYPES)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--onnx-dir", default=ONNX_DIR)
+    parser.add_argument("--centroids", default=None, help="vector_centroids.pkl to group against")
+    parser.add_argument("--min-cosine", type=float, default=0.999)
+    parser.add_argument("--min-same-group", type=float, default=0.99)
+    args = parser.parse_args()
+
+    texts = make_texts(args.logs)
+    centroids = joblib.load(args.centroids) if args.centroids else None
+
+    def backend(name):
+        if name.startswith("onnx"):
+            return make_backend(name, model_name=args.model, model_dir=args.onnx_dir)
+        return make_backend(name, model_name=args.model)
+
+    reference, ref_secs = encode(backend("sentence-transformers"), texts, args.batch_size)
+    ref_groups = group(reference, centroids)
+    ref_rate = len(texts) / ref_secs
+
+    print(f"--- EMBEDDING BACKENDS ({len(texts)} logs, batch_size={args.batch_size}) ---")
+    print(f"  {'sentence-transformers':<22}: {ref_rate:8.1f} logs/sec  (reference)")
+
+    failed = []
+    for name in args.backends:
+        try:
+            vectors, secs = encode(backend(name), texts, args.batch_size)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"  {name:<22}: skipped ({e})")
+            continue
+
+        parity = compare_embeddings(reference, vectors)
+        groups = group(vectors, centroids)
+        same = sum(a == b for a, b in zip(ref_groups, groups)) / len(groups)
+        rate = len(texts) / secs
+        print(
+            f"  {name:<22}: {rate:8.1f} logs/sec ({rate / ref_rate:.1f}x)  "
+            f"cosine mean={parity['mean']:.5f} p01={parity['p01']:.5f} min={parity['min']:.5f}  "
+            f"same group={same:.1%}"
+        )
+        if parity["p01"] < args.min_cosine or same < args.min_same_group:
+            failed.append(name)
+
+    if failed:
+        print(f"FAIL: {', '.join(failed)} below --min-cosine / --min-same-group")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+End-to-end throughput of the incremental path (BatchRunner.run_batch: fetch ->
+embed -> classify -> write, save_pattern, incident detection) on synthetic
+logs in a local Postgres, across batch sizes and centroid-store sizes.
+Reports logs/sec, per-stage time (src/metrics.py) and peak RSS; each
+configuration runs in a fresh process so RSS and caches do not carry over.
+
+Tables are created in their own schema (--schema, dropped and recreated per
+run), so a local development database can be used as the stand-in for RDS.
+Models come from --production-dir; extra random centroids are appended to a
+temporary copy of its snapshot to size the centroid store.
+
+Results can be saved as a baseline and compared against later runs; --compare
+exits with status 1 if any configuration is more than --tolerance slower.
+
+Usage:
+    python scripts/benchmarks/bench_pipeline.py --database-url postgresql+psycopg2://postgres@localhost/postgres \
+        --batch-sizes 2000,10000 --centroids 0,50000 --save-baseline scripts/benchmarks/baselines/pipeline.json
+    python scripts/benchmarks/bench_pipeline.py --database-url ... --compare scripts/benchmarks/baselines/pipeline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(sys.path[0] + "/../..")
+
+REPO_ROOT = os.path.abspath(os.path.join(sys.path[0], "..", ".."))
+
+# Columns the pipeline reads and writes; the production schema lives in RDS
+SCHEMA_SQL = """
+DROP SCHEMA IF EXISTS {schema} CASCADE;
+CREATE SCHEMA {schema};
+SET search_path TO {schema};
+CREATE TABLE logs (
+    log_id BIGINT PRIMARY KEY, app_id INT, level TEXT, source TEXT, message TEXT,
+    parsed_data JSONB, timestamp TIMESTAMPTZ DEFAULT NOW(), cluster_id INT
+);
+CREATE TABLE log_embeddings (
+    log_id BIGINT PRIMARY KEY, app_id INT, embedding REAL[], cluster_id INT, level TEXT, source TEXT
+);
+CREATE TABLE log_patterns (
+    pattern_id SERIAL PRIMARY KEY, app_id INT, log_template TEXT, incident_count INT,
+    cluster_id INT UNIQUE, last_seen TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE TABLE cluster_volume_history (
+    id SERIAL PRIMARY KEY, cluster_id INT, log_count INT, batch_timestamp TIMESTAMPTZ
+);
+CREATE TABLE incidents (
+    incident_id SERIAL PRIMARY KEY, cluster_id INT, status TEXT, assigned_role TEXT,
+    assigned_to TEXT, created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ, resolved_at TIMESTAMPTZ
+);
+CREATE UNIQUE INDEX incidents_active_cluster_key ON incidents (cluster_id) WHERE status IN ('OPEN', 'NEW');
+CREATE TABLE batch_order (
+    batchid SERIAL PRIMARY KEY, start_log_id BIGINT, end_log_id BIGINT, status TEXT,
+    last_processed_timestamp TIMESTAMPTZ
+);
+"""
+
+STAGES = [
+    "db_fetch_seconds",
+    "template_mining_seconds",
+    "embedding_seconds",
+    "semantic_grouping_seconds",
+    "predict_seconds",
+    'db_write_seconds{table="log_embeddings"}',
+    "save_pattern_seconds",
+    "incident_detection_seconds",
+]
+
+
+def make_engine(database_url, schema):
+    from sqlalchemy import create_engine
+
+    return create_engine(database_url, connect_args={"options": f"-csearch_path={schema}"})
+
+
+def prepare_models(production_dir, extra_centroids, workdir, seed=0):
+    """
+    Copy of production_dir with a model snapshot holding `extra_centroids` more
+    random centroids (a snapshot is compiled from the pickles if there is none).
+    """
+    from src.ml import SemanticVectorEngine, compile_inference_plan, load_model
+    from src.ml.centroid_index import INDEX_FILE
+    from src.ml.model import load_snapshot, save_snapshot
+    from src.ml.pipeline import embedding_dimension
+
+    target = os.path.join(workdir, f"models_{extra_centroids}")
+    shutil.copytree(production_dir, target)
+    snapshot = load_snapshot(target)
+    if snapshot is not None and not extra_centroids:
+        return target
+
+    if snapshot is not None:
+        plan, engine = snapshot.plan, snapshot.build_vector_engine()
+    else:
+        model, pipeline = load_model(directory=target)
+        if model is None:
+            raise SystemExit(f"No model in {production_dir}")
+        plan = compile_inference_plan(model, pipeline)
+        engine = SemanticVectorEngine()
+        engine.load(os.path.join(target, "vector_centroids.pkl"))
+
+    ids = list(engine.centroid_ids)
+    if ids:
+        matrix = np.asarray(engine.centroid_matrix, dtype=np.float32)
+    else:
+        matrix = np.empty((0, embedding_dimension), dtype=np.float32)
+    dim = matrix.shape[1]
+
+    # Random directions never win against a real group, so grouping results are
+    # unchanged and only the search cost grows
+    rng = np.random.default_rng(seed)
+    extra = rng.standard_normal((extra_centroids, dim)).astype(np.float32)
+    extra /= np.linalg.norm(extra, axis=1, keepdims=True)
+    engine.set_centroids(
+        ids + [f"bench_{i}" for i in range(extra_centroids)], np.vstack([matrix, extra])
+    )
+    if os.path.exists(os.path.join(target, INDEX_FILE)):
+        os.remove(os.path.join(target, INDEX_FILE))
+    save_snapshot(target, plan, engine)
+    return target
+
+
+def run_child(config):
+    """One configuration in this (fresh) process; prints a JSON result line."""
+    from sqlalchemy import text
+
+    from src import metrics
+    from src.batch_runner import BatchRunner
+    from synthetic_logs import generate_logs, insert_logs
+
+    engine = make_engine(config["database_url"], config["schema"])
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA_SQL.format(schema=config["schema"])))
+    insert_logs(
+        engine,
+        generate_logs(config["batch_size"], error_ratio=config["error_ratio"], seed=config["seed"]),
+    )
+
+    metrics.enable()
+    runner = BatchRunner(
+        engine,
+        config["models_dir"],
+        engine_params={"minkowski_p": 1.5, "threshold": 0.35},
+        fetch_size=config["fetch_size"],
+        workers=config["workers"],
+        embedding_cache_dir=None,
+    )
+    if not runner.loaded:
+        raise SystemExit(f"No model in {config['models_dir']}")
+
+    start = time.perf_counter()
+    processed = runner.run_batch(1, 1, config["batch_size"])
+    secs = time.perf_counter() - start
+
+    summary = metrics.summary()
+    stages = {
+        name: summary["histograms"][name]["sum"] for name in STAGES if name in summary["histograms"]
+    }
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024  # kilobytes on Linux
+    result = {
+        "logs": processed,
+        "seconds": round(secs, 3),
+        "logs_per_sec": round(processed / secs, 1),
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+        "stage_seconds": {name: round(value, 3) for name, value in stages.items()},
+        "centroids_created": summary["counters"].get("centroids_created_total", 0),
+    }
+    print("RESULT " + json.dumps(result))
+
+
+def run_config(config):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json.dumps(config)],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT ") :])
+    raise RuntimeError(f"Benchmark run failed:\n{proc.stdout[-2000:]}\n{proc.stderr[-4000:]}")
+
+
+def compare(report, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline_report = json.load(f)
+    baseline = baseline_report["results"]
+    regressions = 0
+    print(f"--- Compared with {baseline_path} (tolerance {tolerance:.0%}) ---")
+    for section in ("machine", "settings"):
+        if baseline_report.get(section) != report[section]:
+            print(f"  WARNING: {section} differs from the baseline: {baseline_report.get(section)}")
+    for key, result in report["results"].items():
+        if key not in baseline:
+            print(f"  {key:<24} no baseline")
+            continue
+        ratio = result["logs_per_sec"] / baseline[key]["logs_per_sec"]
+        status = "REGRESSION" if ratio < 1 - tolerance else "ok"
+        regressions += status != "ok"
+        print(
+            f"  {key:<24} {baseline[key]['logs_per_sec']:>8} -> {result['logs_per_sec']:>8} logs/s "
+            f"(x{ratio:.2f})  rss {baseline[key]['peak_rss_mb']} -> {result['peak_rss_mb']} MB  {status}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL"))
+    parser.add_argument("--schema", default="logstream_bench")
+    parser.add_argument("--production-dir", default="scripts/models/production")
+    parser.add_argument("--batch-sizes", default="2000,10000")
+    parser.add_argument("--centroids", default="0,50000", help="Extra centroids in the store")
+    parser.add_argument("--fetch-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--error-ratio", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write this run's results here")
+    parser.add_argument("--save-baseline", default=None)
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+    if not args.database_url:
+        parser.error("--database-url (or BENCH_DATABASE_URL) is required")
+
+    print(f"--- PIPELINE BENCHMARK ({os.cpu_count()} CPUs, schema {args.schema}) ---")
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_centroids in [int(c) for c in args.centroids.split(",")]:
+            models_dir = prepare_models(args.production_dir, n_centroids, workdir, seed=args.seed)
+            for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+                key = f"logs={batch_size},centroids={n_centroids}"
+                results[key] = run_config(
+                    {
+                        "database_url": args.database_url,
+                        "schema": args.schema,
+                        "models_dir": models_dir,
+                        "batch_size": batch_size,
+                        "fetch_size": args.fetch_size,
+                        "workers": args.workers,
+                        "error_ratio": args.error_ratio,
+                        "seed": args.seed,
+                    }
+                )
+                r = results[key]
+                stages = "  ".join(
+                    f"{name.split('_seconds')[0]}={secs:.2f}s" for name, secs in r["stage_seconds"].items()
+                )
+                print(
+                    f"  {key:<24} {r['logs_per_sec']:>8} logs/s  {r['seconds']:7.2f}s  "
+                    f"peak_rss={r['peak_rss_mb']}MB\n      {stages}"
+                )
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "machine": {
+            "cpus": os.cpu_count(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+        },
+        "settings": {
+            "fetch_size": args.fetch_size,
+            "workers": args.workers,
+            "error_ratio": args.error_ratio,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Wrote {path}")
+
+    if args.compare and compare(report, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
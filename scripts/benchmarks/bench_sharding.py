@@ -0,0 +1,112 @@
+"""
+Throughput of embedding + semantic grouping with 1, 2, 4 and 8 worker
+processes (ShardPool) on synthetic log texts, and whether every worker count
+produces the same semantic groups as the in-process run.
+Run it on the target machine (e.g. a Fargate task); scaling is bounded by
+its vCPU count.
+
+Usage:
+    python scripts/benchmarks/bench_sharding.py --logs 8000 --workers 1,2,4,8
+    python scripts/benchmarks/bench_sharding.py --centroids scripts/models/production/vector_centroids.pkl
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import joblib
+
+sys.path.append(sys.path[0] + "/../..")
+
+from src.ml.embedding_backends import DEFAULT_MODEL, make_backend
+from src.ml.pipeline import embed_and_group, get_text_embeddings
+from src.ml.sharding import ShardPool
+from src.ml.vector_engine import SemanticVectorEngine
+
+TEMPLATES = [
+    "Connection to {host} timed out after {n}ms",
+    "User {user} failed authentication from {ip}",
+    "Payment {id} declined with code {n}",
+    "Slow query detected on table {table}: {n}ms",
+    "Worker {n} crashed while processing job {id}",
+    "Disk usage on {host} at {n} percent",
+]
+
+
+def synthetic_texts(n, seed=0):
+    rng = random.Random(seed)
+    tables = ["orders", "users", "payments", "sessions"]
+    texts = []
+    for _ in range(n):
+        template = rng.choice(TEMPLATES)
+        texts.append(
+            template.format(
+                host=f"db-{rng.randint(1, 40)}.internal",
+                n=rng.randint(1, 99999),
+                user=f"user{rng.randint(1, 5000)}",
+                ip=f"10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+                id=f"{rng.getrandbits(40):x}",
+                table=rng.choice(tables),
+            )
+        )
+    return texts
+
+
+def run(workers, texts, chunk_size, args, centroids):
+    engine = SemanticVectorEngine(minkowski_p=1.5, threshold=0.35)
+    if centroids:
+        engine.active_centroids = centroids
+    backend = make_backend(args.backend, model_name=args.model)
+
+    pool = ShardPool(engine, backend, workers) if workers > 1 else None
+    grouper = pool or engine
+    start = time.perf_counter()
+    groups = []
+    try:
+        for offset in range(0, len(texts), chunk_size):
+            chunk = texts[offset : offset + chunk_size]
+            log_ids = list(range(offset, offset + len(chunk)))
+            _, sem_ids, _ = embed_and_group(
+                chunk,
+                log_ids,
+                grouper,
+                embed_fn=lambda batch: get_text_embeddings(batch, backend=pool or backend),
+            )
+            groups.extend(sem_ids)
+    finally:
+        if pool is not None:
+            pool.close()
+    return time.perf_counter() - start, groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logs", type=int, default=8000)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backend", default="sentence-transformers")
+    parser.add_argument("--centroids", default=None)
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.logs)
+    centroids = joblib.load(args.centroids) if args.centroids else None
+
+    print(f"--- SHARDED CLASSIFICATION ({args.logs} logs, {os.cpu_count()} CPUs) ---")
+    baseline = None
+    base_rate = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        secs, groups = run(workers, texts, args.chunk_size, args, centroids)
+        rate = len(texts) / secs
+        if baseline is None:
+            baseline, base_rate = groups, rate
+        print(
+            f"  {workers} worker(s): {rate:8.1f} logs/s  speedup x{rate / base_rate:4.2f}  "
+            f"same groups: {'yes' if groups == baseline else 'NO'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
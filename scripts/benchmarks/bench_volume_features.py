@@ -0,0 +1,107 @@
+"""
+VolumeAnomalyDetector._extract_features versus the previous per-cluster
+groupby loop (kept below as the reference) on synthetic volume histories.
+Checks that both return identical features and cluster ids, then reports the
+best-of-N time of each.
+
+Two history shapes per cluster count:
+  window    5 rows per cluster, as read from the VolumeWindow at inference time
+  training  1-40 rows per cluster (some below the window), as used in training
+
+Usage:
+    python scripts/benchmarks/bench_volume_features.py --clusters 100,10000,100000
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(sys.path[0] + "/../..")
+
+from src.ml.volume_analyzer import VolumeAnomalyDetector
+
+
+def reference_extract_features(history_df, window_size):
+    """The groupby loop _extract_features replaced."""
+    features = []
+    cluster_ids = []
+
+    if history_df.empty:
+        return np.array([]), []
+
+    for cid, group in history_df.groupby("cluster_id"):
+        if len(group) < window_size:
+            continue
+        group = group.sort_values("batch_timestamp")
+        counts = group["log_count"].values
+        current_vol = counts[-1]
+        velocity = current_vol - counts[-2]
+        rolling_avg = np.mean(counts)
+        std_dev = np.std(counts) + 1e-5
+        deviation = (current_vol - rolling_avg) / std_dev
+        features.append([current_vol, velocity, rolling_avg, deviation])
+        cluster_ids.append(cid)
+
+    return np.array(features), cluster_ids
+
+
+def make_history(n_clusters, shape, window_size, seed=0):
+    rng = np.random.default_rng(seed)
+    if shape == "window":
+        lengths = np.full(n_clusters, window_size)
+    else:
+        lengths = rng.integers(1, 41, n_clusters)
+    cluster_ids = np.repeat(rng.permutation(n_clusters * 3)[:n_clusters], lengths)
+    # Distinct batch timestamps within a cluster, rows in no particular order
+    batch = np.concatenate([rng.permutation(n) for n in lengths])
+    df = pd.DataFrame(
+        {
+            "cluster_id": cluster_ids,
+            "log_count": rng.poisson(rng.gamma(2.0, 50.0, len(cluster_ids))),
+            "batch_timestamp": pd.Timestamp("2026-01-01", tz="UTC")
+            + pd.to_timedelta(batch * 300, unit="s"),
+        }
+    )
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def best_of(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clusters", default="100,10000,100000")
+    parser.add_argument("--shapes", default="window,training")
+    parser.add_argument("--window-size", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    detector = VolumeAnomalyDetector(window_size=args.window_size)
+    print(f"{'clusters':>9} {'shape':<9} {'rows':>9} {'groupby':>10} {'vectorized':>11} {'speedup':>8}")
+    for n_clusters in [int(n) for n in args.clusters.split(",")]:
+        for shape in args.shapes.split(","):
+            df = make_history(n_clusters, shape, args.window_size)
+            ref_secs, (ref_X, ref_ids) = best_of(
+                lambda: reference_extract_features(df, args.window_size), args.repeats
+            )
+            vec_secs, (X, ids) = best_of(lambda: detector._extract_features(df), args.repeats)
+
+            if not (np.array_equal(ref_X, X) and list(ref_ids) == list(ids)):
+                raise SystemExit(f"Feature mismatch for {n_clusters} clusters ({shape})")
+            print(
+                f"{n_clusters:>9} {shape:<9} {len(df):>9} {ref_secs * 1000:>8.1f}ms "
+                f"{vec_secs * 1000:>9.1f}ms {ref_secs / vec_secs:>7.0f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Synthetic log generator for benchmarks: a fixed set of message templates with
+variable fields (hosts, users, ids, durations), so logs repeat the way real
+traffic does, with a configurable level mix, sources and app_ids.
+Can also seed the `logs` table of a local database.
+
+Usage:
+    python scripts/benchmarks/synthetic_logs.py --logs 5 --print
+    python scripts/benchmarks/synthetic_logs.py --logs 50000 --database-url postgresql+psycopg2://postgres@localhost/logstream
+"""
+
+import argparse
+import csv
+import io
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+# (source, level, template); fields in braces are filled per log
+TEMPLATES = [
+    ("api-gateway", "error", "Connection to upstream {host} timed out after {ms}ms"),
+    ("api-gateway", "warning", "Upstream {host} responded slowly ({ms}ms) for {path}"),
+    ("api-gateway", "error", "Circuit breaker open for {host} after {n} failures"),
+    ("auth-service", "error", "User {user} failed authentication from {ip}"),
+    ("auth-service", "warning", "Token for user {user} expires in {n} seconds"),
+    ("auth-service", "error", "Invalid signature on JWT issued to {user}"),
+    ("payment-service", "error", "Payment {txn} declined with code {code}"),
+    ("payment-service", "error", "Refund {txn} failed: provider returned HTTP {status}"),
+    ("payment-service", "warning", "Retrying charge {txn} (attempt {n})"),
+    ("db-proxy", "warning", "Slow query detected on table {table} ({ms}ms)"),
+    ("db-proxy", "error", "Deadlock detected on table {table}, transaction {txn} rolled back"),
+    ("db-proxy", "error", "Connection pool exhausted ({n} active connections)"),
+    ("worker", "error", "Worker {n} crashed while processing job {txn}"),
+    ("worker", "warning", "Job {txn} exceeded soft time limit of {ms}ms"),
+    ("worker", "error", "Out of memory while processing batch {n} of job {txn}"),
+    ("notification", "error", "Failed to deliver email to {user}@example.com: {code}"),
+    ("notification", "warning", "SMS provider rate limit reached, queue depth {n}"),
+    ("storage", "error", "Disk usage on {host} at {pct} percent"),
+    ("storage", "error", "Object {txn} missing from bucket {table}"),
+    ("storage", "warning", "Replication lag on {host} is {ms}ms"),
+]
+
+TABLES = ["orders", "users", "payments", "sessions", "invoices", "events"]
+PATHS = ["/v1/orders", "/v1/users/me", "/v2/checkout", "/health", "/v1/search"]
+CODES = ["E_TIMEOUT", "E_LIMIT", "E_FRAUD", "E_CARD", "E_NETWORK"]
+
+
+def _fields(rng):
+    return {
+        "host": f"db-{rng.randint(1, 40)}.internal",
+        "ms": rng.randint(100, 30000),
+        "n": rng.randint(1, 500),
+        "user": f"user{rng.randint(1, 5000)}",
+        "ip": f"10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+        "txn": f"{rng.getrandbits(40):x}",
+        "code": rng.choice(CODES),
+        "status": rng.choice([500, 502, 503, 504]),
+        "table": rng.choice(TABLES),
+        "path": rng.choice(PATHS),
+        "pct": rng.randint(80, 100),
+    }
+
+
+def generate_logs(
+    n,
+    error_ratio=0.6,
+    info_ratio=0.0,
+    n_sources=None,
+    n_apps=5,
+    n_templates=None,
+    start_log_id=1,
+    start_time=None,
+    seed=0,
+):
+    """
+    Yields n log rows as dicts with the columns of the `logs` table
+    (log_id, app_id, level, source, message, parsed_data, timestamp).
+    :param error_ratio: Share of error (vs warning) logs among error/warning logs.
+    :param info_ratio: Share of "info" logs, which the pipeline skips.
+    :param n_sources: Only use the first n sources of TEMPLATES.
+    :param n_templates: Only use the first n templates (after the source filter).
+    """
+    rng = random.Random(seed)
+    sources = list(dict.fromkeys(source for source, _, _ in TEMPLATES))[:n_sources]
+    templates = [t for t in TEMPLATES if t[0] in sources][:n_templates]
+    by_level = {
+        level: [t for t in templates if t[1] == level] or templates for level in ("error", "warning")
+    }
+    # Zipf-like popularity: a few templates dominate, like real traffic
+    weights = {level: [1.0 / (i + 1) for i in range(len(ts))] for level, ts in by_level.items()}
+
+    timestamp = start_time or datetime.now(timezone.utc) - timedelta(seconds=n)
+    for i in range(n):
+        if rng.random() < info_ratio:
+            level = "info"
+            source = rng.choice(sources)
+            template = "Request {path} served in {ms}ms"
+        else:
+            level = "error" if rng.random() < error_ratio else "warning"
+            source, _, template = rng.choices(by_level[level], weights=weights[level])[0]
+        fields = _fields(rng)
+        yield {
+            "log_id": start_log_id + i,
+            "app_id": rng.randint(1, n_apps),
+            "level": level,
+            "source": source,
+            "message": template.format(**fields),
+            "parsed_data": {"host": fields["host"], "request_id": fields["txn"]},
+            "timestamp": timestamp + timedelta(seconds=i),
+        }
+
+
+def insert_logs(engine, rows, chunk_size=50000):
+    """COPYs generated rows into `logs`. Returns the number of rows written."""
+    columns = ("log_id", "app_id", "level", "source", "message", "parsed_data", "timestamp")
+    copy_sql = f"COPY logs ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    total = 0
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        pending = 0
+        for row in rows:
+            writer.writerow(
+                [json.dumps(row[c]) if c == "parsed_data" else row[c] for c in columns]
+            )
+            pending += 1
+            if pending == chunk_size:
+                buf.seek(0)
+                cursor.copy_expert(copy_sql, buf)
+                total += pending
+                buf, pending = io.StringIO(), 0
+                writer = csv.writer(buf)
+        if pending:
+            buf.seek(0)
+            cursor.copy_expert(copy_sql, buf)
+            total += pending
+        conn.commit()
+    finally:
+        conn.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logs", type=int, default=10000)
+    parser.add_argument("--error-ratio", type=float, default=0.6)
+    parser.add_argument("--info-ratio", type=float, default=0.0)
+    parser.add_argument("--apps", type=int, default=5)
+    parser.add_argument("--start-log-id", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", default=None, help="Insert into this database's logs table")
+    parser.add_argument("--print", action="store_true", help="Print the logs as JSON lines")
+    args = parser.parse_args()
+
+    rows = generate_logs(
+        args.logs,
+        error_ratio=args.error_ratio,
+        info_ratio=args.info_ratio,
+        n_apps=args.apps,
+        start_log_id=args.start_log_id,
+        seed=args.seed,
+    )
+    if args.database_url:
+        from sqlalchemy import create_engine
+
+        written = insert_logs(create_engine(args.database_url), rows)
+        print(f"Inserted {written} synthetic logs")
+    elif args.print:
+        for row in rows:
+            print(json.dumps(row, default=str))
+    else:
+        parser.error("pass --database-url or --print")
+
+
+if __name__ == "__main__":
+    main()
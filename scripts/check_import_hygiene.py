@@ -0,0 +1,59 @@
+"""
+Fails (exit 1) if importing a DB-only / incident-detection module pulls in
+torch or sentence-transformers. Each module is imported in a fresh
+interpreter so results don't depend on import order.
+
+Usage:
+    python scripts/check_import_hygiene.py
+"""
+
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# module -> top-level packages it must not import
+CHECKS = {
+    "src.db": ("torch", "sentence_transformers"),
+    "src.ml": ("torch", "sentence_transformers", "river", "sklearn"),
+    "src.ml.volume_analyzer": ("torch", "sentence_transformers"),
+    "src.ml.volume_window": ("torch", "sentence_transformers", "river", "sklearn"),
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+secs = time.perf_counter() - start
+leaked = ",".join(name for name in {forbidden!r} if name in sys.modules)
+print(f"{{secs}}|{{leaked}}")
+"""
+
+
+def check(module, forbidden):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, forbidden=forbidden)],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(f"FAIL {module}: import raised\n{result.stderr}")
+        return False
+
+    secs, leaked = result.stdout.strip().splitlines()[-1].split("|")
+    if leaked:
+        print(f"FAIL {module}: imported {leaked} ({float(secs):.2f}s)")
+        return False
+    print(f"ok   {module} ({float(secs):.2f}s)")
+    return True
+
+
+def main():
+    results = [check(module, forbidden) for module, forbidden in CHECKS.items()]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
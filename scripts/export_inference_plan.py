@@ -0,0 +1,84 @@
+"""
+Compiles the river pipeline + DenStream in a model directory into an
+inference plan and writes the model snapshot (plan + centroid arrays +
+manifest.json) that run_incremental_batch.py loads instead of the pickles.
+Models trained after this change get a snapshot automatically; run this once
+for an existing production directory.
+
+With --check N, N synthetic rows (random embeddings + known categories) are
+predicted by both the plan and river, and the script fails on any mismatch.
+
+Usage:
+    python scripts/export_inference_plan.py [--models scripts/models/production] [--check 500]
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.append(sys.path[0] + "/..")
+
+from src.ml import (
+    SemanticVectorEngine,
+    build_feature_dict,
+    compile_inference_plan,
+    load_model,
+    save_snapshot,
+)
+from src.ml.inference_plan import CATEGORICAL_FEATURES
+
+
+def check_against_river(plan, model, pipeline, n_rows, seed=42):
+    """Number of rows where the plan and river disagree."""
+    rng = np.random.default_rng(seed)
+    pick = random.Random(seed)
+    known = {
+        feature: [c[len(feature) + 1 :] for c in plan.categorical_columns if c.startswith(feature + "_")]
+        or ["unknown"]
+        for feature in CATEGORICAL_FEATURES
+    }
+
+    embeddings = rng.normal(0, 0.05, (n_rows, len(plan.means))).astype(np.float32)
+    levels = [pick.choice(known["level"]) for _ in range(n_rows)]
+    sources = [pick.choice(known["source"]) for _ in range(n_rows)]
+    sem_ids = [pick.choice(known["semantic_group"]) for _ in range(n_rows)]
+
+    predicted = plan.predict(embeddings, levels, sources, sem_ids)
+    # Fresh copy: river's predict_one re-clusters on every call
+    frozen = copy.deepcopy(model)
+    mismatches = 0
+    for i in range(n_rows):
+        feats = build_feature_dict(levels[i], sources[i], embeddings[i], sem_ids[i])
+        mismatches += int(frozen.predict_one(pipeline.transform_one(feats)) != predicted[i])
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--models", default="scripts/models/production")
+    parser.add_argument("--check", type=int, default=0)
+    parser.add_argument("--centroid-dtype", default="float32", choices=["float32", "float16"])
+    args = parser.parse_args()
+
+    model, pipeline = load_model(directory=args.models)
+    if model is None:
+        sys.exit(1)
+
+    plan = compile_inference_plan(model, pipeline)
+    if args.check:
+        mismatches = check_against_river(plan, model, pipeline, args.check)
+        print(f"Plan vs river: {mismatches}/{args.check} mismatches")
+        if mismatches:
+            sys.exit(1)
+
+    vector_engine = SemanticVectorEngine(storage_dtype=args.centroid_dtype)
+    vector_engine.load(os.path.join(args.models, "vector_centroids.pkl"))
+    save_snapshot(args.models, plan, vector_engine)
+
+
+if __name__ == "__main__":
+    main()
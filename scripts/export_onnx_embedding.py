@@ -0,0 +1,29 @@
+"""
+Exports all-MiniLM-L6-v2 to ONNX (fp32 + dynamically quantised int8) for the
+"onnx" / "onnx-int8" embedding backends. Run once where the model can be
+downloaded, then ship the output directory with the image.
+
+Usage:
+    python scripts/export_onnx_embedding.py [--output scripts/models/onnx] [--no-quantize]
+"""
+
+import argparse
+import sys
+
+sys.path.append(sys.path[0] + "/..")
+
+from src.ml.embedding_backends import DEFAULT_MODEL, ONNX_DIR, export_onnx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--output", default=ONNX_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    export_onnx(model_name=args.model, output_dir=args.output, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
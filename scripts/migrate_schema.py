@@ -0,0 +1,82 @@
+"""
+One-off schema migration for the upserts in src/db. The startup check
+(apply_migrations) only reports these; they rewrite existing rows, so run this
+once per database after reviewing what it reports.
+
+  log_patterns: deletes the duplicate rows per cluster_id that the old
+                insert-only code left behind (keeps the newest), then adds
+                UNIQUE (cluster_id)
+  incidents:    marks all but the oldest OPEN/NEW incident of a cluster
+                RESOLVED (left by the old check-then-insert code), then
+                creates the partial unique index incidents_active_cluster_key
+
+Without --apply it only prints what would change.
+
+Usage:
+    python scripts/migrate_schema.py [--apply]
+"""
+
+import argparse
+import sys
+
+from sqlalchemy import text
+
+sys.path.append(sys.path[0] + "/..")
+
+from src.db import get_db_engine
+from src.db.migrations import (
+    INCIDENTS_ACTIVE_DEDUPE_SQL,
+    INCIDENTS_ACTIVE_DUPLICATES_SQL,
+    INCIDENTS_ACTIVE_UNIQUE_SQL,
+    LOG_PATTERNS_DEDUPE_SQL,
+    LOG_PATTERNS_DUPLICATES_SQL,
+    LOG_PATTERNS_UNIQUE_SQL,
+    MIGRATION_LOCK_ID,
+    _has_unique_index,
+)
+
+
+def migrate_log_patterns(conn, apply):
+    if _has_unique_index(conn, "log_patterns", "cluster_id"):
+        print("log_patterns: UNIQUE (cluster_id) already present")
+        return
+    duplicates = conn.execute(text(LOG_PATTERNS_DUPLICATES_SQL)).scalar()
+    print(f"log_patterns: {duplicates} duplicate rows to delete, then add UNIQUE (cluster_id)")
+    if apply:
+        conn.execute(text(LOG_PATTERNS_DEDUPE_SQL))
+        conn.execute(text(LOG_PATTERNS_UNIQUE_SQL))
+        print("log_patterns: done")
+
+
+def migrate_incidents(conn, apply):
+    if _has_unique_index(conn, "incidents", "cluster_id", partial=True):
+        print("incidents: incidents_active_cluster_key already present")
+        return
+    duplicates = conn.execute(text(INCIDENTS_ACTIVE_DUPLICATES_SQL)).scalar()
+    print(f"incidents: {duplicates} duplicate active incidents to resolve, then create incidents_active_cluster_key")
+    if apply:
+        conn.execute(text(INCIDENTS_ACTIVE_DEDUPE_SQL))
+        conn.execute(text(INCIDENTS_ACTIVE_UNIQUE_SQL))
+        print("incidents: done")
+
+
+MIGRATIONS = [migrate_log_patterns, migrate_incidents]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--apply", action="store_true", help="make the changes (default: report only)")
+    args = parser.parse_args()
+
+    engine = get_db_engine()
+    for migration in MIGRATIONS:
+        # One transaction per table: a failure rolls back that table only
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            migration(conn, args.apply)
+    if not args.apply:
+        print("Report only; re-run with --apply to make these changes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Cold-start breakdown of an incremental batch task: import and model-load
+cost of each step, in the order run_incremental_batch.py pays them.
+Run it in a fresh interpreter (e.g. inside the container image) so the
+numbers match a new Fargate task.
+
+Usage:
+    python scripts/profile_startup.py [--models scripts/models/production] [--skip-embedding]
+
+For a per-module import tree use: python -X importtime scripts/profile_startup.py
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+sys.path.append(sys.path[0] + "/..")
+
+HEAVY_MODULES = ("pandas", "sklearn", "river", "torch", "sentence_transformers")
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def run_steps(steps):
+    total = 0.0
+    print(f"{'step':<38}{'secs':>8}{'total':>8}  heavy modules loaded")
+    for name, fn in steps:
+        start = time.perf_counter()
+        fn()
+        secs = time.perf_counter() - start
+        total += secs
+        print(f"{name:<38}{secs:8.2f}{total:8.2f}  {','.join(loaded_heavy_modules()) or '-'}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--models", default="scripts/models/production")
+    parser.add_argument("--skip-embedding", action="store_true")
+    args = parser.parse_args()
+
+    state = {}
+
+    def load_river():
+        from src.ml import load_model
+
+        state["model"], state["pipeline"] = load_model(directory=args.models)
+
+    def load_centroids():
+        from src.ml import SemanticVectorEngine
+
+        SemanticVectorEngine().load(os.path.join(args.models, "vector_centroids.pkl"))
+
+    def load_templates():
+        from src.ml import TEMPLATE_FILE, TemplateMiner
+
+        TemplateMiner.load(os.path.join(args.models, TEMPLATE_FILE))
+
+    def load_volume_model():
+        from src.ml import VolumeAnomalyDetector
+
+        VolumeAnomalyDetector().load(args.models)
+
+    def load_embedding_model():
+        from src.ml import get_embedding_backend
+
+        get_embedding_backend().encode(["load"])
+
+    def warm_encode():
+        from src.ml import get_text_embeddings
+
+        get_text_embeddings(["warm-up log line"])
+
+    steps = [
+        ("import src.db", lambda: importlib.import_module("src.db")),
+        ("import src.ml", lambda: importlib.import_module("src.ml")),
+        ("import src.ml.volume_analyzer", lambda: importlib.import_module("src.ml.volume_analyzer")),
+        ("load river model + pipeline", load_river),
+        ("load semantic centroids", load_centroids),
+        ("load template miner", load_templates),
+        ("load volume model", load_volume_model),
+    ]
+    if not args.skip_embedding:
+        # ONNX backends never import torch, so don't charge them for it
+        if not os.environ.get("EMBEDDING_BACKEND", "").startswith("onnx"):
+            steps.append(
+                ("import sentence_transformers (torch)", lambda: importlib.import_module("sentence_transformers"))
+            )
+        steps += [
+            ("load embedding model + first encode", load_embedding_model),
+            ("second encode (warm)", warm_encode),
+        ]
+
+    print("--- STARTUP BREAKDOWN ---")
+    total = run_steps(steps)
+    print(f"Total cold start: {total:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Real-time classification service: POST /classify with one log or a list of
+logs, get semantic_group and cluster_id back. Uses the production models and
+the same environment variables as run_incremental_batch.py, plus:
+    API_HOST / API_PORT        (default 0.0.0.0:8000)
+    API_MAX_BATCH_SIZE         (default 64; logs per embedding forward pass)
+    API_MAX_WAIT_MS            (default 10; how long a micro-batch waits to fill up)
+    API_MAX_REQUEST_LOGS       (default 256)
+    API_MAX_NEW_GROUPS         (default 10000; in-process semantic groups kept
+                                before starting over from the snapshot; 0 = never)
+
+Usage:
+    python scripts/run_api.py
+    curl -X POST localhost:8000/classify -H 'Content-Type: application/json' \
+         -d '{"message": "Connection refused", "level": "error", "source": "db"}'
+"""
+
+import os
+import sys
+
+sys.path.append(sys.path[0] + "/..")
+
+import uvicorn
+
+from run_incremental_batch import PRODUCTION_DIR, runner_settings
+from src.api import create_app
+from src.batch_runner import BatchRunner
+from src.ml.pipeline import get_embedding_backend
+
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", "8000"))
+API_MAX_BATCH_SIZE = int(os.environ.get("API_MAX_BATCH_SIZE", "64"))
+API_MAX_WAIT_MS = float(os.environ.get("API_MAX_WAIT_MS", "10"))
+API_MAX_REQUEST_LOGS = int(os.environ.get("API_MAX_REQUEST_LOGS", "256"))
+API_MAX_NEW_GROUPS = int(os.environ.get("API_MAX_NEW_GROUPS", "10000")) or None
+
+
+def main():
+    settings = runner_settings()
+    # Requests are small; a ShardPool per micro-batch would cost more than it saves
+    settings["workers"] = 1
+    settings["metrics_dir"] = None
+    runner = BatchRunner(None, PRODUCTION_DIR, watch=True, **settings)
+    if not runner.loaded:
+        print(f"No model in {PRODUCTION_DIR}; requests will return 503 until one is promoted.")
+    # Load the embedding model now rather than on the first request
+    get_embedding_backend().encode(["warm up"])
+
+    app = create_app(
+        runner,
+        max_batch_size=API_MAX_BATCH_SIZE,
+        max_wait_ms=API_MAX_WAIT_MS,
+        max_request_logs=API_MAX_REQUEST_LOGS,
+        max_new_groups=API_MAX_NEW_GROUPS,
+    )
+    uvicorn.run(app, host=API_HOST, port=API_PORT, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,86 @@
-from sqlalchemy import text
+import time
+
+SCRIPT_START = time.perf_counter()
+
 import sys
 import os
-import time
 
 # 1. Force logs to flush immediately (fixes the "missing logs" issue)
 sys.stdout.reconfigure(line_buffering=True)
 
 sys.path.append(sys.path[0] + "/..")
 
-from src.db import (
-    detect_and_create_incidents,
-    get_db_engine,
-    fetch_logs_batch,
-    save_embedding,
-    save_pattern,
-)
-from src.ml import (
-    SemanticVectorEngine,
-    get_text_embedding,
-    build_feature_dict,
-    load_model,
-)
+from src.batch_runner import BatchRunner
+from src.db import get_db_engine, mark_batch_completed
 
 PRODUCTION_DIR = "scripts/models/production"
 
+# Number of texts per embedding forward pass
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+
+# Centroid search backend: "exact", "ivf" or "lsh" (see src/ml/centroid_index.py)
+CENTROID_INDEX = os.environ.get("CENTROID_INDEX", "exact")
+
+# Centroid capacity (see SemanticVectorEngine): MAX_CENTROIDS=0 keeps every group.
+# Half-life is in logs; CENTROID_UPDATE_RATE > 0 lets centroids drift (and merge).
+# Each batch starts from the production snapshot, so these bound one batch only.
+MAX_CENTROIDS = int(os.environ.get("MAX_CENTROIDS", "0")) or None
+CENTROID_HALF_LIFE = float(os.environ.get("CENTROID_HALF_LIFE", "0")) or None
+CENTROID_UPDATE_RATE = float(os.environ.get("CENTROID_UPDATE_RATE", "0"))
+
+# Persistent embedding cache; set EMBEDDING_CACHE_DIR="" to keep it in memory only
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "scripts/models/embedding_cache")
+
+# Worker processes that embed + search shards of each chunk (1 = in-process).
+# Needs fixed centroids, i.e. MAX_CENTROIDS and CENTROID_UPDATE_RATE unset.
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+# Rows per server-side cursor fetch (= logs classified per chunk)
+FETCH_SIZE = int(os.environ.get("FETCH_SIZE", "2000"))
+
+# Chunks buffered between pipeline stages (fetch/embed/classify/write);
+# 0 runs the stages one after another in the main thread
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "2"))
+
+# Rows per COPY + commit when writing results back
+DB_WRITE_CHUNK_SIZE = int(os.environ.get("DB_WRITE_CHUNK_SIZE", "5000"))
+
+# Per-batch stage timings and counters (src/metrics.py): batch_<id>.json plus a
+# Prometheus textfile (logstream.prom) are written here. Unset = disabled.
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+
+# Predict with the compiled NumPy plan (src/ml/inference_plan.py) instead of
+# river's per-log transform_one/predict_one. Set INFERENCE_PLAN=0 to fall back.
+USE_INFERENCE_PLAN = os.environ.get("INFERENCE_PLAN", "1") == "1"
+
+# Volume anomaly detection: "isolation_forest" (volume_model.pkl, scored on the
+# last 5 batches per cluster) or "ewma" (streaming per-cluster mean/variance,
+# updated every batch; see EWMAVolumeDetector)
+VOLUME_DETECTOR = os.environ.get("VOLUME_DETECTOR", "isolation_forest")
+
+
+def runner_settings():
+    """BatchRunner keyword args from the environment (shared with run_worker_daemon.py)."""
+    return {
+        "engine_params": {
+            "minkowski_p": 1.5,
+            "threshold": 0.35,
+            "index": CENTROID_INDEX,
+            "max_centroids": MAX_CENTROIDS,
+            "decay_half_life": CENTROID_HALF_LIFE,
+            "update_rate": CENTROID_UPDATE_RATE,
+        },
+        "use_inference_plan": USE_INFERENCE_PLAN,
+        "embed_batch_size": EMBED_BATCH_SIZE,
+        "fetch_size": FETCH_SIZE,
+        "pipeline_queue_size": PIPELINE_QUEUE_SIZE,
+        "db_write_chunk_size": DB_WRITE_CHUNK_SIZE,
+        "workers": WORKERS,
+        "embedding_cache_dir": EMBEDDING_CACHE_DIR,
+        "metrics_dir": METRICS_DIR,
+        "volume_detector": VOLUME_DETECTOR,
+    }
+
 
 def main():
     # READ ENV VARIABLES SENT BY LAMBDA
@@ -40,74 +97,22 @@ def main():
         return
 
     # 1. LOAD MODEL
-    model, pipeline = load_model(directory=PRODUCTION_DIR)
-    if model is None:
-        print("Waiting for initial training to complete...")
-        return
-
-    # Load Vector Engine
-    vector_engine = SemanticVectorEngine(minkowski_p=1.5, threshold=0.35)
-    vector_path = os.path.join(PRODUCTION_DIR, "vector_centroids.pkl")
-    vector_engine.load(vector_path)
-
     engine = get_db_engine()
-
-    # 2. PROCESS SPECIFIC BATCH (The Logic Change)
-
-    print(f"Fetching logs between ID {start_log_id} and {end_log_id}...")
-
-    query = f"""
-        SELECT * FROM logs 
-        WHERE log_id BETWEEN {start_log_id} AND {end_log_id}
-        AND level IN ('error','warning')
-        AND cluster_id IS NULL 
-        ORDER BY log_id ASC
-    """
-
-    df_new = fetch_logs_batch(engine, query)
-
-    if df_new.empty:
-        print(f"Batch {batch_id} is empty (No error/warning logs found in range).")
+    runner = BatchRunner(engine, PRODUCTION_DIR, **runner_settings())
+    if not runner.loaded:
         return
+    # The embedding model itself is loaded lazily on the first chunk
+    print(f"Startup finished in {time.perf_counter() - SCRIPT_START:.2f}s")
 
-    batch_size = len(df_new)
-    print(f"Classifying {batch_size} logs for Batch {batch_id}...")
-
-    for _, log in df_new.iterrows():
-        full_text = f"{log['message']}. Parsed: {log['parsed_data']}"
-        embedding = get_text_embedding(full_text)
-        sem_id = vector_engine.get_semantic_group(embedding, log["log_id"])
-        feats = build_feature_dict(log["level"], log["source"], embedding, sem_id)
-
-        proc_feats = pipeline.transform_one(feats)
-        cluster_id = model.predict_one(proc_feats)
-
-        save_embedding(
-            engine,
-            log["log_id"],
-            log["app_id"],
-            embedding,
-            cluster_id,
-            log["level"],
-            log["source"],
-        )
-
-    save_pattern(engine=engine)
-
-    detect_and_create_incidents(
-        engine=engine, start_log_id=int(start_log_id), end_log_id=int(end_log_id)
-    )
+    # 2. PROCESS SPECIFIC BATCH (The Logic Change)
+    # Logs are streamed in chunks through a server-side cursor and flow through
+    # the fetch -> embed -> classify -> write pipeline (src/batch_runner.py).
+    runner.run_batch(batch_id, start_log_id, end_log_id)
 
     # 3. CRITICAL: Mark Batch as COMPLETED in DB
     # The Lambda launched us and forgot about us. WE must close the loop.
-    with engine.connect() as conn:
-        print(f"Marking Batch {batch_id} as COMPLETED in Database...")
-        conn.execute(
-            text(
-                f"UPDATE batch_order SET status='COMPLETED', last_processed_timestamp=NOW() WHERE batchid={batch_id}"
-            )
-        )
-        conn.commit()
+    # An empty range is completed too, as run_worker_daemon.py does.
+    mark_batch_completed(engine, batch_id)
 
     print(f" Batch {batch_id} execution finished successfully.")
 
@@ -1,9 +1,8 @@
+import numpy as np
 import pandas as pd
 import sys
 import os
 import shutil
-import csv
-import json
 import torch
 
 sys.stdout.reconfigure(line_buffering=True)
@@ -11,29 +10,66 @@ sys.stdout.reconfigure(line_buffering=True)
 sys.path.append(sys.path[0] + "/..")
 
 from src.db import (
+    LogChunk,
+    apply_migrations,
     get_db_engine,
-    fetch_logs_batch,
-    save_embedding,
+    stream_logs,
+    save_embeddings_bulk,
     save_pattern,
 )
 from src.ml import (
     SemanticVectorEngine,
+    TemplateMiner,
+    TEMPLATE_FILE,
+    build_log_text,
+    embed_and_group,
     build_feature_dict,
     create_streaming_pipeline,
     create_new_model,
     save_model,
+    save_snapshot,
+    promote_snapshot,
+    compile_inference_plan,
     VolumeAnomalyDetector,
+    TrainingStaging,
 )
 from sentence_transformers import SentenceTransformer
-from sqlalchemy import text
 
 # CONSTANTS FOR BLUE/GREEN DEPLOYMENT
 PRODUCTION_DIR = "scripts/models/production"
 STAGING_DIR = "models/staging"
 
-# Temporary CSV file written during the training loop.
-# Acts as a crash-resilient staging buffer before the final DB insert.
-STAGING_CSV = "staging/embeddings_staging.csv"
+# Crash-resilient staging buffer for embeddings + semantic groups (memory-mapped
+# .npy columns and a checkpoint, see src/ml/training_staging.py). A crashed run
+# resumes from the last committed chunk instead of re-embedding everything.
+STAGING_EMBEDDINGS_DIR = "staging/embeddings"
+
+# Logs embedded + grouped per staging commit
+TRAINING_CHUNK_SIZE = int(os.environ.get("TRAINING_CHUNK_SIZE", "1000"))
+
+# Number of logs the base model is trained on
+TRAINING_LIMIT = int(os.environ.get("TRAINING_LIMIT", "5000"))
+
+# Centroid search backend: "exact", "ivf" or "lsh" (see src/ml/centroid_index.py)
+CENTROID_INDEX = os.environ.get("CENTROID_INDEX", "exact")
+
+# Centroid capacity (see SemanticVectorEngine): MAX_CENTROIDS=0 keeps every group.
+# Half-life is in logs; CENTROID_UPDATE_RATE > 0 lets centroids drift (and merge).
+MAX_CENTROIDS = int(os.environ.get("MAX_CENTROIDS", "0")) or None
+CENTROID_HALF_LIFE = float(os.environ.get("CENTROID_HALF_LIFE", "0")) or None
+CENTROID_UPDATE_RATE = float(os.environ.get("CENTROID_UPDATE_RATE", "0"))
+
+# Centroid storage in the snapshot: "float32" or "float16" (half the memory and
+# file size; distances are still computed in float32)
+CENTROID_DTYPE = os.environ.get("CENTROID_DTYPE", "float32")
+
+# Opt-in (TEMPLATE_MINING=1): mine log templates before embedding (embeddings +
+# semantic groups per template). The template tree is saved with the models;
+# incremental runs follow whatever the live model was trained with.
+TEMPLATE_MINING = os.environ.get("TEMPLATE_MINING", "0") == "1"
+
+# Rows per COPY + commit when writing results back
+DB_WRITE_CHUNK_SIZE = int(os.environ.get("DB_WRITE_CHUNK_SIZE", "5000"))
 
 # ── GPU / CPU Auto-Detection ──────────────────────────────────────────────────
 # Uses your NVIDIA RTX 3050 (CUDA) when running locally.
@@ -82,117 +118,94 @@ def main():
     os.makedirs(STAGING_DIR)
 
     engine = get_db_engine()
+    apply_migrations(engine)
 
-    # Fetch large dataset for training
-    query = "SELECT * FROM logs WHERE level IN ('warning','error') ORDER BY log_id ASC LIMIT 5000;"
-    df_logs = fetch_logs_batch(engine, query)
+    # Fetch large dataset for training (streamed in chunks, only the columns we use)
+    logs = LogChunk.concat(
+        stream_logs(engine, unclassified_only=False, limit=TRAINING_LIMIT)
+    )
 
-    if df_logs.empty:
+    if len(logs) == 0:
         return
 
-    # ── OPTIMISATION 1: Pre-compute ALL embeddings in a single GPU-batched call ──
-    # Instead of calling encode() 5,000 times inside the loop, we build the full
-    # text list up front and let the GPU crunch them all at once.
+    engine_settings = {
+        "minkowski_p": 1.5,
+        "threshold": 0.35,
+        "index": CENTROID_INDEX,
+        "storage_dtype": CENTROID_DTYPE,
+        "max_centroids": MAX_CENTROIDS,
+        "decay_half_life": CENTROID_HALF_LIFE,
+        "update_rate": CENTROID_UPDATE_RATE,
+    }
+    vector_engine = SemanticVectorEngine(**engine_settings)
+    template_miner = TemplateMiner() if TEMPLATE_MINING else None
+
+    # ── OPTIMISATION 1: Embed in large GPU-batched chunks ──────────────────────────
+    # Instead of calling encode() 5,000 times inside the loop, each chunk of texts
+    # goes to the GPU in one call. With template mining, only one text per
+    # template is encoded. Semantic grouping does not depend on the river model,
+    # so it is resolved per chunk here too with the vectorized centroid search.
+    # Every chunk is committed to the staging buffer with the engine/miner state,
+    # so a rerun after a crash picks up at the first uncommitted chunk.
+    staging = TrainingStaging(
+        STAGING_EMBEDDINGS_DIR,
+        logs.log_ids,
+        dim=embedding_model.get_sentence_embedding_dimension(),
+        settings={"template_mining": TEMPLATE_MINING, **engine_settings},
+    )
+    template_miner = staging.restore(vector_engine, template_miner)
+
     print("Pre-computing embeddings for all logs (GPU-batched)...")
     all_texts = [
-        f"{row['message']}. Parsed: {row['parsed_data']}"
-        for _, row in df_logs.iterrows()
+        build_log_text(message, parsed_data)
+        for message, parsed_data in zip(logs.messages, logs.parsed_data)
     ]
-    all_embeddings = batch_encode_texts(all_texts, batch_size=64)
+    log_ids = logs.log_ids.tolist()
+    for start in range(staging.committed, len(logs), TRAINING_CHUNK_SIZE):
+        end = min(start + TRAINING_CHUNK_SIZE, len(logs))
+        embeddings, sem_ids, template_ids = embed_and_group(
+            all_texts[start:end],
+            log_ids[start:end],
+            vector_engine,
+            template_miner=template_miner,
+            embed_fn=batch_encode_texts,
+        )
+        staging.commit(end, embeddings, sem_ids, template_ids, vector_engine, template_miner)
+
+    all_embeddings, all_sem_ids, all_template_ids = staging.columns()
 
     # 2. TRAIN NEW MODEL (isolated in memory/staging)
+    # The river model is cheap next to embedding and is retrained from the staged
+    # columns on every (resumed) run.
     print("Training Base Model...")
-    vector_engine = SemanticVectorEngine(minkowski_p=1.5, threshold=0.35)
     model = create_new_model()
     pipeline = create_streaming_pipeline()
-
-    # ── OPTIMISATION 2: Write each row to a CSV staging file during the loop ──────
-    # Instead of one DB transaction per log (5,000 round-trips), we stream rows
-    # to a local CSV file as the loop runs. If the script crashes mid-way, the
-    # file already has everything processed so far — nothing is lost.
-    os.makedirs(os.path.dirname(STAGING_CSV), exist_ok=True)
-    CSV_COLUMNS = ["log_id", "app_id", "embedding", "cluster_id", "level", "source"]
-
-    print(f"[CSV] Streaming rows to staging file: {STAGING_CSV}")
-    with open(STAGING_CSV, "w", newline="", encoding="utf-8") as csv_file:
-        writer = csv.DictWriter(csv_file, fieldnames=CSV_COLUMNS)
-        writer.writeheader()
-
-        for idx, (_, log) in enumerate(df_logs.iterrows()):
-            log_id = log["log_id"]
-            app_id = log["app_id"]
-            level = log["level"]
-            source = log["source"]
-
-            # Use the pre-computed embedding for this row
-            embedding = all_embeddings[idx]
-
-            sem_id = vector_engine.get_semantic_group(embedding, log_id)
-            feats = build_feature_dict(log["level"], log["source"], embedding, sem_id)
-
-            pipeline.learn_one(feats)
-            proc_feats = pipeline.transform_one(feats)
-            model.learn_one(proc_feats)
-            cluster_id = model.predict_one(proc_feats)
-
-            # Write this row to the CSV immediately (crash-safe)
-            writer.writerow(
-                {
-                    "log_id": log_id,
-                    "app_id": app_id,
-                    "embedding": json.dumps(
-                        embedding.tolist()
-                    ),  # store vector as JSON string
-                    "cluster_id": cluster_id,
-                    "level": level,
-                    "source": source,
-                }
-            )
-
-    print(f"[CSV] Finished writing staging file.")
-
-    # ── SINGLE BULK INSERT: read the CSV, one transaction, one round-trip ─────────
-    print(f"[DB] Reading staging file and bulk inserting into log_embeddings...")
-    df_staging = pd.read_csv(STAGING_CSV)
-
-    # Deserialise the embedding JSON strings back into Python lists
-    embedding_rows = [
-        {
-            "log_id": row["log_id"],
-            "app_id": row["app_id"],
-            "embedding": json.loads(row["embedding"]),
-            "cluster_id": row["cluster_id"],
-            "level": row["level"],
-            "source": row["source"],
-        }
-        for _, row in df_staging.iterrows()
-    ]
-    cluster_updates = [
-        {"log_id": row["log_id"], "cluster_id": row["cluster_id"]}
-        for _, row in df_staging.iterrows()
-    ]
-
-    insert_embeddings_sql = text(
-        """
-        INSERT INTO log_embeddings (log_id, app_id, embedding, cluster_id, level, source)
-        VALUES (:log_id, :app_id, :embedding, :cluster_id, :level, :source)
-        ON CONFLICT (log_id) DO NOTHING;
-    """
-    )
-    update_logs_sql = text(
-        """
-        UPDATE logs SET cluster_id = :cluster_id WHERE log_id = :log_id;
-    """
+    all_cluster_ids = []
+
+    for embedding, level, source, sem_id in zip(
+        all_embeddings, logs.levels, logs.sources, all_sem_ids
+    ):
+        feats = build_feature_dict(level, source, embedding, sem_id)
+
+        pipeline.learn_one(feats)
+        proc_feats = pipeline.transform_one(feats)
+        model.learn_one(proc_feats)
+        all_cluster_ids.append(model.predict_one(proc_feats))
+
+    # ── SINGLE BULK WRITE: COPY straight from the staged matrix, chunked commits ──
+    # Rows already written by a crashed run are skipped (ON CONFLICT DO NOTHING).
+    print(f"[DB] Bulk inserting {len(logs)} staged rows into log_embeddings...")
+    save_embeddings_bulk(
+        engine,
+        log_ids,
+        logs.app_ids,
+        all_embeddings,
+        all_cluster_ids,
+        logs.levels,
+        logs.sources,
+        chunk_size=DB_WRITE_CHUNK_SIZE,
     )
-
-    with engine.begin() as conn:
-        conn.execute(insert_embeddings_sql, embedding_rows)
-        conn.execute(update_logs_sql, cluster_updates)
-    print(f"[DB] Bulk insert complete ({len(embedding_rows)} rows).")
-
-    # Clean up the staging file now that it's safely in the DB
-    os.remove(STAGING_CSV)
-    print(f"[CSV] Staging file cleaned up.")
+    print(f"[DB] Bulk insert complete ({len(logs)} rows).")
 
     # Log the number of micro-clusters detected
     try:
@@ -202,20 +215,32 @@ def main():
     except:
         print("Initial streaming training complete.")
 
+    print(f"Semantic centroids: {vector_engine.stats()}")
+
     # 3. SAVE TO STAGING (The "Green" Copy)
     print(f"Training complete. Saving to STAGING ({STAGING_DIR})...")
     save_model(model, pipeline, directory=STAGING_DIR)
-
     vector_engine.save(os.path.join(STAGING_DIR, "vector_centroids.pkl"))
 
-    save_pattern(engine)
+    # Prediction-only snapshot (compiled plan + centroid arrays + manifest)
+    # that incremental runs load instead of the pickles
+    save_snapshot(STAGING_DIR, compile_inference_plan(model, pipeline), vector_engine)
+
+    pattern_templates = None
+    if template_miner is not None:
+        template_miner.save(os.path.join(STAGING_DIR, TEMPLATE_FILE))
+        pattern_templates = template_miner.cluster_templates(
+            all_cluster_ids, logs.sources, logs.levels, all_template_ids
+        )
+
+    save_pattern(engine, templates=pattern_templates)
 
     # 4. TRAIN VOLUME ANOMALY MODEL
     print("Training Volume Analysis Model...")
 
     # 4A. SIMULATE BATCHES
-    # We split the training data into small virtual batches, creating a "Time Series" history from our static data.
-    df_logs["virtual_batch_id"] = df_logs.index // 100
+    # We split the training data into small virtual batches (log_id / 100 in the
+    # query below), creating a "Time Series" history from our static data.
 
     # 4B. COUNT LOGS PER CLUSTER PER VIRTUAL BATCH
     # We query the DB to get the cluster_ids we just assigned during the loop above
@@ -243,19 +268,16 @@ def main():
     # 5. THE ATOMIC SWAP (Blue/Green Switch)
     print("Performing ZERO-DOWNTIME SWAP...")
 
-    # Strategy: Rename Production -> Backup, Rename Staging -> Production
+    # Strategy: Verify the staged snapshot, Rename Production -> Backup,
+    # Rename Staging -> Production. Long-lived workers see the new manifest.
     BACKUP_DIR = "models/backup_previous_version"
-
-    if os.path.exists(BACKUP_DIR):
-        shutil.rmtree(BACKUP_DIR)
-
-    if os.path.exists(PRODUCTION_DIR):
-        os.rename(PRODUCTION_DIR, BACKUP_DIR)  # Move old live model aside
-
-    os.rename(STAGING_DIR, PRODUCTION_DIR)  # Move new model to live slot
+    promote_snapshot(STAGING_DIR, PRODUCTION_DIR, BACKUP_DIR)
 
     print(f"✅ SWAP COMPLETE. New model is live in {PRODUCTION_DIR}")
 
+    # The staged embeddings are only needed until the new model is live
+    staging.cleanup()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,92 @@
+"""
+Long-running worker: loads the models once, then keeps claiming PENDING rows
+of batch_order (FOR UPDATE SKIP LOCKED, so several workers can run side by
+side), classifies each range exactly like run_incremental_batch.py and marks
+it COMPLETED. A newly promoted production snapshot is picked up between
+batches. Exits after IDLE_TIMEOUT_SECS without work, or after the current
+batch on SIGTERM / SIGINT.
+
+Configured with the same environment variables as run_incremental_batch.py, plus:
+    IDLE_TIMEOUT_SECS      (default 300; 0 = never exit when idle)
+    POLL_INTERVAL_SECS     (default 5)
+    CLAIM_STALE_AFTER_SECS (default 3600; PROCESSING claims older than this are taken over)
+
+Usage:
+    python scripts/run_worker_daemon.py
+"""
+
+import time
+
+SCRIPT_START = time.perf_counter()
+
+import os
+import signal
+import sys
+import traceback
+
+sys.stdout.reconfigure(line_buffering=True)
+
+sys.path.append(sys.path[0] + "/..")
+
+from run_incremental_batch import PRODUCTION_DIR, runner_settings
+from src.batch_runner import BatchRunner
+from src.db import (
+    claim_pending_batch,
+    get_db_engine,
+    mark_batch_completed,
+    mark_batch_failed,
+)
+
+IDLE_TIMEOUT_SECS = float(os.environ.get("IDLE_TIMEOUT_SECS", "300"))
+POLL_INTERVAL_SECS = float(os.environ.get("POLL_INTERVAL_SECS", "5"))
+CLAIM_STALE_AFTER_SECS = int(os.environ.get("CLAIM_STALE_AFTER_SECS", "3600"))
+
+_stopping = False
+
+
+def _request_stop(signum, frame):
+    global _stopping
+    _stopping = True
+    print(f"Received signal {signum}; stopping after the current batch.")
+
+
+def main():
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    print("--- STARTING WORKER DAEMON ---")
+    engine = get_db_engine()
+    runner = BatchRunner(engine, PRODUCTION_DIR, watch=True, **runner_settings())
+    print(f"Startup finished in {time.perf_counter() - SCRIPT_START:.2f}s (model version {runner.version})")
+
+    processed = 0
+    idle_since = time.monotonic()
+    while not _stopping:
+        runner.reload_if_changed()
+        claimed = claim_pending_batch(engine, stale_after=CLAIM_STALE_AFTER_SECS) if runner.loaded else None
+
+        if claimed is None:
+            if IDLE_TIMEOUT_SECS and time.monotonic() - idle_since >= IDLE_TIMEOUT_SECS:
+                print(f"Idle for {IDLE_TIMEOUT_SECS:.0f}s; shutting down.")
+                break
+            time.sleep(POLL_INTERVAL_SECS)
+            continue
+
+        batch_id, start_log_id, end_log_id = claimed
+        print(f"--- STARTING BATCH {batch_id} (Logs {start_log_id} - {end_log_id}) ---")
+        try:
+            runner.run_batch(batch_id, start_log_id, end_log_id)
+        except Exception:
+            traceback.print_exc()
+            mark_batch_failed(engine, batch_id)
+        else:
+            mark_batch_completed(engine, batch_id)
+            processed += 1
+            print(f" Batch {batch_id} execution finished successfully.")
+        idle_since = time.monotonic()
+
+    print(f"Worker daemon exiting after {processed} batches.")
+
+
+if __name__ == "__main__":
+    main()
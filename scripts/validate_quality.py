@@ -5,7 +5,7 @@ from sklearn.metrics import silhouette_score, homogeneity_score, completeness_sc
 
 sys.path.append(sys.path[0] + "/..")
 from src.db import get_db_engine, fetch_logs_batch
-from src.ml import get_text_embedding
+from src.ml import build_log_text, get_text_embeddings
 
 
 def calculate_purity(df):
@@ -41,13 +41,12 @@ def calculate_math_quality(df):
 
     # Assuming we fetch from log_embeddings for speed (if you populated it)
     # If not, we regenerate:
-    embeddings = []
     print("Generating embeddings for validation (this might take a moment)...")
-    for _, row in df.iterrows():
-        full_text = f"{row['message']}. Parsed: {row['parsed_data']}"
-        embeddings.append(get_text_embedding(full_text))
-
-    X = np.array(embeddings)
+    texts = [
+        build_log_text(message, parsed_data)
+        for message, parsed_data in zip(df["message"], df["parsed_data"])
+    ]
+    X = get_text_embeddings(texts)
 
     # Silhouette requires at least 2 clusters and > 1 sample
     if len(df["cluster_id"].unique()) < 2:
@@ -0,0 +1,128 @@
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, List, Optional, Union
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, field_validator
+
+from src.db.log_ops import LogChunk
+from src.micro_batcher import MicroBatcher
+
+
+class LogIn(BaseModel):
+    message: str
+    # The models were trained on the lowercase levels stored in the logs table
+    level: str = "error"
+    source: str = "unknown"
+    parsed_data: Any = None
+    app_id: Optional[str] = None
+    # Names a new semantic group if this log starts one; logs without an id
+    # get negative ids, which never collide with database log ids
+    log_id: Optional[int] = None
+
+    @field_validator("level")
+    @classmethod
+    def _lowercase_level(cls, level):
+        return level.lower()
+
+
+class ClassifiedLog(BaseModel):
+    semantic_group: str
+    cluster_id: Optional[int] = None
+
+
+class OnlineClassifier:
+    def __init__(self, runner, max_new_groups=10000):
+        """
+        Classifies API logs with a BatchRunner's models. New semantic groups
+        live in this process only (nothing is written to the database).
+        Only called from the MicroBatcher thread.
+        :param max_new_groups: Once this many groups were created on top of the
+                               production centroids, they are all dropped and
+                               the engine starts over from the snapshot (as a
+                               batch does), so memory stays bounded without
+                               evicting production groups. None = never.
+        """
+        self.runner = runner
+        self.max_new_groups = max_new_groups
+        self.resets = 0
+        self._reset_engine()
+        self._anonymous_ids = itertools.count(-1, -1)
+
+    def _reset_engine(self):
+        self.vector_engine = self.runner.new_vector_engine() if self.runner.loaded else None
+        self._base_size = len(self.vector_engine.centroid_ids) if self.vector_engine else 0
+
+    def __call__(self, logs):
+        if self.runner.reload_if_changed():
+            self._reset_engine()
+        if self.vector_engine is None:
+            raise RuntimeError("No production model loaded yet")
+        new_groups = len(self.vector_engine.centroid_ids) - self._base_size
+        if self.max_new_groups is not None and new_groups >= self.max_new_groups:
+            print(f"Dropping {new_groups} in-process semantic groups; restarting from the snapshot")
+            self._reset_engine()
+            self.resets += 1
+
+        chunk = LogChunk(
+            [log.log_id if log.log_id is not None else next(self._anonymous_ids) for log in logs],
+            [log.app_id for log in logs],
+            [log.level for log in logs],
+            [log.source for log in logs],
+            [log.message for log in logs],
+            [log.parsed_data for log in logs],
+        )
+        sem_ids, cluster_ids = self.runner.classify(chunk, self.vector_engine)
+        return [
+            ClassifiedLog(
+                semantic_group=sem_id,
+                cluster_id=int(cluster_id) if cluster_id is not None else None,
+            )
+            for sem_id, cluster_id in zip(sem_ids, cluster_ids)
+        ]
+
+
+def create_app(
+    runner, max_batch_size=64, max_wait_ms=10.0, max_request_logs=256, max_new_groups=10000
+):
+    """
+    FastAPI app: POST /classify takes one log or a list of logs and returns
+    semantic_group + cluster_id for each. Concurrent requests are coalesced by
+    a MicroBatcher, so the embedding model runs once per micro-batch.
+    :param runner: BatchRunner with the production models loaded (engine may be None).
+    :param max_new_groups: See OnlineClassifier.
+    """
+    classifier = OnlineClassifier(runner, max_new_groups=max_new_groups)
+    batcher = MicroBatcher(classifier, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await batcher.start()
+        yield
+        await batcher.stop()
+
+    app = FastAPI(title="Logstream classification", lifespan=lifespan)
+    app.state.batcher = batcher
+
+    @app.post("/classify", response_model=Union[ClassifiedLog, List[ClassifiedLog]])
+    async def classify(payload: Union[LogIn, List[LogIn]]):
+        logs = payload if isinstance(payload, list) else [payload]
+        if len(logs) > max_request_logs:
+            raise HTTPException(413, f"At most {max_request_logs} logs per request")
+        try:
+            results = await batcher.submit(logs)
+        except RuntimeError as e:
+            raise HTTPException(503, str(e))
+        return results if isinstance(payload, list) else results[0]
+
+    @app.get("/health")
+    async def health():
+        return {
+            "loaded": runner.loaded,
+            "model_version": runner.version,
+            "semantic_groups": classifier.vector_engine.stats() if classifier.vector_engine else None,
+            "semantic_group_resets": classifier.resets,
+            "batching": batcher.stats(),
+        }
+
+    return app
@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+
+# Seconds a blocked put/get waits before re-checking whether another stage failed
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0  # inside the stage function
+        self.wait_in = 0.0  # starved: waiting for the previous stage
+        self.wait_out = 0.0  # backpressure: waiting for room in the next queue
+
+    def as_dict(self, wall):
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busy_secs": round(self.busy, 3),
+            "wait_in_secs": round(self.wait_in, 3),
+            "wait_out_secs": round(self.wait_out, 3),
+            "utilisation": round(self.busy / wall, 3) if wall > 0 else 0.0,
+        }
+
+
+class StagedPipeline:
+    def __init__(self, source, stages, queue_size=2, source_name="fetch"):
+        """
+        Runs `source` (an iterable, e.g. stream_logs) and every stage in its own
+        thread, connected by bounded FIFO queues, so fetching chunk N+1,
+        embedding chunk N and writing chunk N-1 overlap. Items keep their order.
+        A full queue blocks the stage in front of it (backpressure), so at most
+        `queue_size` items wait between two stages.
+        :param stages: [(name, fn)] run in order; fn(item) returns the item for
+                       the next stage (the last stage's return value is dropped).
+        :param queue_size: Items per queue; 0 runs everything inline in the
+                           calling thread (no overlap, same stats).
+        """
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.stats = [StageStats(source_name)] + [StageStats(name) for name, _ in self.stages]
+        self.wall = 0.0
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, q, item, stats):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        stats.wait_out += time.perf_counter() - start
+
+    def _get(self, q, stats):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                continue
+        else:
+            item = _DONE
+        stats.wait_in += time.perf_counter() - start
+        return item
+
+    def _run_source(self, out_q):
+        stats = self.stats[0]
+        iterator = None
+        try:
+            iterator = iter(self.source)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                item = next(iterator, _DONE)
+                stats.busy += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                stats.items += 1
+                self._put(out_q, item, stats)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            # Close a generator source here (e.g. release a server-side cursor)
+            if hasattr(iterator, "close"):
+                iterator.close()
+            self._put(out_q, _DONE, stats)
+
+    def _run_stage(self, index, fn, in_q, out_q):
+        stats = self.stats[index + 1]
+        try:
+            while True:
+                item = self._get(in_q, stats)
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                result = fn(item)
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+                if out_q is not None:
+                    self._put(out_q, result, stats)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if out_q is not None:
+                self._put(out_q, _DONE, stats)
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _run_inline(self):
+        source_stats = self.stats[0]
+        iterator = iter(self.source)
+        while True:
+            start = time.perf_counter()
+            item = next(iterator, _DONE)
+            source_stats.busy += time.perf_counter() - start
+            if item is _DONE:
+                break
+            source_stats.items += 1
+            for (_, fn), stats in zip(self.stages, self.stats[1:]):
+                start = time.perf_counter()
+                item = fn(item)
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+
+    def run(self):
+        """Runs until the source is exhausted; re-raises the first stage error."""
+        start = time.perf_counter()
+        try:
+            if self.queue_size <= 0:
+                self._run_inline()
+                return self
+            queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+            threads = [threading.Thread(target=self._run_source, args=(queues[0],), daemon=True)]
+            for i, (name, fn) in enumerate(self.stages):
+                out_q = queues[i + 1] if i + 1 < len(queues) else None
+                threads.append(
+                    threading.Thread(
+                        target=self._run_stage, args=(i, fn, queues[i], out_q), name=name, daemon=True
+                    )
+                )
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.wall = time.perf_counter() - start
+        if self._errors:
+            raise self._errors[0]
+        return self
+
+    def report(self):
+        """Per-stage stats; the stage with the highest utilisation is the bottleneck."""
+        return [stats.as_dict(self.wall) for stats in self.stats]
+
+    def summary(self):
+        lines = [f"Pipeline stages ({self.wall:.2f}s wall, queue_size={self.queue_size}):"]
+        for row in self.report():
+            lines.append(
+                f"  {row['stage']:<10} items={row['items']:<5} busy={row['busy_secs']:7.2f}s "
+                f"util={row['utilisation'] * 100:5.1f}%  starved={row['wait_in_secs']:6.2f}s  "
+                f"blocked={row['wait_out_secs']:6.2f}s"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,406 @@
+import os
+import time
+from collections import Counter
+from functools import partial
+
+from src import metrics
+from src.batch_pipeline import StagedPipeline
+from src.db import (
+    apply_migrations,
+    detect_and_create_incidents,
+    fetch_cluster_history,
+    save_embeddings_bulk,
+    save_pattern,
+    stream_logs,
+    touch_batch_claim,
+)
+from src.ml.centroid_index import INDEX_FILE
+from src.ml.embedding_cache import EmbeddingCache
+from src.ml.inference_plan import InferencePlan, compile_inference_plan
+from src.ml.model import SnapshotWatcher, load_model, load_snapshot, read_manifest
+from src.ml.pipeline import (
+    build_feature_dict,
+    build_log_text,
+    embed_and_group,
+    get_embedding_backend,
+    get_text_embeddings,
+)
+from src.ml.sharding import ShardPool
+from src.ml.state_lock import file_signature, state_lock
+from src.ml.template_miner import TEMPLATE_FILE, TemplateMiner
+from src.ml.vector_engine import SemanticVectorEngine
+from src.ml.volume_analyzer import EWMAVolumeDetector, VolumeAnomalyDetector
+from src.ml.volume_window import VolumeWindow
+
+VECTOR_CENTROIDS_FILE = "vector_centroids.pkl"
+
+VOLUME_DETECTORS = ("isolation_forest", "ewma")
+
+# Batches per cluster the EWMA detector is warmed up from (0.7 ** 20 < 0.1%
+# weight left on older batches at the default alpha)
+EWMA_HISTORY_BATCHES = 20
+
+
+def embed_chunk(chunk, vector_engine, template_miner, embed_fn, learn_templates=True):
+    """
+    Embeds and semantically groups one LogChunk.
+    :param learn_templates: See embed_and_group.
+    Returns (embeddings, sem_ids, template_ids).
+    """
+    texts = [
+        build_log_text(message, parsed_data)
+        for message, parsed_data in zip(chunk.messages, chunk.parsed_data)
+    ]
+    return embed_and_group(
+        texts,
+        chunk.log_ids.tolist(),
+        vector_engine,
+        template_miner=template_miner,
+        embed_fn=embed_fn,
+        learn_templates=learn_templates,
+    )
+
+
+def predict_clusters(chunk, embeddings, sem_ids, classifier):
+    """
+    Cluster id per log of the chunk.
+    `classifier` is an InferencePlan or a (model, pipeline) pair.
+    """
+    with metrics.timer("predict_seconds"):
+        if isinstance(classifier, InferencePlan):
+            return classifier.predict(embeddings, chunk.levels, chunk.sources, sem_ids).tolist()
+
+        model, pipeline = classifier
+        cluster_ids = []
+        for level, source, embedding, sem_id in zip(
+            chunk.levels, chunk.sources, embeddings, sem_ids
+        ):
+            feats = build_feature_dict(level, source, embedding, sem_id)
+            proc_feats = pipeline.transform_one(feats)
+            cluster_ids.append(model.predict_one(proc_feats))
+        return cluster_ids
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        engine,
+        production_dir,
+        engine_params=None,
+        use_inference_plan=True,
+        embed_batch_size=64,
+        fetch_size=2000,
+        pipeline_queue_size=2,
+        db_write_chunk_size=5000,
+        workers=1,
+        embedding_cache_dir=None,
+        watch=False,
+        metrics_dir=None,
+        volume_detector="isolation_forest",
+    ):
+        """
+        Classifies log ranges with the production models: the fetch -> embed ->
+        classify -> write pipeline, then save_pattern and incident detection.
+        Models and the embedding cache stay loaded between batches; every batch
+        starts from the production centroids, like a fresh process would.
+        :param engine_params: SemanticVectorEngine keyword args. Capacity, decay
+                              and drift settings apply per batch, since no
+                              batch's new groups outlive it.
+        :param workers: > 1 embeds + searches each chunk in a ShardPool.
+        :param watch: Keep a SnapshotWatcher on production_dir so that
+                      reload_if_changed() picks up newly promoted versions.
+        :param metrics_dir: Enables src.metrics; each batch writes
+                            batch_<id>.json and logstream.prom here.
+        :param volume_detector: "isolation_forest" (volume_model.pkl on the
+                                history window) or "ewma" (EWMAVolumeDetector,
+                                state warmed up from cluster_volume_history
+                                and updated every batch).
+        """
+        if volume_detector not in VOLUME_DETECTORS:
+            raise ValueError(f"Unknown volume detector: {volume_detector}")
+        self.engine = engine
+        if engine is not None:
+            apply_migrations(engine)
+        self.production_dir = production_dir
+        self.engine_params = engine_params or {}
+        self.use_inference_plan = use_inference_plan
+        self.embed_batch_size = embed_batch_size
+        self.fetch_size = fetch_size
+        self.pipeline_queue_size = pipeline_queue_size
+        self.db_write_chunk_size = db_write_chunk_size
+        self.workers = workers
+        self.metrics_dir = metrics_dir or None
+        self.volume_detector_mode = volume_detector
+        if self.metrics_dir:
+            metrics.enable()
+
+        # Cached vectors are only valid for the backend that produced them
+        self.embedding_cache = EmbeddingCache(
+            directory=embedding_cache_dir or None,
+            model_name=get_embedding_backend().cache_key,
+        )
+        self._watcher = SnapshotWatcher(production_dir) if watch else None
+        self.version = None
+        self.loaded = self._load_models()
+
+    def _load_models(self):
+        # The snapshot (compiled plan + memory-mapped centroids) is all prediction
+        # needs; the river pickles are only loaded for model directories without
+        # one, or when the plan is disabled.
+        snapshot = None
+        if self.use_inference_plan:
+            snapshot = self._watcher.snapshot if self._watcher else load_snapshot(self.production_dir)
+
+        self.snapshot = snapshot
+        self._centroids = None
+        if snapshot is not None:
+            self.classifier = snapshot.plan
+        else:
+            model, pipeline = load_model(directory=self.production_dir)
+            if model is None:
+                print("Waiting for initial training to complete...")
+                return False
+            self.classifier = (
+                compile_inference_plan(model, pipeline)
+                if self.use_inference_plan
+                else (model, pipeline)
+            )
+            vector_engine = SemanticVectorEngine(**self.engine_params)
+            vector_engine.load(os.path.join(self.production_dir, VECTOR_CENTROIDS_FILE))
+            self._centroids = (list(vector_engine.centroid_ids), vector_engine.centroid_matrix.copy())
+
+        # Template tree only exists for models trained on mined templates;
+        # without it logs are embedded from their raw text as before.
+        self.template_miner = TemplateMiner.load(os.path.join(self.production_dir, TEMPLATE_FILE))
+        # Per-cluster volume counts of the last batches; built from
+        # cluster_volume_history on this process's first batch, in memory after
+        self.volume_window = None
+        # Loaded on the first batch; kept between batches like the other models
+        self.volume_detector = None
+        # Versions of the shared state files this runner last read or wrote
+        self._state_seen = {}
+        self._mark_state_seen(TEMPLATE_FILE)
+
+        manifest = read_manifest(self.production_dir)
+        self.version = manifest["version"] if manifest else None
+        return True
+
+    def reload_if_changed(self):
+        """Reloads every model if a new production snapshot was promoted. Returns True on reload."""
+        if self._watcher is None or not self._watcher.poll():
+            return False
+        self.loaded = self._load_models()
+        print(f"Reloaded models (version {self.version})")
+        return self.loaded
+
+    def _production_unchanged(self):
+        manifest = read_manifest(self.production_dir)
+        return (manifest["version"] if manifest else None) == self.version
+
+    def _state_changed(self, name):
+        """True if another process saved `name` since this runner last read or wrote it."""
+        return file_signature(os.path.join(self.production_dir, name)) != self._state_seen.get(name)
+
+    def _mark_state_seen(self, *names):
+        for name in names:
+            self._state_seen[name] = file_signature(os.path.join(self.production_dir, name))
+
+    def _save_template_miner(self, template_ids):
+        """
+        Saves the template tree; call under state_lock. If another runner saved
+        the tree since this one loaded it, this batch's templates are mined
+        into that tree instead, and it becomes this runner's tree.
+        """
+        path = os.path.join(self.production_dir, TEMPLATE_FILE)
+        miner = self.template_miner
+        if self._state_changed(TEMPLATE_FILE):
+            saved = TemplateMiner.load(path)
+            if saved is not None:
+                saved.add_logs(miner.template_texts(template_ids).values())
+                miner = saved
+        miner.save(path)
+        self.template_miner = miner
+        self._mark_state_seen(TEMPLATE_FILE)
+
+    def new_vector_engine(self):
+        """SemanticVectorEngine holding the production centroids (a private copy for new groups)."""
+        return self._fresh_vector_engine()
+
+    def classify(self, chunk, vector_engine):
+        """
+        (sem_ids, cluster_ids) for a LogChunk; nothing is written to the database.
+        New semantic groups are added to `vector_engine` only, and logs are only
+        matched against the loaded template tree, never added to it.
+        """
+        if not self.loaded:
+            raise RuntimeError(f"No model in {self.production_dir}")
+        embed_fn = partial(
+            get_text_embeddings, batch_size=self.embed_batch_size, cache=self.embedding_cache
+        )
+        embeddings, sem_ids, _ = embed_chunk(
+            chunk, vector_engine, self.template_miner, embed_fn, learn_templates=False
+        )
+        return sem_ids, predict_clusters(chunk, embeddings, sem_ids, self.classifier)
+
+    def _load_volume_detector(self):
+        # Both start from the real batch history, not the training buckets, and
+        # then catch up with cluster_volume_history after every batch
+        if self.volume_detector_mode == "ewma":
+            return EWMAVolumeDetector.from_history(
+                fetch_cluster_history(self.engine, window_size=EWMA_HISTORY_BATCHES)
+            )
+        if self.volume_window is None:
+            self.volume_window = VolumeWindow.from_history(fetch_cluster_history(self.engine))
+        detector = VolumeAnomalyDetector(window_size=self.volume_window.window_size)
+        detector.load(self.production_dir)
+        return detector
+
+    def _fresh_vector_engine(self):
+        if self.snapshot is not None:
+            return self.snapshot.build_vector_engine(**self.engine_params)
+        vector_engine = SemanticVectorEngine(**self.engine_params)
+        ids, matrix = self._centroids
+        vector_engine.set_centroids(
+            ids, matrix, index_path=os.path.join(self.production_dir, INDEX_FILE)
+        )
+        return vector_engine
+
+    def run_batch(self, batch_id, start_log_id, end_log_id):
+        """
+        Classifies, writes and post-processes logs start_log_id..end_log_id.
+        Returns the number of logs classified (0 = empty range, nothing else done).
+        Marking the batch COMPLETED is left to the caller.
+        """
+        if not self.loaded:
+            raise RuntimeError(f"No model in {self.production_dir}")
+
+        print(f"Fetching logs between ID {start_log_id} and {end_log_id}...")
+        metrics.reset()
+        vector_engine = self._fresh_vector_engine()
+        template_miner = self.template_miner
+
+        # With workers > 1 the pool takes the place of both the embedding backend
+        # and the vector engine; new groups are still created here, in log order.
+        pool = (
+            ShardPool(vector_engine, get_embedding_backend(), self.workers)
+            if self.workers > 1
+            else None
+        )
+        grouper = pool or vector_engine
+        embed_fn = partial(
+            get_text_embeddings,
+            batch_size=self.embed_batch_size,
+            cache=self.embedding_cache,
+            backend=pool,
+        )
+
+        batch_size = 0
+        cluster_counts = Counter()
+        batch_template_ids = set()
+        pattern_templates = {} if template_miner is not None else None
+        batch_start = time.perf_counter()
+
+        # fetch -> embed -> classify -> write, each in its own thread with bounded
+        # queues between them; chunks stay in log order (embedding/grouping is
+        # order-dependent and runs in a single stage).
+        def embed_stage(chunk):
+            print(f"Classifying {len(chunk)} logs for Batch {batch_id}...")
+            embeddings, sem_ids, template_ids = embed_chunk(chunk, grouper, template_miner, embed_fn)
+            # Template texts as of this chunk; the next chunk may generalise them
+            # while this one is still being written
+            texts = template_miner.template_texts(template_ids) if template_miner else None
+            return chunk, embeddings, sem_ids, template_ids, texts
+
+        def classify_stage(item):
+            chunk, embeddings, sem_ids, template_ids, texts = item
+            cluster_ids = predict_clusters(chunk, embeddings, sem_ids, self.classifier)
+            return chunk, embeddings, template_ids, texts, cluster_ids
+
+        def write_stage(item):
+            nonlocal batch_size
+            chunk, embeddings, template_ids, texts, cluster_ids = item
+            # One COPY-based write per chunk instead of a transaction per log
+            save_embeddings_bulk(
+                self.engine,
+                chunk.log_ids.tolist(),
+                chunk.app_ids,
+                embeddings,
+                cluster_ids,
+                chunk.levels,
+                chunk.sources,
+                chunk_size=self.db_write_chunk_size,
+            )
+            # Heartbeat: keeps a long batch from being taken over as stale
+            touch_batch_claim(self.engine, batch_id)
+
+            if template_miner is not None:
+                chunk_templates = template_miner.cluster_templates(
+                    cluster_ids, chunk.sources, chunk.levels, template_ids, texts=texts
+                )
+                for cluster_id, template in chunk_templates.items():
+                    pattern_templates.setdefault(cluster_id, template)
+                batch_template_ids.update(template_ids)
+            cluster_counts.update(int(cid) for cid in cluster_ids if cid is not None)
+            batch_size += len(chunk)
+            metrics.inc("logs_processed_total", len(chunk))
+
+        batch_pipeline = StagedPipeline(
+            stream_logs(self.engine, start_log_id, end_log_id, fetch_size=self.fetch_size),
+            [("embed", embed_stage), ("classify", classify_stage), ("write", write_stage)],
+            queue_size=self.pipeline_queue_size,
+        )
+        try:
+            batch_pipeline.run()
+        finally:
+            if pool is not None:
+                pool.close()
+
+        if batch_size == 0:
+            print(f"Batch {batch_id} is empty (No error/warning logs found in range).")
+            return 0
+
+        batch_secs = time.perf_counter() - batch_start
+        metrics.observe("batch_classify_seconds", batch_secs)
+        for row in batch_pipeline.report():
+            metrics.inc("pipeline_stage_busy_seconds_total", row["busy_secs"], stage=row["stage"])
+        print(
+            f"Classified {batch_size} logs in {batch_secs:.2f}s "
+            f"({batch_size / max(batch_secs, 1e-9):.1f} logs/sec)"
+        )
+        print(batch_pipeline.summary())
+        print(self.embedding_cache.summary())
+        print(f"Semantic centroids: {vector_engine.stats()}")
+        self.embedding_cache.save()
+
+        # A newly promoted model ships its own template tree; don't overwrite it
+        if template_miner is not None:
+            with state_lock(self.production_dir):
+                if self._production_unchanged():
+                    self._save_template_miner(batch_template_ids)
+
+        with metrics.timer("save_pattern_seconds"):
+            # Only the clusters of this log range are upserted
+            save_pattern(
+                engine=self.engine,
+                templates=pattern_templates,
+                start_log_id=int(start_log_id),
+                end_log_id=int(end_log_id),
+            )
+
+        with metrics.timer("incident_detection_seconds"):
+            if self.volume_detector is None:
+                self.volume_detector = self._load_volume_detector()
+            # Counts come from the classifier, not a GROUP BY over `logs`
+            detect_and_create_incidents(
+                engine=self.engine,
+                start_log_id=int(start_log_id),
+                end_log_id=int(end_log_id),
+                batch_stats=dict(cluster_counts),
+                window=self.volume_window,
+                detector=self.volume_detector,
+            )
+
+        metrics.observe("batch_seconds", time.perf_counter() - batch_start)
+        if self.metrics_dir:
+            metrics.write_batch_metrics(self.metrics_dir, batch_id)
+        return batch_size
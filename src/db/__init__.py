@@ -1,5 +1,27 @@
 from src.db.connection import get_db_engine
-from src.db.log_ops import fetch_logs_batch, fetch_min_timestamp, save_embedding
+from src.db.log_ops import (
+    LogChunk,
+    fetch_logs_batch,
+    stream_logs,
+    fetch_min_timestamp,
+    save_embedding,
+    save_embeddings_bulk,
+)
+from src.db.migrations import apply_migrations
 from src.db.pattern_ops import save_pattern
-from src.db.cluster_ops import save_cluster_stats, fetch_cluster_history
-from src.db.incident_ops import create_incident, detect_and_create_incidents
+from src.db.cluster_ops import (
+    save_cluster_stats,
+    fetch_cluster_history,
+    fetch_cluster_history_since,
+)
+from src.db.incident_ops import (
+    create_incident,
+    create_incidents_bulk,
+    detect_and_create_incidents,
+)
+from src.db.batch_ops import (
+    claim_pending_batch,
+    mark_batch_completed,
+    mark_batch_failed,
+    touch_batch_claim,
+)
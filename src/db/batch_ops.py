@@ -0,0 +1,73 @@
+from sqlalchemy import text
+
+# Claims the oldest PENDING batch (or one whose PROCESSING claim went stale, e.g.
+# its worker crashed). SKIP LOCKED lets several workers claim concurrently
+# without ever getting the same row. Rows without a log range (created before
+# apply_migrations added the columns) are left to run_incremental_batch.py.
+CLAIM_BATCH_SQL = """
+    UPDATE batch_order
+    SET status = 'PROCESSING', last_processed_timestamp = NOW()
+    WHERE batchid = (
+        SELECT batchid
+        FROM batch_order
+        WHERE (status = 'PENDING'
+               OR (status = 'PROCESSING'
+                   AND last_processed_timestamp < NOW() - make_interval(secs => :stale_after)))
+          AND start_log_id IS NOT NULL AND end_log_id IS NOT NULL
+        ORDER BY batchid
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING batchid, start_log_id, end_log_id;
+"""
+
+
+def claim_pending_batch(engine, stale_after=3600):
+    """
+    Marks the next PENDING batch as PROCESSING and returns
+    (batch_id, start_log_id, end_log_id), or None when there is nothing to do.
+    :param stale_after: Seconds after which a PROCESSING claim may be taken over.
+    """
+    with engine.begin() as conn:
+        row = conn.execute(text(CLAIM_BATCH_SQL), {"stale_after": stale_after}).fetchone()
+    if row is None:
+        return None
+    return int(row[0]), int(row[1]), int(row[2])
+
+
+def touch_batch_claim(engine, batch_id):
+    """
+    Refreshes a PROCESSING batch's last_processed_timestamp. The runner calls it
+    per written chunk, so a claim only goes stale once its worker stops making
+    progress, not when a batch simply runs longer than stale_after.
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE batch_order SET last_processed_timestamp = NOW() "
+                "WHERE batchid = :batch_id AND status = 'PROCESSING'"
+            ),
+            {"batch_id": int(batch_id)},
+        )
+
+
+def set_batch_status(engine, batch_id, status):
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE batch_order SET status = :status, last_processed_timestamp = NOW() "
+                "WHERE batchid = :batch_id"
+            ),
+            {"status": status, "batch_id": int(batch_id)},
+        )
+
+
+def mark_batch_completed(engine, batch_id):
+    print(f"Marking Batch {batch_id} as COMPLETED in Database...")
+    set_batch_status(engine, batch_id, "COMPLETED")
+
+
+def mark_batch_failed(engine, batch_id):
+    """FAILED batches are left for an operator instead of being retried in a loop."""
+    print(f"Marking Batch {batch_id} as FAILED in Database...")
+    set_batch_status(engine, batch_id, "FAILED")
@@ -1,4 +1,3 @@
-import pandas as pd
 from sqlalchemy import text
 
 
@@ -6,9 +5,10 @@ def save_cluster_stats(engine, batch_stats: dict):
     """
     Saves current batch stats to history.
     batch_stats format: {cluster_id: count, ...}
+    Returns the rows' batch_timestamp, or None if nothing was saved.
     """
     if not batch_stats:
-        return
+        return None
 
     # We timestamp this entry as 'NOW()' so we know when this batch happened
     insert_query = text(
@@ -25,37 +25,68 @@ def save_cluster_stats(engine, batch_stats: dict):
     try:
         with engine.begin() as conn:
             conn.execute(insert_query, params)
+            # NOW() is the transaction start, i.e. the timestamp just inserted
+            batch_timestamp = conn.execute(text("SELECT NOW()")).scalar()
             print(f"Saved volume stats for {len(params)} clusters.")
+        return batch_timestamp
     except Exception as e:
         print(f"Error saving cluster stats: {e}")
+        return None
 
 
 def fetch_cluster_history(engine, window_size=5):
     """
     Fetches the last N counts for ALL clusters to build the context window.
-    Returns: DataFrame with columns [cluster_id, log_count, batch_timestamp]
+    Returns: DataFrame with columns [id, cluster_id, log_count, batch_timestamp]
     """
     # This query retrieves the most recent 'window_size' entries for every cluster
     query = text(
         f"""
         WITH ranked_history AS (
             SELECT 
+                id,
                 cluster_id, 
                 log_count, 
                 batch_timestamp,
                 ROW_NUMBER() OVER (PARTITION BY cluster_id ORDER BY batch_timestamp DESC) as rn
             FROM cluster_volume_history
         )
-        SELECT cluster_id, log_count, batch_timestamp
+        SELECT id, cluster_id, log_count, batch_timestamp
         FROM ranked_history
         WHERE rn <= :window_size
         ORDER BY cluster_id, batch_timestamp ASC;
     """
     )
 
+    import pandas as pd
+
     try:
         df = pd.read_sql(query, engine, params={"window_size": window_size})
         return df
     except Exception as e:
         print(f"Error fetching history: {e}")
         return pd.DataFrame()
+
+
+def fetch_cluster_history_since(engine, after_id):
+    """
+    History rows saved after row `after_id` (by this or any other runner), for
+    catching an in-memory VolumeWindow up without re-ranking the whole table.
+    Returns: DataFrame [id, cluster_id, log_count, batch_timestamp], or None on error.
+    """
+    query = text(
+        """
+        SELECT id, cluster_id, log_count, batch_timestamp
+        FROM cluster_volume_history
+        WHERE id > :after_id
+        ORDER BY id
+    """
+    )
+
+    import pandas as pd
+
+    try:
+        return pd.read_sql(query, engine, params={"after_id": int(after_id)})
+    except Exception as e:
+        print(f"Error fetching new history: {e}")
+        return None
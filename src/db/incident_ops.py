@@ -1,54 +1,91 @@
 from sqlalchemy import text
 
-from src.db.cluster_ops import save_cluster_stats, fetch_cluster_history
-
-
-def create_incident(engine, cluster_id, reason="Volume Anomaly"):
-    check_query = text(
-        """
-            SELECT 1
-            FROM incidents
-            WHERE cluster_id = :cid AND status IN ('OPEN', 'NEW')
-            LIMIT 1
-        """
+from src import metrics
+
+from src.db.cluster_ops import (
+    save_cluster_stats,
+    fetch_cluster_history,
+    fetch_cluster_history_since,
+)
+
+
+# One statement for all flagged clusters: active (OPEN/NEW) incidents get their
+# updated_at refreshed, the other clusters get a NEW incident. Both CTEs see the
+# table as of the statement start. The partial unique index on active incidents
+# (src/db/migrations.py) makes a concurrent batch's insert of the same cluster a
+# no-op instead of a duplicate; the conflict has no target so the statement
+# still runs, guarded by NOT EXISTS only, on a schema without the index.
+UPSERT_INCIDENTS_SQL = text(
+    """
+    WITH flagged AS (
+        SELECT DISTINCT unnest(CAST(:cluster_ids AS int[])) AS cluster_id
+    ),
+    refreshed AS (
+        UPDATE incidents i
+        SET updated_at = NOW()
+        FROM flagged f
+        WHERE i.cluster_id = f.cluster_id AND i.status IN ('OPEN', 'NEW')
+        RETURNING i.cluster_id
+    ),
+    created AS (
+        INSERT INTO incidents (cluster_id,status,assigned_role,assigned_to,created_at,updated_at,resolved_at)
+        SELECT f.cluster_id, 'NEW', 'SRE', null, NOW(), null, null
+        FROM flagged f
+        WHERE NOT EXISTS (
+            SELECT 1 FROM incidents i
+            WHERE i.cluster_id = f.cluster_id AND i.status IN ('OPEN', 'NEW')
+        )
+        ON CONFLICT DO NOTHING
+        RETURNING cluster_id
     )
+    SELECT 'created', cluster_id FROM created
+    UNION ALL
+    SELECT DISTINCT 'refreshed', cluster_id FROM refreshed
+"""
+)
 
-    update_query = text(
-        """
-            UPDATE incidents
-            SET updated_at = NOW()
-            WHERE cluster_id = :cid AND status IN ('OPEN', 'NEW')
-        """
-    )
 
-    insert_query = text(
-        """
-            INSERT INTO incidents (cluster_id,status,assigned_role,assigned_to,created_at,updated_at,resolved_at)
-            VALUES(:cid,'NEW','SRE',null,NOW(),null,null)
-        """
-    )
+def create_incidents_bulk(engine, cluster_ids, reason="Volume Anomaly"):
+    """
+    Opens or refreshes incidents for all flagged clusters in one round-trip.
+    Returns (created, refreshed) lists of cluster_ids; a cluster in neither
+    got its incident from a concurrent batch. Both are empty if the query fails.
+    """
+    cluster_ids = sorted({int(cid) for cid in cluster_ids})
+    if not cluster_ids:
+        return [], []
 
-    with engine.begin() as conn:
-        existing_open = conn.execute(check_query, {"cid": cluster_id}).fetchone()
-        if existing_open:
-            conn.execute(update_query, {"cid": cluster_id})
-            print(
-                f"Incident already active for Cluster {cluster_id}; refreshed timestamp [{reason}]"
-            )
-            return
+    try:
+        with engine.begin() as conn:
+            rows = conn.execute(UPSERT_INCIDENTS_SQL, {"cluster_ids": cluster_ids}).fetchall()
+    except Exception as e:
+        print(f"Error creating incidents for Clusters {cluster_ids}: {e}")
+        return [], []
+
+    created = sorted(cid for action, cid in rows if action == "created")
+    refreshed = sorted(cid for action, cid in rows if action == "refreshed")
+    metrics.inc("incidents_created_total", len(created))
+    metrics.inc("incidents_refreshed_total", len(refreshed))
+    if created:
+        print(f"New Incidents CREATED for Clusters {created} [{reason}]")
+    if refreshed:
+        print(f"Incidents already active for Clusters {refreshed}; refreshed timestamps [{reason}]")
+    raced = set(cluster_ids) - set(created) - set(refreshed)
+    if raced:
+        print(f"Incidents for Clusters {sorted(raced)} were opened by a concurrent batch")
+    return created, refreshed
 
-        conn.execute(insert_query, {"cid": cluster_id})
-        print(f"New Incident CREATED for Cluster {cluster_id} [{reason}]")
 
+def create_incident(engine, cluster_id, reason="Volume Anomaly"):
+    """Single-cluster form of create_incidents_bulk."""
+    return create_incidents_bulk(engine, [cluster_id], reason=reason)
 
-def detect_and_create_incidents(engine, start_log_id, end_log_id):
+
+def count_batch_clusters(engine, start_log_id, end_log_id):
     """
-    End-of-batch orchestrator: saves cluster volume stats,
-    runs anomaly detection, and creates incidents for flagged clusters.
+    {cluster_id: error/warning log count} for a log_id range, from `logs`.
+    Returns None if the query fails.
     """
-    from src.ml.volume_analyzer import VolumeAnomalyDetector
-
-    # 1. Count how many logs landed in each cluster during this batch
     count_query = text(
         """
         SELECT cluster_id, COUNT(*) as cnt
@@ -66,26 +103,74 @@ def detect_and_create_incidents(engine, start_log_id, end_log_id):
                 count_query,
                 {"start_log_id": start_log_id, "end_log_id": end_log_id},
             ).fetchall()
-        batch_stats = {row[0]: row[1] for row in rows}
+        return {row[0]: row[1] for row in rows}
     except Exception as e:
         print(f"Error counting cluster stats: {e}")
-        return
+        return None
 
-    print(f"Batch cluster counts: {batch_stats}")
 
-    # 2. Save stats to history
-    save_cluster_stats(engine, batch_stats)
+def detect_and_create_incidents(
+    engine, start_log_id, end_log_id, batch_stats=None, window=None, detector=None
+):
+    """
+    End-of-batch orchestrator: saves cluster volume stats,
+    runs anomaly detection, and creates incidents for flagged clusters.
+    :param batch_stats: {cluster_id: error/warning log count} accumulated by the
+                        caller while classifying; counted from `logs` if None.
+    :param window: VolumeWindow to detect on, first caught up with every batch
+                   saved to cluster_volume_history since its last read (this one
+                   and other runners'); without one the window is rebuilt from
+                   the table.
+    :param detector: A loaded VolumeAnomalyDetector, or an EWMAVolumeDetector
+                     that scores batch_stats directly (no history window),
+                     caught up with cluster_volume_history like the window.
+                     Default: the Isolation Forest in scripts/models/production.
+    """
+    from src.ml.volume_analyzer import EWMAVolumeDetector, VolumeAnomalyDetector
 
-    # 3. Fetch history window
-    history_df = fetch_cluster_history(engine, window_size=5)
+    # 1. Count how many logs landed in each cluster during this batch
+    if batch_stats is None:
+        batch_stats = count_batch_clusters(engine, start_log_id, end_log_id)
+        if batch_stats is None:
+            return
+
+    print(f"Batch cluster counts: {batch_stats}")
 
-    # 4. Load volume model and detect anomalies
-    vol_detector = VolumeAnomalyDetector(window_size=5)
-    vol_detector.load("scripts/models/production")
-    anomalous_clusters = vol_detector.detect_anomalies(history_df)
+    # 2. Save stats to history (append-only audit trail)
+    batch_timestamp = save_cluster_stats(engine, batch_stats)
+
+    # 3. History window: in memory when the caller keeps one. The table stays
+    #    the source of truth, so batches of concurrent runners are seen too
+    #    (a row committed out of id order by a racing runner can be skipped)
+    if window is not None:
+        new_rows = fetch_cluster_history_since(engine, window.history_id)
+        if new_rows is None:
+            window.push(batch_stats)
+        else:
+            window.catch_up(new_rows)
+
+    # 4. Detect anomalies: the streaming detector scores this batch's counts
+    #    against its running state; the Isolation Forest needs the window
+    if isinstance(detector, EWMAVolumeDetector):
+        # Absorb the batches other runners saved since the last read, but score
+        # this one against the state before it, as detect_anomalies expects
+        new_rows = fetch_cluster_history_since(engine, detector.history_id)
+        if new_rows is not None:
+            detector.catch_up(new_rows, exclude_timestamp=batch_timestamp)
+        anomalous_clusters = detector.detect_anomalies(batch_stats)
+        total_evaluated = len(detector)
+    else:
+        if window is not None:
+            history_df = window.to_frame()
+        else:
+            history_df = fetch_cluster_history(engine, window_size=5)
+        if detector is None:
+            detector = VolumeAnomalyDetector(window_size=5)
+            detector.load("scripts/models/production")
+        anomalous_clusters = detector.detect_anomalies(history_df)
+        total_evaluated = history_df["cluster_id"].nunique()
 
     # 5. Sanity guard: if anomaly ratio is unreasonably high, skip
-    total_evaluated = history_df["cluster_id"].nunique()
     MAX_ANOMALY_RATIO = 0.3
     if total_evaluated > 0 and len(anomalous_clusters) > 0:
         ratio = len(anomalous_clusters) / total_evaluated
@@ -99,8 +184,7 @@ def detect_and_create_incidents(engine, start_log_id, end_log_id):
     # 6. Create incidents
     if anomalous_clusters:
         print(f"🚨 Creating incidents for {len(anomalous_clusters)} anomalous clusters.")
-        for cid in anomalous_clusters:
-            create_incident(engine, cid, reason="Volume Anomaly")
+        create_incidents_bulk(engine, anomalous_clusters, reason="Volume Anomaly")
     else:
         print("✅ No volume anomalies detected.")
 
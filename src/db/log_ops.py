@@ -1,9 +1,44 @@
-import pandas as pd
+import io
+
+import numpy as np
 from sqlalchemy import text
 
+from src import metrics
+
+# Session-local staging table for bulk writes. Typed from log_embeddings so ids and
+# labels match; the embedding travels as double precision[] and is cast on insert
+# exactly like the list parameter save_embedding sends.
+CREATE_TMP_EMBEDDINGS_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS tmp_log_embeddings ON COMMIT DELETE ROWS AS
+    SELECT log_id, app_id, NULL::double precision[] AS embedding, cluster_id, level, source
+    FROM log_embeddings
+    WITH NO DATA;
+"""
+
+COPY_TMP_EMBEDDINGS_SQL = """
+    COPY tmp_log_embeddings (log_id, app_id, embedding, cluster_id, level, source)
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+INSERT_FROM_TMP_SQL = """
+    INSERT INTO log_embeddings (log_id, app_id, embedding, cluster_id, level, source)
+    SELECT log_id, app_id, embedding, cluster_id, level, source
+    FROM tmp_log_embeddings
+    ON CONFLICT (log_id) DO NOTHING;
+"""
+
+UPDATE_LOGS_FROM_TMP_SQL = """
+    UPDATE logs
+    SET cluster_id = t.cluster_id
+    FROM tmp_log_embeddings t
+    WHERE logs.log_id = t.log_id;
+"""
+
 
 def fetch_logs_batch(engine, query: str):
     """Fetch dataframe from DB using a SELECT query."""
+    import pandas as pd
+
     print(f"Executing query:\n{query}")
     try:
         df = pd.read_sql(query, engine)
@@ -14,6 +49,98 @@ def fetch_logs_batch(engine, query: str):
         return pd.DataFrame()
 
 
+class LogChunk:
+    """
+    Columnar slice of fetched logs: one sequence per column, aligned by position.
+    log_ids is an int64 array; the other columns are plain tuples.
+    """
+
+    __slots__ = ("log_ids", "app_ids", "levels", "sources", "messages", "parsed_data")
+
+    def __init__(self, log_ids, app_ids, levels, sources, messages, parsed_data):
+        self.log_ids = np.asarray(log_ids, dtype=np.int64)
+        self.app_ids = tuple(app_ids)
+        self.levels = tuple(levels)
+        self.sources = tuple(sources)
+        self.messages = tuple(messages)
+        self.parsed_data = tuple(parsed_data)
+
+    def __len__(self):
+        return len(self.log_ids)
+
+    @classmethod
+    def from_rows(cls, rows):
+        log_ids, app_ids, levels, sources, messages, parsed_data = zip(*rows)
+        return cls(log_ids, app_ids, levels, sources, messages, parsed_data)
+
+    @classmethod
+    def concat(cls, chunks):
+        chunks = list(chunks)
+        if not chunks:
+            return cls([], [], [], [], [], [])
+        return cls(
+            np.concatenate([c.log_ids for c in chunks]),
+            *(
+                [value for c in chunks for value in getattr(c, column)]
+                for column in cls.__slots__[1:]
+            ),
+        )
+
+
+def stream_logs(
+    engine,
+    start_log_id=None,
+    end_log_id=None,
+    fetch_size=2000,
+    unclassified_only=True,
+    limit=None,
+):
+    """
+    Generator over error/warning logs, ordered by log_id, yielding LogChunk objects
+    of up to `fetch_size` rows. Rows come from a named server-side cursor, so only
+    one chunk is held in memory and the first chunk can be processed while the
+    rest of the range is still being read. Only the columns the pipeline uses
+    are selected.
+    """
+    conditions = ["level IN ('error','warning')"]
+    params = {}
+    if start_log_id is not None:
+        conditions.append("log_id >= :start_log_id")
+        params["start_log_id"] = int(start_log_id)
+    if end_log_id is not None:
+        conditions.append("log_id <= :end_log_id")
+        params["end_log_id"] = int(end_log_id)
+    if unclassified_only:
+        conditions.append("cluster_id IS NULL")
+
+    query = f"""
+        SELECT log_id, app_id, level, source, message, parsed_data
+        FROM logs
+        WHERE {' AND '.join(conditions)}
+        ORDER BY log_id ASC
+    """
+    if limit is not None:
+        query += " LIMIT :limit"
+        params["limit"] = int(limit)
+
+    print(f"Streaming logs (fetch_size={fetch_size}) with params {params}")
+    total = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True, max_row_buffer=fetch_size
+        ).execute(text(query), params)
+        partitions = result.partitions(fetch_size)
+        while True:
+            with metrics.timer("db_fetch_seconds"):
+                rows = next(partitions, None)
+            if rows is None:
+                break
+            total += len(rows)
+            metrics.inc("logs_fetched_total", len(rows))
+            yield LogChunk.from_rows(rows)
+    print(f"Streamed {total} logs.")
+
+
 def fetch_min_timestamp(engine, timestamp_query):
     print(f"Fetching timestamp of the latest unprocessed log")
     try:
@@ -79,3 +206,90 @@ def save_embedding(engine, log_id, app_id, embedding_vector, cluster_id, level,
 
         # Step B: Execute UPDATE on logs table in the SAME TRANSACTION
         conn.execute(insert_to_logs, {"log_id": log_id, "cluster_id": cluster_id})
+
+
+def _copy_value(value):
+    # None / NaN (pandas nulls) become an empty unquoted CSV field, which COPY
+    # reads as NULL. Strings are always quoted, so '' stays an empty string.
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+
+def _embedding_copy_rows(log_ids, app_ids, embeddings, cluster_ids, levels, sources, start, end):
+    """CSV payload for COPY, one line per log."""
+    # %.9g round-trips float32 exactly and is much cheaper than repr() of the
+    # float64 upcast; the vector is written as a quoted Postgres array literal.
+    vector_fmt = '"{' + ",".join(["%.9g"] * len(embeddings[start])) + '}"'
+    buf = io.StringIO()
+    for i in range(start, end):
+        vector = vector_fmt % tuple(embeddings[i].tolist())
+        buf.write(
+            ",".join(
+                [
+                    _copy_value(log_ids[i]),
+                    _copy_value(app_ids[i]),
+                    vector,
+                    _copy_value(cluster_ids[i]),
+                    _copy_value(levels[i]),
+                    _copy_value(sources[i]),
+                ]
+            )
+            + "\n"
+        )
+    buf.seek(0)
+    return buf
+
+
+def save_embeddings_bulk(
+    engine, log_ids, app_ids, embeddings, cluster_ids, levels, sources, chunk_size=5000
+):
+    """
+    Bulk version of save_embedding for a whole batch.
+    Each chunk of `chunk_size` rows is streamed with COPY into a temp table, then
+    applied with one INSERT ... SELECT ON CONFLICT DO NOTHING into log_embeddings
+    and one UPDATE logs ... FROM tmp, and committed as a single transaction.
+    Batch runs write each pipeline chunk with it; training writes straight from
+    the staged embedding matrix (src/ml/training_staging.py), without a CSV.
+    Returns (rows inserted into log_embeddings, rows updated in logs).
+    """
+    total = len(log_ids)
+    if total == 0:
+        return 0, 0
+
+    inserted = 0
+    updated = 0
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for start in range(0, total, chunk_size):
+            end = min(start + chunk_size, total)
+            with metrics.timer("db_write_seconds", table="log_embeddings"):
+                payload = _embedding_copy_rows(
+                    log_ids, app_ids, embeddings, cluster_ids, levels, sources, start, end
+                )
+
+                cursor.execute(CREATE_TMP_EMBEDDINGS_SQL)
+                cursor.copy_expert(COPY_TMP_EMBEDDINGS_SQL, payload)
+                cursor.execute(INSERT_FROM_TMP_SQL)
+                chunk_inserted = cursor.rowcount
+                cursor.execute(UPDATE_LOGS_FROM_TMP_SQL)
+                chunk_updated = cursor.rowcount
+                conn.commit()
+            inserted += chunk_inserted
+            updated += chunk_updated
+            metrics.inc("db_rows_written_total", chunk_inserted, table="log_embeddings")
+            metrics.inc("db_rows_written_total", chunk_updated, table="logs")
+
+        print(
+            f"Bulk wrote {total} logs: {inserted} embeddings inserted, "
+            f"{updated} cluster ids updated."
+        )
+        return inserted, updated
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,171 @@
+from sqlalchemy import text
+
+# Serialises migrations between processes starting at the same time
+MIGRATION_LOCK_ID = 7_310_001
+
+# Unique index on a single column of a table on the search_path; `partial`
+# selects indexes with (True) or without (False) a WHERE predicate
+UNIQUE_INDEX_EXISTS_SQL = text(
+    """
+    SELECT 1
+    FROM pg_index i
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+    WHERE i.indrelid = to_regclass(:table)
+      AND i.indisunique
+      AND i.indnatts = 1
+      AND a.attname = :column
+      AND (i.indpred IS NOT NULL) = :partial
+    LIMIT 1
+"""
+)
+
+# Log ranges already added to log_patterns by save_pattern, so a retried or
+# taken-over batch is not counted twice
+LOG_PATTERN_RANGES_SQL = """
+    CREATE TABLE IF NOT EXISTS log_pattern_ranges (
+        start_log_id BIGINT NOT NULL,
+        end_log_id BIGINT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (start_log_id, end_log_id)
+    )
+"""
+
+# save_pattern's upsert target. Clusters that the old insert-only code stored
+# more than once keep their newest row. Rewrites production data, so it is only
+# run by scripts/migrate_schema.py, never at startup.
+LOG_PATTERNS_DUPLICATES_SQL = """
+    SELECT COUNT(*) FROM log_patterns a
+    WHERE EXISTS (
+        SELECT 1 FROM log_patterns b
+        WHERE b.cluster_id = a.cluster_id AND a.ctid < b.ctid
+    )
+"""
+LOG_PATTERNS_DEDUPE_SQL = """
+    DELETE FROM log_patterns a
+    USING log_patterns b
+    WHERE a.cluster_id = b.cluster_id AND a.ctid < b.ctid
+"""
+LOG_PATTERNS_UNIQUE_SQL = (
+    "ALTER TABLE log_patterns ADD CONSTRAINT log_patterns_cluster_id_key UNIQUE (cluster_id)"
+)
+
+# create_incidents_bulk's guard against concurrent batches opening the same
+# incident. Fails while a cluster has several active incidents; resolving all
+# but the oldest is left to scripts/migrate_schema.py.
+INCIDENTS_ACTIVE_DUPLICATES_SQL = """
+    SELECT COUNT(*) FROM incidents a
+    WHERE a.status IN ('OPEN', 'NEW') AND EXISTS (
+        SELECT 1 FROM incidents b
+        WHERE b.cluster_id = a.cluster_id AND b.incident_id < a.incident_id
+          AND b.status IN ('OPEN', 'NEW')
+    )
+"""
+INCIDENTS_ACTIVE_DEDUPE_SQL = """
+    UPDATE incidents a SET status = 'RESOLVED', resolved_at = NOW()
+    FROM incidents b
+    WHERE a.cluster_id = b.cluster_id AND a.incident_id > b.incident_id
+      AND a.status IN ('OPEN', 'NEW') AND b.status IN ('OPEN', 'NEW')
+"""
+INCIDENTS_ACTIVE_UNIQUE_SQL = """
+    CREATE UNIQUE INDEX IF NOT EXISTS incidents_active_cluster_key
+    ON incidents (cluster_id) WHERE status IN ('OPEN', 'NEW')
+"""
+
+# The worker daemon's claim queue (src/db/batch_ops.py) reads each batch's log
+# range from batch_order and moves rows PENDING -> PROCESSING -> COMPLETED/FAILED
+BATCH_ORDER_RANGE_COLUMNS = ("start_log_id", "end_log_id")
+BATCH_ORDER_COLUMNS_SQL = text(
+    "SELECT column_name FROM information_schema.columns "
+    "WHERE table_schema = current_schema() AND table_name = 'batch_order'"
+)
+BATCH_ORDER_RANGE_SQL = """
+    ALTER TABLE batch_order
+        ADD COLUMN IF NOT EXISTS start_log_id BIGINT,
+        ADD COLUMN IF NOT EXISTS end_log_id BIGINT
+"""
+BATCH_STATUSES = ("PENDING", "PROCESSING", "COMPLETED", "FAILED")
+# Labels of batch_order.status when it is an enum type (nothing for text columns)
+BATCH_STATUS_ENUM_SQL = text(
+    """
+    SELECT format_type(a.atttypid, NULL), e.enumlabel
+    FROM pg_attribute a
+    JOIN pg_type t ON t.oid = a.atttypid AND t.typtype = 'e'
+    LEFT JOIN pg_enum e ON e.enumtypid = t.oid
+    WHERE a.attrelid = to_regclass('batch_order') AND a.attname = 'status'
+"""
+)
+
+MIGRATE_HINT = "run scripts/migrate_schema.py"
+
+
+def _has_unique_index(conn, table, column, partial=False):
+    row = conn.execute(
+        UNIQUE_INDEX_EXISTS_SQL, {"table": table, "column": column, "partial": partial}
+    ).fetchone()
+    return row is not None
+
+
+def _log_patterns_step(conn):
+    conn.execute(text(LOG_PATTERN_RANGES_SQL))
+    if not _has_unique_index(conn, "log_patterns", "cluster_id"):
+        return f"log_patterns has no UNIQUE (cluster_id); pattern upserts fail until you {MIGRATE_HINT}"
+    return None
+
+
+def _incidents_step(conn):
+    if _has_unique_index(conn, "incidents", "cluster_id", partial=True):
+        return None
+    try:
+        with conn.begin_nested():
+            conn.execute(text(INCIDENTS_ACTIVE_UNIQUE_SQL))
+    except Exception as e:
+        # Duplicate active incidents left by the old check-then-insert code
+        first_line = str(e).splitlines()[0]
+        return f"cannot create incidents_active_cluster_key ({first_line}); {MIGRATE_HINT}"
+    return None
+
+
+def _batch_order_step(conn):
+    columns = {row[0] for row in conn.execute(BATCH_ORDER_COLUMNS_SQL)}
+    if not columns:
+        return "batch_order does not exist"
+    if not set(BATCH_ORDER_RANGE_COLUMNS) <= columns:
+        conn.execute(text(BATCH_ORDER_RANGE_SQL))
+    enum_rows = conn.execute(BATCH_STATUS_ENUM_SQL).fetchall()
+    if enum_rows:
+        enum_type = enum_rows[0][0]
+        labels = {row[1] for row in enum_rows}
+        for status in BATCH_STATUSES:
+            if status not in labels:
+                conn.execute(text(f"ALTER TYPE {enum_type} ADD VALUE IF NOT EXISTS '{status}'"))
+    return None
+
+
+STARTUP_STEPS = [
+    ("log_patterns", _log_patterns_step),
+    ("incidents", _incidents_step),
+    ("batch_order", _batch_order_step),
+]
+
+
+def apply_migrations(engine):
+    """
+    Startup schema check, run by every process. Only creates what is additive
+    (new tables, nullable columns, enum labels) and reports what needs the reviewed one-off migration; it never
+    rewrites existing rows. Each step runs in its own transaction and failures
+    are logged, not raised, so a schema problem costs the affected feature
+    rather than every batch.
+    Returns the list of problems found (empty when the schema is complete).
+    """
+    problems = []
+    for name, step in STARTUP_STEPS:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+                problem = step(conn)
+        except Exception as e:
+            problem = f"{name} schema check failed: {e}"
+        if problem:
+            print(f"⚠️ {problem}")
+            problems.append(problem)
+    return problems
@@ -1,106 +1,99 @@
 from sqlalchemy import text
 
+from src import metrics
 
-def save_pattern(engine):
-    """
-    Fetches one representative log (pattern) for each cluster
-    and inserts it into the log_patterns table.
-    Only fetches patterns newer than the last seen timestamp (if one exists).
+# One representative log (the cluster's first log in the scanned range) and the
+# range's log count per cluster, upserted into log_patterns. Needs the unique
+# constraint on log_patterns(cluster_id) (src/db/migrations.py). Mined
+# templates, passed as two parallel arrays, replace the raw first-log string;
+# an existing row keeps its template unless this run mined a newer one.
+UPSERT_PATTERNS_SQL = """
+    WITH {applied_cte}counts AS (
+        SELECT cluster_id, MIN(log_id) AS first_log, COUNT(*) AS log_count,
+               MAX(timestamp) AS last_seen
+        FROM logs
+        WHERE cluster_id IS NOT NULL {range_filter}
+        GROUP BY cluster_id
+    ),
+    mined AS (
+        SELECT * FROM unnest(CAST(:template_clusters AS int[]), CAST(:template_texts AS text[]))
+            AS m(cluster_id, template)
+    )
+    INSERT INTO log_patterns (app_id, log_template, incident_count, cluster_id, last_seen)
+    SELECT
+        l.app_id,
+        COALESCE(m.template, concat_ws(' | ', l.source, l.level, l.message, l.parsed_data)),
+        c.log_count,
+        c.cluster_id,
+        COALESCE(c.last_seen, NOW())
+    FROM counts c
+    JOIN logs l ON l.log_id = c.first_log
+    LEFT JOIN mined m ON m.cluster_id = c.cluster_id
+    ON CONFLICT (cluster_id) DO UPDATE SET
+        incident_count = {count_update},
+        last_seen = GREATEST(log_patterns.last_seen, EXCLUDED.last_seen),
+        log_template = CASE
+            WHEN EXCLUDED.cluster_id = ANY(CAST(:template_clusters AS int[]))
+            THEN EXCLUDED.log_template
+            ELSE log_patterns.log_template
+        END;
+"""
+
+# Incremental runs first record their range in log_pattern_ranges; a range that
+# is already there (a retried or taken-over batch) matches no logs, so its
+# counts are never added twice. Concurrent runs of the same range queue on the
+# primary key and the later one sees the conflict.
+APPLIED_RANGE_CTE = """applied AS (
+        INSERT INTO log_pattern_ranges (start_log_id, end_log_id)
+        VALUES (:start_log_id, :end_log_id)
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    ),
     """
 
-    try:
-        # Check for the latest timestamp in the patterns table
-        null_check = text(
-            """
-                SELECT MAX(last_seen) AS last_timestamp
-                FROM log_patterns;            """
-        )
+RANGE_FILTER = "AND log_id BETWEEN :start_log_id AND :end_log_id AND EXISTS (SELECT 1 FROM applied)"
 
-        last_time = None
-        with engine.begin() as conn:
-            result = conn.execute(null_check)
-            row = result.fetchone()
-            if row:
-                last_time = row[0]
 
-        # Build query based on whether we have a previous timestamp
-        if last_time:
-            query = text(
-                """
-                SELECT 
-                    concat_ws(' | ', l.source, l.level, l.message, l.parsed_data) AS merged_string,
-                    l.cluster_id,
-                    l.app_id,
-                    t.total_count
-                FROM logs l
-                JOIN (
-                    SELECT cluster_id, MIN(log_id) AS first_log, COUNT(*) AS total_count
-                    FROM logs
-                    GROUP BY cluster_id
-                    HAVING cluster_id IS NOT NULL
-                ) t
-                ON l.cluster_id = t.cluster_id AND l.log_id = t.first_log
-                WHERE l.timestamp > :last_time;
-                """
-            )
-            query_params = {"last_time": last_time}
-        else:
-            query = text(
-                """
-                SELECT 
-                    concat_ws(' | ', l.source, l.level, l.message, l.parsed_data) AS merged_string,
-                    l.cluster_id,
-                    l.app_id,
-                    t.total_count
-                FROM logs l
-                JOIN (
-                    SELECT cluster_id, MIN(log_id) AS first_log, COUNT(*) AS total_count
-                    FROM logs
-                    GROUP BY cluster_id
-                    HAVING cluster_id IS NOT NULL
-                ) t
-                ON l.cluster_id = t.cluster_id AND l.log_id = t.first_log;
-                """
-            )
-            query_params = {}
+def save_pattern(engine, templates=None, start_log_id=None, end_log_id=None):
+    """
+    Upserts one log_patterns row per cluster.
+    With a log_id range, only clusters with logs in that range are touched and
+    their incident_count / last_seen are bumped by the range's counts, so the
+    cost scales with the batch, not the logs table. Each range is added at most
+    once (log_pattern_ranges), so replaying a batch is safe. Without a range every
+    cluster is recounted over the whole table (e.g. after retraining).
+    templates: optional {cluster_id: mined template text}; used as log_template
+    instead of the raw first-log string for the clusters it covers.
+    Returns the number of upserted patterns.
+    """
+    templates = templates or {}
+    incremental = start_log_id is not None and end_log_id is not None
 
-        # Insert log patterns into the log_patterns table
-        insert_pattern_query = text(
-            """
-            INSERT INTO log_patterns (
-                app_id, log_template, incident_count, cluster_id
-            )
-            VALUES (
-                :app_id, 
-                :log_template, 
-                :incident_count, 
-                :cluster_id
-            )
-            """
+    query = text(
+        UPSERT_PATTERNS_SQL.format(
+            applied_cte=APPLIED_RANGE_CTE if incremental else "",
+            range_filter=RANGE_FILTER if incremental else "",
+            count_update=(
+                "log_patterns.incident_count + EXCLUDED.incident_count"
+                if incremental
+                else "EXCLUDED.incident_count"
+            ),
         )
+    )
+    params = {
+        "template_clusters": [int(cluster_id) for cluster_id in templates],
+        "template_texts": list(templates.values()),
+    }
+    if incremental:
+        params.update(start_log_id=int(start_log_id), end_log_id=int(end_log_id))
 
+    try:
         with engine.begin() as conn:
-            # Step A: Fetch all pattern data
-            result = conn.execute(query, query_params)
-            rows = result.fetchall()
-
-            print(f"Fetched {len(rows)} distinct log patterns.")
-
-            # Step B: Prepare parameters for bulk insertion
-            insert_params = [
-                {
-                    "app_id": row[2],
-                    "log_template": row[0],
-                    "incident_count": row[3],
-                    "cluster_id": row[1],
-                }
-                for row in rows
-            ]
-
-            # Step C: Execute insertion
-            if insert_params:
-                conn.execute(insert_pattern_query, insert_params)
-                print(f"Inserted/updated {len(insert_params)} log patterns.")
-
+            upserted = conn.execute(query, params).rowcount
+        metrics.inc("db_rows_written_total", upserted, table="log_patterns")
+        scope = f"logs {start_log_id}-{end_log_id}" if incremental else "all logs"
+        print(f"Upserted {upserted} log patterns ({scope}).")
+        return upserted
     except Exception as e:
         print(f"Error in save_pattern: {e}")
+        return 0
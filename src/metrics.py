@@ -0,0 +1,213 @@
+"""
+Process-wide stage timings and counters.
+
+Disabled by default: timer() then returns a shared no-op context manager and
+inc()/observe() return immediately, so instrumented code costs one global
+lookup per call. Scripts call enable() (METRICS_DIR) and write_batch_metrics()
+at the end of each batch.
+
+    with metrics.timer("embedding_seconds"):
+        ...
+    metrics.inc("db_rows_written_total", n, table="logs")
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Upper bounds (seconds) of the duration histogram buckets; +Inf is implicit
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+
+PROMETHEUS_FILE = "logstream.prom"
+
+_NULL_TIMER = nullcontext()
+_enabled = False
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the +Inf bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "min": round(self.min, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+            "p50": round(self.quantile(0.5), 6),
+            "p95": round(self.quantile(0.95), 6),
+        }
+
+
+class _Timer:
+    __slots__ = ("key", "start")
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def _observe(key, value):
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def timer(name, **labels):
+    """Context manager recording the block's duration (seconds) in histogram `name`."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(_key(name, labels))
+
+
+def observe(name, value, **labels):
+    if not _enabled:
+        return
+    _observe(_key(name, labels), value)
+
+
+def inc(name, value=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _label_str(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _json_name(name, labels):
+    return name + _label_str(labels)
+
+
+def summary():
+    """{"counters": {...}, "histograms": {name: count/sum/mean/min/max/p50/p95}}"""
+    with _lock:
+        return {
+            "counters": {_json_name(*key): value for key, value in sorted(_counters.items())},
+            "histograms": {
+                _json_name(*key): histogram.as_dict()
+                for key, histogram in sorted(_histograms.items())
+            },
+        }
+
+
+def render_prometheus():
+    """Current metrics in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name in typed:
+            return
+        typed.add(name)
+        lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_label_str(labels)} {value}")
+        for (name, labels), histogram in sorted(_histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, histogram.counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_label_str(labels, [('le', repr(bound))])} {cumulative}")
+            lines.append(f"{name}_bucket{_label_str(labels, [('le', '+Inf')])} {histogram.count}")
+            lines.append(f"{name}_sum{_label_str(labels)} {histogram.sum!r}")
+            lines.append(f"{name}_count{_label_str(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path, content):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def write_batch_metrics(directory, batch_id):
+    """
+    Writes batch_<id>.json (summary) and logstream.prom (for the node_exporter
+    textfile collector, replaced atomically), then resets every metric so the
+    next batch starts from zero. No-op while disabled.
+    Returns the summary dict, or None.
+    """
+    if not _enabled:
+        return None
+    result = {"batch_id": str(batch_id), **summary()}
+    os.makedirs(directory, exist_ok=True)
+    _write_atomic(os.path.join(directory, f"batch_{batch_id}.json"), json.dumps(result, indent=2))
+    _write_atomic(os.path.join(directory, PROMETHEUS_FILE), render_prometheus())
+    print(f"Wrote batch metrics to {directory}")
+    reset()
+    return result
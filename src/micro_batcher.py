@@ -0,0 +1,107 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MicroBatcher:
+    def __init__(self, handler, max_batch_size=64, max_wait_ms=10.0):
+        """
+        Coalesces concurrent asyncio callers into one handler call.
+        The first waiting request opens a batch; it is flushed once it holds
+        `max_batch_size` items or `max_wait_ms` after it was opened, whichever
+        comes first. Requests arriving while a batch is being handled queue up
+        for the next one, so batches grow with load.
+        :param handler: fn(items) -> results (same length and order). Runs in a
+                        single worker thread, one batch at a time, so it may
+                        use state that is not thread-safe (e.g. a vector engine).
+        :param max_wait_ms: 0 flushes whatever is waiting without delay.
+        """
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="micro-batch")
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.handler_secs = 0.0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, items):
+        """Queues a request's items and waits for their results (a list)."""
+        items = list(items)
+        if not items:
+            return []
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((items, future))
+        return await future
+
+    async def _collect(self):
+        # A single request larger than max_batch_size is still handled whole
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    entry = self._queue.get_nowait()
+                else:
+                    entry = await asyncio.wait_for(self._queue.get(), remaining)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(entry)
+            size += len(entry[0])
+        return batch, size
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch, size = await self._collect()
+            items = [item for request_items, _ in batch for item in request_items]
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.handler, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.handler_secs += time.perf_counter() - start
+
+            self.batches += 1
+            self.items += size
+            self.largest_batch = max(self.largest_batch, size)
+            offset = 0
+            for request_items, future in batch:
+                # The caller may have gone away (client disconnect / cancelled)
+                if not future.done():
+                    future.set_result(results[offset : offset + len(request_items)])
+                offset += len(request_items)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "handler_secs": round(self.handler_secs, 3),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
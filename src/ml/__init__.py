@@ -1,4 +1,53 @@
-from src.ml.pipeline import get_text_embedding, build_feature_dict, create_streaming_pipeline
-from src.ml.model import create_new_model, save_model, load_model
-from src.ml.vector_engine import SemanticVectorEngine
-from src.ml.volume_analyzer import VolumeAnomalyDetector
+"""
+ML entry points. Submodules are imported on first attribute access (PEP 562),
+so e.g. `from src.ml import VolumeAnomalyDetector` does not import torch,
+sentence-transformers or river.
+"""
+import importlib
+
+_EXPORTS = {
+    "build_log_text": "src.ml.pipeline",
+    "get_embedding_backend": "src.ml.pipeline",
+    "get_text_embedding": "src.ml.pipeline",
+    "get_text_embeddings": "src.ml.pipeline",
+    "embed_and_group": "src.ml.pipeline",
+    "build_feature_dict": "src.ml.pipeline",
+    "create_streaming_pipeline": "src.ml.pipeline",
+    "create_new_model": "src.ml.model",
+    "save_model": "src.ml.model",
+    "load_model": "src.ml.model",
+    "ModelSnapshot": "src.ml.model",
+    "SnapshotWatcher": "src.ml.model",
+    "save_snapshot": "src.ml.model",
+    "load_snapshot": "src.ml.model",
+    "promote_snapshot": "src.ml.model",
+    "InferencePlan": "src.ml.inference_plan",
+    "compile_inference_plan": "src.ml.inference_plan",
+    "SemanticVectorEngine": "src.ml.vector_engine",
+    "CentroidStore": "src.ml.centroid_store",
+    "ShardPool": "src.ml.sharding",
+    "EmbeddingCache": "src.ml.embedding_cache",
+    "make_backend": "src.ml.embedding_backends",
+    "compare_embeddings": "src.ml.embedding_backends",
+    "TemplateMiner": "src.ml.template_miner",
+    "TEMPLATE_FILE": "src.ml.template_miner",
+    "VolumeAnomalyDetector": "src.ml.volume_analyzer",
+    "EWMAVolumeDetector": "src.ml.volume_analyzer",
+    "VolumeWindow": "src.ml.volume_window",
+    "TrainingStaging": "src.ml.training_staging",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,293 @@
+import os
+import joblib
+import numpy as np
+
+# Default file name, saved next to vector_centroids.pkl
+INDEX_FILE = "vector_index.pkl"
+
+
+def _nearest_l2(vectors, centers):
+    """Index of the closest center (squared euclidean) for every row of `vectors`."""
+    dots = vectors @ centers.T
+    sq = np.einsum("ij,ij->i", centers, centers)
+    return np.argmin(sq[None, :] - 2.0 * dots, axis=1)
+
+
+def _kmeans(vectors, k, n_iter=10, seed=42):
+    """Plain Lloyd's k-means used to train the IVF coarse quantizer."""
+    rng = np.random.default_rng(seed)
+    centers = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = _nearest_l2(vectors, centers)
+        order = np.argsort(assign, kind="stable")
+        labels, starts, counts = np.unique(
+            assign[order], return_index=True, return_counts=True
+        )
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        # Empty lists keep their previous center
+        centers[labels] = sums / counts[:, None]
+
+    return centers
+
+
+class ExactIndex:
+    """Brute-force scan over every centroid. Reference for recall measurements."""
+
+    name = "exact"
+    exact = True
+
+    def __init__(self):
+        self.n_rows = 0
+
+    def rebuild(self, matrix):
+        self.n_rows = len(matrix)
+
+    def add(self, vectors, rows, matrix=None):
+        self.n_rows = max(self.n_rows, int(rows[-1]) + 1) if len(rows) else self.n_rows
+
+    def update(self, vectors, rows):
+        pass
+
+    def search(self, queries):
+        all_rows = np.arange(self.n_rows)
+        return [all_rows for _ in range(len(queries))]
+
+
+class IVFIndex:
+    """
+    Inverted-file index: a k-means coarse quantizer splits the centroids into
+    `n_lists` buckets and a query only scans its `n_probe` closest buckets.
+    :param n_lists: Number of coarse buckets. None = sqrt(n_centroids) at training time.
+    :param n_probe: Buckets scanned per query. Higher = better recall, slower search.
+    :param min_train_size: Below this many centroids the index just scans everything.
+    """
+
+    name = "ivf"
+    exact = False
+    # row -> list, built on the first update() (indexes pickled before it lack it)
+    _row_lists = None
+
+    def __init__(self, n_lists=None, n_probe=8, min_train_size=1024, seed=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.seed = seed
+
+        self.coarse_centers = None
+        self.lists = []
+        self.n_rows = 0
+        self._trained_rows = 0
+        self._list_arrays = None
+
+    def rebuild(self, matrix):
+        self.coarse_centers = None
+        self.lists = []
+        self.n_rows = 0
+        self._trained_rows = 0
+        self._list_arrays = None
+        self._row_lists = None
+        if len(matrix):
+            self.add(matrix, np.arange(len(matrix)), matrix=matrix)
+
+    def _train(self, matrix):
+        n = len(matrix)
+        k = self.n_lists or max(1, int(np.sqrt(n)))
+        k = min(k, n)
+        rng = np.random.default_rng(self.seed)
+        sample = matrix if n <= 50_000 else matrix[rng.choice(n, 50_000, replace=False)]
+
+        self.coarse_centers = _kmeans(np.asarray(sample, dtype=np.float32), k, seed=self.seed)
+        assign = _nearest_l2(np.asarray(matrix, dtype=np.float32), self.coarse_centers)
+        self.lists = [[] for _ in range(k)]
+        for row, lst in enumerate(assign):
+            self.lists[lst].append(row)
+        self._trained_rows = n
+        self._list_arrays = None
+        self._row_lists = None
+
+    def add(self, vectors, rows, matrix=None):
+        """
+        Inserts new centroid rows. `matrix` is the engine's full centroid matrix;
+        it is only needed when the quantizer has to be (re)trained, which happens
+        once min_train_size is reached and again whenever the index doubles in size.
+        """
+        self.n_rows = max(self.n_rows, int(rows[-1]) + 1) if len(rows) else self.n_rows
+
+        needs_training = self.coarse_centers is None or self.n_rows >= 2 * self._trained_rows
+        if needs_training and self.n_rows >= self.min_train_size and matrix is not None:
+            self._train(matrix[: self.n_rows])
+            return
+
+        if self.coarse_centers is not None:
+            assign = _nearest_l2(np.asarray(vectors, dtype=np.float32), self.coarse_centers)
+            for row, lst in zip(rows, assign):
+                self.lists[lst].append(int(row))
+                if self._row_lists is not None:
+                    self._row_lists[int(row)] = int(lst)
+            self._list_arrays = None
+
+    def update(self, vectors, rows):
+        """Moves existing rows whose vectors changed (drifted centroids) to their new bucket."""
+        if self.coarse_centers is None or not len(rows):
+            return
+        if self._row_lists is None:
+            self._row_lists = {row: lst for lst, members in enumerate(self.lists) for row in members}
+        assign = _nearest_l2(np.asarray(vectors, dtype=np.float32), self.coarse_centers)
+        for row, lst in zip(rows, assign):
+            row, lst = int(row), int(lst)
+            old = self._row_lists.get(row)
+            if old == lst:
+                continue
+            if old is not None:
+                self.lists[old].remove(row)
+            self.lists[lst].append(row)
+            self._row_lists[row] = lst
+            self._list_arrays = None
+
+    def search(self, queries):
+        if self.coarse_centers is None:
+            # Not trained yet: behave like the exact scan
+            all_rows = np.arange(self.n_rows)
+            return [all_rows for _ in range(len(queries))]
+
+        if self._list_arrays is None:
+            self._list_arrays = [np.asarray(lst, dtype=np.int64) for lst in self.lists]
+
+        n_probe = min(self.n_probe, len(self.coarse_centers))
+        dots = queries @ self.coarse_centers.T
+        sq = np.einsum("ij,ij->i", self.coarse_centers, self.coarse_centers)
+        probes = np.argpartition(sq[None, :] - 2.0 * dots, n_probe - 1, axis=1)[:, :n_probe]
+
+        return [
+            np.sort(np.concatenate([self._list_arrays[lst] for lst in probe]))
+            for probe in probes
+        ]
+
+
+class LSHIndex:
+    """
+    Random-projection (sign) LSH. Each of `n_tables` tables hashes a vector to
+    `n_bits` hyperplane signs; a query scans the union of its buckets.
+    More tables or fewer bits = better recall, larger candidate sets.
+    """
+
+    name = "lsh"
+    exact = False
+    # row -> bucket key per table, built on the first update()
+    _row_keys = None
+
+    def __init__(self, n_tables=8, n_bits=12, seed=42):
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.seed = seed
+
+        self.planes = None
+        self.tables = [{} for _ in range(n_tables)]
+        self.n_rows = 0
+        self._powers = 1 << np.arange(n_bits, dtype=np.int64)
+
+    def _hash(self, vectors):
+        if self.planes is None:
+            rng = np.random.default_rng(self.seed)
+            dim = vectors.shape[1]
+            self.planes = rng.standard_normal((self.n_tables, dim, self.n_bits)).astype(
+                np.float32
+            )
+        # (n_tables, n_vectors) bucket keys
+        bits = np.einsum("nd,tdb->tnb", vectors, self.planes) > 0
+        return bits.astype(np.int64) @ self._powers
+
+    def rebuild(self, matrix):
+        self.tables = [{} for _ in range(self.n_tables)]
+        self.n_rows = 0
+        self._row_keys = None
+        if len(matrix):
+            self.add(matrix, np.arange(len(matrix)))
+
+    def add(self, vectors, rows, matrix=None):
+        if not len(rows):
+            return
+        keys = self._hash(np.asarray(vectors, dtype=np.float32))
+        for t, table in enumerate(self.tables):
+            for row, key in zip(rows, keys[t]):
+                table.setdefault(int(key), []).append(int(row))
+                if self._row_keys is not None:
+                    self._row_keys.setdefault(int(row), [None] * self.n_tables)[t] = int(key)
+        self.n_rows = max(self.n_rows, int(rows[-1]) + 1)
+
+    def update(self, vectors, rows):
+        """Moves existing rows whose vectors changed (drifted centroids) to their new buckets."""
+        if not len(rows) or self.n_rows == 0:
+            return
+        if self._row_keys is None:
+            self._row_keys = {}
+            for t, table in enumerate(self.tables):
+                for key, bucket in table.items():
+                    for row in bucket:
+                        self._row_keys.setdefault(row, [None] * self.n_tables)[t] = key
+        keys = self._hash(np.asarray(vectors, dtype=np.float32))
+        for t, table in enumerate(self.tables):
+            for row, key in zip(rows, keys[t]):
+                row, key = int(row), int(key)
+                row_keys = self._row_keys.setdefault(row, [None] * self.n_tables)
+                old = row_keys[t]
+                if old == key:
+                    continue
+                if old is not None:
+                    bucket = table[old]
+                    bucket.remove(row)
+                    if not bucket:
+                        del table[old]
+                table.setdefault(key, []).append(row)
+                row_keys[t] = key
+
+    def search(self, queries):
+        if self.n_rows == 0:
+            return [np.empty(0, dtype=np.int64) for _ in range(len(queries))]
+
+        keys = self._hash(np.asarray(queries, dtype=np.float32))
+        results = []
+        for i in range(len(queries)):
+            rows = set()
+            for t, table in enumerate(self.tables):
+                rows.update(table.get(int(keys[t, i]), ()))
+            results.append(np.fromiter(sorted(rows), dtype=np.int64, count=len(rows)))
+        return results
+
+
+INDEX_TYPES = {"exact": ExactIndex, "ivf": IVFIndex, "lsh": LSHIndex}
+
+
+def make_index(index="exact", **params):
+    """Builds an index backend from its name, or passes an existing instance through."""
+    if not isinstance(index, str):
+        return index
+    if index not in INDEX_TYPES:
+        raise ValueError(f"Unknown centroid index: {index}")
+    return INDEX_TYPES[index](**params)
+
+
+def save_index(index, filepath):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    joblib.dump(index, filepath)
+    print(f"Saved {index.name} centroid index ({index.n_rows} rows) to {filepath}")
+
+
+def load_index(filepath):
+    if os.path.exists(filepath):
+        index = joblib.load(filepath)
+        print(f"Loaded {index.name} centroid index ({index.n_rows} rows) from {filepath}")
+        return index
+    return None
+
+
+def measure_recall(engine, queries):
+    """
+    Fraction of queries for which the engine's approximate index returns the
+    same nearest centroid as an exact scan. Read-only: no centroids are added.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact_idx, _ = engine._nearest(queries, engine.centroid_matrix)
+    approx_idx, _ = engine._nearest_existing(queries)
+    return float(np.mean(exact_idx == approx_idx)) if len(queries) else 1.0
@@ -0,0 +1,252 @@
+import json
+import os
+
+import numpy as np
+
+CENTROIDS_FILE = "centroids.npy"
+CENTROID_IDS_FILE = "centroid_ids.json"
+# (n, 3) float64: hits, last_seen, weight per centroid row
+CENTROID_STATS_FILE = "centroid_stats.npy"
+
+STORAGE_DTYPES = ("float32", "float16")
+
+# Spare rows written after the used ones so a copy-on-write mapping can take
+# new centroids without copying the whole matrix (at least MIN_HEADROOM rows)
+HEADROOM = 0.25
+MIN_HEADROOM = 1024
+
+
+class CentroidStore:
+    def __init__(self, dtype="float32", capacity=1024):
+        """
+        Centroid vectors in one growable (capacity, dim) matrix plus an id -> row index.
+        :param dtype: Storage type, "float32" or "float16" (half the memory; callers
+                      get float32 copies via rows()/block() for distance maths).
+        :param capacity: Initial number of rows allocated on the first append.
+        """
+        if np.dtype(dtype).name not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported centroid storage dtype: {dtype}")
+        self.dtype = np.dtype(dtype)
+        self.ids = []
+        self.index = {}
+        self._initial_capacity = capacity
+        self._data = None
+        # Usage per row (see touch()): hits, last_seen tick, weight as of last_seen
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.last_seen = np.zeros(0, dtype=np.float64)
+        self.weight = np.zeros(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def capacity(self):
+        return 0 if self._data is None else len(self._data)
+
+    @property
+    def nbytes(self):
+        return 0 if self._data is None else self._data[: len(self)].nbytes
+
+    @property
+    def matrix(self):
+        """Used rows in storage dtype (a view, no copy)."""
+        if self._data is None:
+            return np.empty((0, 0), dtype=self.dtype)
+        return self._data[: len(self)]
+
+    def _reserve(self, needed, dim):
+        if self._data is None:
+            self._data = np.empty((max(needed, self._initial_capacity), dim), dtype=self.dtype)
+        elif needed > len(self._data) or not self._data.flags.writeable:
+            # Full (or a read-only mapping): move to private memory, doubling capacity
+            grown = np.empty((max(needed, 2 * len(self._data)), dim), dtype=self.dtype)
+            grown[: len(self)] = self._data[: len(self)]
+            self._data = grown
+
+        if needed > len(self.hits):
+            extra = max(needed, 2 * len(self.hits)) - len(self.hits)
+            self.hits = np.concatenate([self.hits, np.zeros(extra, dtype=np.int64)])
+            self.last_seen = np.concatenate([self.last_seen, np.zeros(extra)])
+            self.weight = np.concatenate([self.weight, np.zeros(extra)])
+
+    def append(self, ids, vectors, now=0.0):
+        """Adds rows for `ids` (each counted as one hit at tick `now`) and returns their row numbers."""
+        vectors = np.asarray(vectors).reshape(len(ids), -1)
+        start = len(self.ids)
+        needed = start + len(ids)
+        self._reserve(needed, vectors.shape[1])
+        self._data[start:needed] = vectors
+        self.hits[start:needed] = 1
+        self.last_seen[start:needed] = now
+        self.weight[start:needed] = 1.0
+        for offset, sem_id in enumerate(ids):
+            self.index[sem_id] = start + offset
+        self.ids.extend(ids)
+        return np.arange(start, needed)
+
+    def update(self, rows, vectors):
+        """Overwrites the vectors of existing rows (a read-only mapping is copied first)."""
+        self._reserve(len(self), self._data.shape[1])
+        self._data[rows] = vectors
+
+    def decayed_weights(self, now, half_life=None):
+        """Weight of every row at tick `now`; halves every `half_life` ticks (None = no decay)."""
+        n = len(self)
+        if half_life is None:
+            return self.weight[:n].copy()
+        return self.weight[:n] * np.exp2(-(now - self.last_seen[:n]) / half_life)
+
+    def touch(self, rows, counts, now, half_life=None):
+        """Records `counts` hits on each of `rows` (unique) at tick `now`."""
+        if len(rows) == 0:
+            return
+        weight = self.weight[rows]
+        if half_life is not None:
+            weight = weight * np.exp2(-(now - self.last_seen[rows]) / half_life)
+        self.weight[rows] = weight + counts
+        self.hits[rows] += counts
+        self.last_seen[rows] = now
+
+    def remove(self, rows):
+        """
+        Drops `rows` and compacts the rest into new private memory (order kept).
+        Returns the old -> new row mapping (-1 for removed rows).
+        """
+        n = len(self)
+        keep = np.ones(n, dtype=bool)
+        keep[rows] = False
+        mapping = np.full(n, -1, dtype=np.int64)
+        mapping[keep] = np.arange(int(keep.sum()))
+
+        self._data = self._data[:n][keep]
+        self.hits = self.hits[:n][keep]
+        self.last_seen = self.last_seen[:n][keep]
+        self.weight = self.weight[:n][keep]
+        self.ids = [sem_id for sem_id, kept in zip(self.ids, keep) if kept]
+        self.index = {sem_id: row for row, sem_id in enumerate(self.ids)}
+        if not self.ids:
+            self._data = None
+        return mapping
+
+    def row_of(self, sem_id):
+        return self.index.get(sem_id)
+
+    def rows(self, rows):
+        """float32 copy of the given rows."""
+        return self._data[rows].astype(np.float32, copy=False)
+
+    def block(self, start, stop):
+        """float32 rows [start, stop); a view when stored as float32."""
+        if self._data is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._data[start:stop].astype(np.float32, copy=False)
+
+    def save(self, directory):
+        """
+        Writes centroids.npy (used rows + headroom, in storage dtype),
+        centroid_ids.json and centroid_stats.npy. Files are replaced atomically,
+        so processes that still map the old file keep a consistent view.
+        """
+        os.makedirs(directory, exist_ok=True)
+        matrix_path = os.path.join(directory, CENTROIDS_FILE)
+        ids_path = os.path.join(directory, CENTROID_IDS_FILE)
+        stats_path = os.path.join(directory, CENTROID_STATS_FILE)
+
+        n = len(self)
+        dim = self._data.shape[1] if self._data is not None else 0
+        capacity = n + max(MIN_HEADROOM, int(n * HEADROOM)) if dim else 0
+
+        # open_memmap extends the file with a seek, so the headroom stays sparse on disk
+        tmp_matrix = matrix_path + ".tmp"
+        out = np.lib.format.open_memmap(tmp_matrix, mode="w+", dtype=self.dtype, shape=(capacity, dim))
+        if n:
+            out[:n] = self._data[:n]
+        out.flush()
+        del out
+
+        with open(stats_path + ".tmp", "wb") as f:
+            np.save(f, np.column_stack([self.hits[:n], self.last_seen[:n], self.weight[:n]]))
+        with open(ids_path + ".tmp", "w") as f:
+            json.dump(self.ids, f)
+        os.replace(tmp_matrix, matrix_path)
+        os.replace(stats_path + ".tmp", stats_path)
+        os.replace(ids_path + ".tmp", ids_path)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="c"):
+        """
+        Maps a saved store, or returns None if `directory` has none.
+        :param mmap_mode: "c" (default) shares the file's pages between processes
+                          and keeps appends private; "r" is read-only (the first
+                          append copies); None reads everything into memory.
+        """
+        saved = open_centroids(directory)
+        if saved is None:
+            return None
+        ids, f, stats = saved
+        with f:
+            return cls.from_file(ids, f, stats, mmap_mode)
+
+    @classmethod
+    def from_file(cls, ids, f, stats=None, mmap_mode="c"):
+        """Store over an open centroids.npy handle and its stats (see open_centroids)."""
+        f.seek(0)
+        if mmap_mode is None:
+            data = np.load(f)
+        else:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if fortran_order:
+                raise ValueError("centroids.npy must be C-ordered")
+            if np.prod(shape) == 0:
+                data = np.empty(shape, dtype=dtype)
+            else:
+                data = np.memmap(f, dtype=dtype, mode=mmap_mode, offset=f.tell(), shape=shape)
+
+        store = cls(dtype=data.dtype)
+        store.ids = list(ids)
+        store.index = {sem_id: row for row, sem_id in enumerate(store.ids)}
+        store._data = data if data.size else None
+        store._set_stats(stats)
+        return store
+
+    def _set_stats(self, stats):
+        n = len(self)
+        if stats is None or len(stats) != n:
+            # Saved without usage stats: every centroid counts as one hit at tick 0
+            stats = np.column_stack([np.ones(n), np.zeros(n), np.ones(n)])
+        self.hits = stats[:, 0].astype(np.int64)
+        self.last_seen = stats[:, 1].astype(np.float64)
+        self.weight = stats[:, 2].astype(np.float64)
+
+    @classmethod
+    def from_arrays(cls, ids, matrix, dtype="float32", stats=None):
+        """
+        Store holding copies of `matrix` rows.
+        :param stats: Optional (n, 3) hits/last_seen/weight rows, as in centroid_stats.npy.
+        """
+        store = cls(dtype=dtype, capacity=max(len(ids), 1024))
+        if len(ids):
+            store.append(list(ids), matrix)
+            if stats is not None:
+                store._set_stats(np.asarray(stats, dtype=np.float64))
+        return store
+
+
+def open_centroids(directory):
+    """
+    (ids, open centroids.npy handle, stats) of a saved store, or None. Mappings
+    made from the handle keep reading this version even after the directory is
+    renamed or its files are replaced. stats is None for stores saved without it.
+    """
+    ids_path = os.path.join(directory, CENTROID_IDS_FILE)
+    if not os.path.exists(ids_path):
+        return None
+    with open(ids_path) as f:
+        ids = json.load(f)
+    stats_path = os.path.join(directory, CENTROID_STATS_FILE)
+    stats = np.load(stats_path) if os.path.exists(stats_path) else None
+    return ids, open(os.path.join(directory, CENTROIDS_FILE), "rb"), stats
@@ -0,0 +1,235 @@
+import os
+import numpy as np
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+# Exported ONNX graphs + tokenizer files (see scripts/export_onnx_embedding.py)
+ONNX_DIR = "scripts/models/onnx"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+# Same truncation as the SentenceTransformer config of all-MiniLM-L6-v2
+MAX_SEQ_LENGTH = 256
+
+
+def length_buckets(lengths, batch_size):
+    """
+    Splits row indices into batches of similar sequence length (longest first),
+    so every batch is only padded up to its own longest row.
+    """
+    order = np.argsort(-np.asarray(lengths), kind="stable")
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def l2_normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def compare_embeddings(reference, candidate):
+    """
+    Row-wise cosine similarity between two (n, dim) embedding matrices of the
+    same texts. Returns {"mean": .., "min": .., "p01": ..}.
+    """
+    reference = l2_normalize(np.asarray(reference, dtype=np.float32))
+    candidate = l2_normalize(np.asarray(candidate, dtype=np.float32))
+    cosine = np.einsum("ij,ij->i", reference, candidate)
+    return {
+        "mean": float(cosine.mean()),
+        "min": float(cosine.min()),
+        "p01": float(np.percentile(cosine, 1)),
+    }
+
+
+class SentenceTransformerBackend:
+    name = "sentence-transformers"
+
+    def __init__(self, model_name=DEFAULT_MODEL, device="cpu"):
+        """
+        The current fp32 torch model. The model is loaded on the first encode.
+        :param model_name: SentenceTransformer name or local path.
+        """
+        self.model_name = model_name
+        self.device = device
+        self.cache_key = model_name
+        self._model = None
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.model_name, device=self.device)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._load()
+        return self._model
+
+    def encode(self, texts, batch_size=64):
+        # SentenceTransformer.encode already sorts texts by length before batching
+        vectors = self.model.encode(
+            list(texts),
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+        return vectors.astype(np.float32, copy=False)
+
+
+class Int8Backend(SentenceTransformerBackend):
+    name = "int8"
+
+    def __init__(self, model_name=DEFAULT_MODEL, device="cpu"):
+        """
+        Same model with every nn.Linear dynamically quantised to int8
+        (weights int8, activations quantised per batch). CPU only.
+        """
+        super().__init__(model_name, device="cpu")
+        self.cache_key = f"{model_name}:int8"
+
+    def _load(self):
+        import torch
+
+        model = super()._load()
+        transformer = model[0]
+        transformer.auto_model = torch.ao.quantization.quantize_dynamic(
+            transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return model
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_dir=ONNX_DIR,
+        quantized=False,
+        model_name=DEFAULT_MODEL,
+        max_seq_length=MAX_SEQ_LENGTH,
+        num_threads=None,
+    ):
+        """
+        ONNX Runtime inference of an exported transformer, with the mean pooling
+        and normalisation of the SentenceTransformer pipeline done in numpy.
+        :param model_dir: Directory written by export_onnx().
+        :param quantized: Use the int8 graph (model_int8.onnx) instead of fp32.
+        :param num_threads: Intra-op threads of the session (None = ONNX Runtime default).
+        """
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.max_seq_length = max_seq_length
+        self.num_threads = num_threads
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.cache_key = f"{model_name}:{self.name}"
+        self._session = None
+        self._tokenizer = None
+        self._input_names = None
+        self._dim = None
+
+    def _load(self):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = os.path.join(self.model_dir, ONNX_INT8_FILE if self.quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"No ONNX model at {path}. Export one with scripts/export_onnx_embedding.py"
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        # Hidden size; only the batch and sequence axes are dynamic in the export
+        self._dim = self._session.get_outputs()[0].shape[-1]
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+
+    def _run(self, token_ids):
+        """Pads one bucket of token id lists and returns pooled, normalised vectors."""
+        lengths = np.fromiter((len(ids) for ids in token_ids), dtype=np.int64, count=len(token_ids))
+        input_ids = np.full((len(token_ids), lengths.max()), self._tokenizer.pad_token_id, dtype=np.int64)
+        for row, ids in enumerate(token_ids):
+            input_ids[row, : len(ids)] = ids
+        attention_mask = (np.arange(input_ids.shape[1]) < lengths[:, None]).astype(np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self._session.run(None, feeds)[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return l2_normalize(pooled).astype(np.float32, copy=False)
+
+    def encode(self, texts, batch_size=64):
+        if self._session is None:
+            self._load()
+        texts = list(texts)
+        result = np.empty((len(texts), self._dim), dtype=np.float32)
+        if not texts:
+            return result
+        token_ids = self._tokenizer(
+            texts, truncation=True, max_length=self.max_seq_length
+        )["input_ids"]
+        for rows in length_buckets([len(ids) for ids in token_ids], batch_size):
+            result[rows] = self._run([token_ids[r] for r in rows])
+        return result
+
+
+BACKEND_TYPES = ("sentence-transformers", "int8", "onnx", "onnx-int8")
+
+
+def make_backend(name, **kwargs):
+    """Builds an embedding backend by name (see BACKEND_TYPES)."""
+    if name == "sentence-transformers":
+        return SentenceTransformerBackend(**kwargs)
+    if name == "int8":
+        return Int8Backend(**kwargs)
+    if name == "onnx":
+        return OnnxBackend(quantized=False, **kwargs)
+    if name == "onnx-int8":
+        return OnnxBackend(quantized=True, **kwargs)
+    raise ValueError(f"Unknown embedding backend: {name} (expected one of {BACKEND_TYPES})")
+
+
+def export_onnx(model_name=DEFAULT_MODEL, output_dir=ONNX_DIR, quantize=True, opset=17):
+    """
+    Exports the transformer of a SentenceTransformer model to ONNX (plus its
+    tokenizer) for OnnxBackend. With `quantize`, also writes a dynamically
+    int8-quantised copy of the graph. Needs torch, onnx and onnxruntime.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    transformer = SentenceTransformer(model_name, device="cpu")[0]
+    hf_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+
+    dummy = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names + ["last_hidden_state"]}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            tuple(dummy[n] for n in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(output_dir)
+    print(f"Exported {model_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, ONNX_INT8_FILE)
+        quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Wrote int8 model to {int8_path}")
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from src import metrics
+
+# Default location; kept outside models/production so blue/green swaps don't wipe it
+CACHE_DIR = "scripts/models/embedding_cache"
+
+EMBEDDINGS_FILE = "embeddings.npy"
+KEYS_FILE = "keys.npy"
+LAST_USED_FILE = "last_used.npy"
+META_FILE = "meta.json"
+
+KEY_BYTES = 16
+KEY_WORDS = KEY_BYTES // 8
+
+# Bumped when the on-disk layout changes; older caches are reset
+DISK_FORMAT = 2
+
+
+def normalize_text(text):
+    """Whitespace-insensitive form of a log text. MiniLM tokenises on whitespace, so
+    texts that differ only in spacing produce the same embedding."""
+    return " ".join(str(text).split())
+
+
+def text_key(text):
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+def _vector_check(vector):
+    """Checksum word stored next to a slot's key, so a torn or foreign write is detected."""
+    digest = hashlib.blake2b(np.ascontiguousarray(vector, dtype=np.float32).tobytes(), digest_size=8)
+    return np.frombuffer(digest.digest(), dtype=np.uint64)[0]
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        directory=None,
+        max_memory_items=50_000,
+        max_disk_items=500_000,
+        dim=384,
+        model_name="all-MiniLM-L6-v2",
+    ):
+        """
+        Two-tier cache of text embeddings keyed by a hash of the normalised text.
+        Each disk slot stores its key and a vector checksum next to the vector and
+        is verified on read, so a crashed run or another process sharing the
+        directory can cost hits but never returns another text's vector.
+        :param directory: Where the on-disk tier lives. None = memory only.
+        :param max_memory_items: Size cap of the in-process LRU tier.
+        :param max_disk_items: Size cap (rows) of the memory-mapped disk tier.
+        :param model_name: Stored with the disk tier; a different model invalidates it.
+        """
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.dim = dim
+        self.model_name = model_name
+
+        self._memory = OrderedDict()
+
+        # Disk tier: fixed-capacity memmap + slot bookkeeping
+        self._disk_vectors = None
+        self._disk_keys = None
+        self._disk_last_used = None
+        self._slots = {}
+        self._free_slots = []
+        self._clock = 0
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        if directory:
+            self._open_disk_tier()
+
+    # ── Disk tier ─────────────────────────────────────────────────────────────
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open_disk_tier(self):
+        os.makedirs(self.directory, exist_ok=True)
+        meta = {
+            "model": self.model_name,
+            "dim": self.dim,
+            "capacity": self.max_disk_items,
+            "format": DISK_FORMAT,
+        }
+
+        existing = None
+        if os.path.exists(self._path(META_FILE)):
+            with open(self._path(META_FILE)) as f:
+                existing = json.load(f)
+
+        complete = all(
+            os.path.exists(self._path(name)) for name in (EMBEDDINGS_FILE, KEYS_FILE, LAST_USED_FILE)
+        )
+        if existing != meta or not complete:
+            if existing is not None:
+                print(f"Embedding cache at {self.directory} is for {existing}. Resetting.")
+            self._disk_vectors = np.lib.format.open_memmap(
+                self._path(EMBEDDINGS_FILE),
+                mode="w+",
+                dtype=np.float32,
+                shape=(self.max_disk_items, self.dim),
+            )
+            # Key words + vector checksum per slot, written right after the vector
+            self._disk_keys = np.lib.format.open_memmap(
+                self._path(KEYS_FILE),
+                mode="w+",
+                dtype=np.uint64,
+                shape=(self.max_disk_items, KEY_WORDS + 1),
+            )
+            self._disk_last_used = np.zeros(self.max_disk_items, dtype=np.int64)
+            with open(self._path(LAST_USED_FILE), "wb") as f:
+                np.save(f, self._disk_last_used)
+            with open(self._path(META_FILE), "w") as f:
+                json.dump(meta, f)
+        else:
+            self._disk_vectors = np.load(self._path(EMBEDDINGS_FILE), mmap_mode="r+")
+            self._disk_keys = np.load(self._path(KEYS_FILE), mmap_mode="r+")
+            self._disk_last_used = np.load(self._path(LAST_USED_FILE))
+
+        # Keys are stored as raw digest words; empty slots have an all-zero key
+        used_mask = self._disk_keys[:, :KEY_WORDS].any(axis=1)
+        used = np.flatnonzero(used_mask)
+        self._slots = {self._disk_keys[i, :KEY_WORDS].tobytes(): int(i) for i in used}
+        self._free_slots = np.flatnonzero(~used_mask)[::-1].tolist()
+        self._clock = int(self._disk_last_used.max()) if len(used) else 0
+        print(f"Embedding cache: {len(self._slots)} vectors on disk in {self.directory}")
+
+    def _evict_disk(self):
+        """Frees the least recently used 10% of the disk tier in one pass."""
+        n_evict = max(1, self.max_disk_items // 10)
+        used = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+        victims = used[np.argpartition(self._disk_last_used[used], n_evict - 1)[:n_evict]]
+        victim_set = set(victims.tolist())
+        self._slots = {key: slot for key, slot in self._slots.items() if slot not in victim_set}
+        for slot in victims:
+            self._disk_keys[slot] = 0
+            self._disk_last_used[slot] = 0
+            self._free_slots.append(int(slot))
+        self.stats["disk_evictions"] += len(victims)
+
+    def _slot_holds(self, slot, key, vector):
+        words = self._disk_keys[slot]
+        return (
+            words[:KEY_WORDS].tobytes() == key
+            and words[KEY_WORDS] == _vector_check(vector)
+        )
+
+    def _put_disk(self, key, vector):
+        if key in self._slots:
+            return
+        if not self._free_slots:
+            self._evict_disk()
+        slot = self._free_slots.pop()
+        # Invalidate, write the vector, then publish key + checksum: a crash or
+        # another process writing the same slot leaves it unreadable, not wrong
+        self._disk_keys[slot] = 0
+        self._disk_vectors[slot] = vector
+        self._disk_keys[slot, KEY_WORDS] = _vector_check(vector)
+        self._disk_keys[slot, :KEY_WORDS] = np.frombuffer(key, dtype=np.uint64)
+        self._clock += 1
+        self._disk_last_used[slot] = self._clock
+        self._slots[key] = slot
+
+    # ── Memory tier ───────────────────────────────────────────────────────────
+    def _put_memory(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    # ── Public API ────────────────────────────────────────────────────────────
+    def get(self, key):
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return vector
+
+        slot = self._slots.get(key) if self._disk_vectors is not None else None
+        if slot is not None:
+            vector = np.array(self._disk_vectors[slot])
+            if not self._slot_holds(slot, key, vector):
+                # Slot was reused (by another process sharing the directory, or
+                # before a crash); drop the stale mapping and recompute
+                del self._slots[key]
+                slot = None
+        if slot is not None:
+            self._clock += 1
+            self._disk_last_used[slot] = self._clock
+            self._put_memory(key, vector)
+            self.stats["disk_hits"] += 1
+            return vector
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        self._put_memory(key, vector)
+        if self._disk_vectors is not None:
+            self._put_disk(key, vector)
+
+    def get_or_compute(self, texts, compute_fn):
+        """
+        Returns a (len(texts), dim) matrix for `texts`. Cached rows are served from
+        memory/disk; the rest are computed with one `compute_fn(list_of_texts)` call
+        (texts with the same normalised key are computed once) and stored.
+        """
+        keys = [text_key(t) for t in texts]
+        result = np.empty((len(texts), self.dim), dtype=np.float32)
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key in missing:
+                missing[key].append(i)
+                continue
+            vector = self.get(key)
+            if vector is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                result[i] = vector
+
+        metrics.inc("embedding_cache_hits_total", len(texts) - sum(map(len, missing.values())))
+        metrics.inc("embedding_cache_misses_total", len(missing))
+        if missing:
+            miss_keys = list(missing)
+            vectors = compute_fn([texts[missing[k][0]] for k in miss_keys])
+            for key, vector in zip(miss_keys, vectors):
+                self.put(key, vector)
+                result[missing[key]] = vector
+
+        return result
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def summary(self):
+        return (
+            f"Embedding cache: hit_rate={self.hit_rate():.1%} "
+            f"(memory={self.stats['memory_hits']}, disk={self.stats['disk_hits']}, "
+            f"misses={self.stats['misses']}), memory_items={len(self._memory)}, "
+            f"disk_items={len(self._slots)}, evictions={self.stats['memory_evictions']}"
+            f"/{self.stats['disk_evictions']}"
+        )
+
+    def save(self):
+        """
+        Flushes the disk tier. Keys live next to their vectors, so this only
+        makes the writes durable and stores the LRU order (a hint: a lost
+        last_used file just makes eviction less accurate).
+        """
+        if self._disk_vectors is None:
+            return
+        self._disk_vectors.flush()
+        self._disk_keys.flush()
+        tmp_path = self._path(LAST_USED_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, self._disk_last_used)
+        os.replace(tmp_path, self._path(LAST_USED_FILE))
+        print(f"Saved embedding cache ({len(self._slots)} vectors) to {self.directory}")
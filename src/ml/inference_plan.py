@@ -0,0 +1,258 @@
+import copy
+import json
+import os
+
+import numpy as np
+
+# plan.json holds the column names/flags; arrays live next to it as plan_<name>.npy
+INFERENCE_PLAN_FILE = "plan.json"
+PLAN_PREFIX = "plan_"
+
+# Categorical features fed to the OneHotEncoder by build_feature_dict
+CATEGORICAL_FEATURES = ("level", "source", "semantic_group")
+
+# Upper bound on elements per broadcasted (rows x clusters x dims) distance chunk
+MAX_CHUNK_ELEMENTS = 2**23
+
+
+def _stat(value):
+    """Running statistic as a float (plain float or river Rolling stat)."""
+    if value is None:
+        return 0.0
+    return float(value.get()) if hasattr(value, "get") else float(value)
+
+
+def _find_steps(pipeline):
+    """
+    Finds the StandardScaler and OneHotEncoder branches of the pipeline built by
+    create_streaming_pipeline(), with the keys each branch selects.
+    """
+    from river import compose, preprocessing
+
+    branches = (
+        pipeline.transformers.values()
+        if isinstance(pipeline, compose.TransformerUnion)
+        else [pipeline]
+    )
+    scaler = encoder = None
+    numeric_keys = categorical_keys = None
+    for branch in branches:
+        steps = list(branch.steps.values()) if isinstance(branch, compose.Pipeline) else [branch]
+        if len(steps) != 2 or not isinstance(steps[0], compose.Select):
+            raise ValueError(f"Unsupported pipeline branch: {branch}")
+        if isinstance(steps[1], preprocessing.StandardScaler):
+            scaler, numeric_keys = steps[1], set(steps[0].keys)
+        elif isinstance(steps[1], preprocessing.OneHotEncoder):
+            encoder, categorical_keys = steps[1], set(steps[0].keys)
+        else:
+            raise ValueError(f"Unsupported pipeline step: {steps[1]}")
+
+    if scaler is None or encoder is None:
+        raise ValueError("Pipeline needs a StandardScaler and a OneHotEncoder branch")
+    if categorical_keys != set(CATEGORICAL_FEATURES):
+        raise ValueError(f"Unexpected categorical features: {sorted(categorical_keys)}")
+    if getattr(encoder, "drop_first", False):
+        raise ValueError("OneHotEncoder(drop_first=True) is not supported")
+    return scaler, numeric_keys, encoder
+
+
+class InferencePlan:
+    def __init__(
+        self,
+        means,
+        stds,
+        categorical_columns,
+        numeric_centers,
+        categorical_centers,
+        cluster_keys,
+        initialized=True,
+        count_unknown=True,
+    ):
+        """
+        Frozen, dense form of the river pipeline + DenStream used for prediction.
+        :param means, stds: float32 scaler stats per embedding dim; std 0 = constant column.
+        :param categorical_columns: One-hot column names ("level_ERROR", ...), in matrix order.
+        :param numeric_centers: (n_clusters, dim) macro-cluster centres over the scaled embedding.
+        :param categorical_centers: (n_clusters, n_columns) centres over the one-hot columns.
+        :param cluster_keys: Cluster id of each centre row.
+        :param count_unknown: Unseen categories still emit a one-hot key (river's default encoder).
+        """
+        self.means = np.asarray(means, dtype=np.float32)
+        self.stds = np.asarray(stds, dtype=np.float32)
+        self.categorical_columns = list(categorical_columns)
+        self.numeric_centers = np.asarray(numeric_centers, dtype=np.float64)
+        self.categorical_centers = np.asarray(categorical_centers, dtype=np.float64)
+        self.cluster_keys = np.asarray(cluster_keys, dtype=np.int64)
+        self.initialized = bool(initialized)
+        self.count_unknown = bool(count_unknown)
+
+        self._column_index = {name: i for i, name in enumerate(self.categorical_columns)}
+        self._categorical_sq = (self.categorical_centers**2).sum(axis=1)
+
+    @property
+    def n_clusters(self):
+        return len(self.cluster_keys)
+
+    def scale(self, embeddings):
+        """StandardScaler.transform_one for a whole batch (float32, like river on float32 input)."""
+        x = np.asarray(embeddings, dtype=np.float32)
+        constant = self.stds == 0
+        scaled = (x - self.means) / np.where(constant, np.float32(1), self.stds)
+        scaled[:, constant] = 0.0
+        return scaled.astype(np.float64)
+
+    def _categorical_distances(self, levels, sources, sem_ids):
+        """
+        Squared distance of each row's one-hot part to every centre:
+        sum_j c_j^2 - sum_{j active} (2 c_j - 1), plus 1 per unseen category.
+        """
+        n = len(levels)
+        result = np.tile(self._categorical_sq, (n, 1))
+        for i, values in enumerate(zip(levels, sources, sem_ids)):
+            for feature, value in zip(CATEGORICAL_FEATURES, values):
+                if feature == "semantic_group" and not value:
+                    value = "unknown"
+                col = self._column_index.get(f"{feature}_{value}")
+                if col is not None:
+                    result[i] += 1.0 - 2.0 * self.categorical_centers[:, col]
+                elif self.count_unknown:
+                    result[i] += 1.0
+        return result
+
+    def predict(self, embeddings, levels, sources, sem_ids):
+        """
+        Cluster id per row, as DenStream.predict_one(pipeline.transform_one(
+        build_feature_dict(level, source, embedding, sem_id))) would return it.
+        """
+        n = len(levels)
+        if not self.initialized:
+            return np.zeros(n, dtype=np.int64)
+        if self.n_clusters == 0:
+            return np.full(n, -1, dtype=np.int64)
+
+        scaled = self.scale(embeddings)
+        distances = self._categorical_distances(levels, sources, sem_ids)
+
+        chunk = max(1, MAX_CHUNK_ELEMENTS // (self.n_clusters * scaled.shape[1]))
+        for start in range(0, n, chunk):
+            diff = scaled[start : start + chunk, None, :] - self.numeric_centers[None, :, :]
+            distances[start : start + chunk] += np.einsum("ijk,ijk->ij", diff, diff)
+
+        return self.cluster_keys[np.argmin(distances, axis=1)]
+
+    def save(self, directory):
+        """
+        Writes the plan as plain .npy arrays (+ plan.json for the column names)
+        so it can be memory-mapped on load.
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            "means": self.means,
+            "stds": self.stds,
+            "numeric_centers": self.numeric_centers,
+            "categorical_centers": self.categorical_centers,
+            "cluster_keys": self.cluster_keys,
+        }
+        for name, array in arrays.items():
+            _save_array(os.path.join(directory, f"{PLAN_PREFIX}{name}.npy"), array)
+
+        meta = {
+            "categorical_columns": self.categorical_columns,
+            "initialized": self.initialized,
+            "count_unknown": self.count_unknown,
+        }
+        path = os.path.join(directory, INFERENCE_PLAN_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+        print(f"Saved inference plan ({self.n_clusters} clusters) to {directory}")
+
+    @staticmethod
+    def load(directory, mmap_mode="r"):
+        """Returns the saved plan, or None when the directory has none."""
+        path = os.path.join(directory, INFERENCE_PLAN_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+
+        def array(name):
+            return np.load(os.path.join(directory, f"{PLAN_PREFIX}{name}.npy"), mmap_mode=mmap_mode)
+
+        plan = InferencePlan(
+            array("means"),
+            array("stds"),
+            meta["categorical_columns"],
+            array("numeric_centers"),
+            array("categorical_centers"),
+            array("cluster_keys"),
+            initialized=meta["initialized"],
+            count_unknown=meta["count_unknown"],
+        )
+        print(f"Loaded inference plan ({plan.n_clusters} clusters) from {directory}")
+        return plan
+
+
+def _save_array(path, array):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+def compile_inference_plan(model, pipeline):
+    """
+    Freezes a trained river pipeline + DenStream into an InferencePlan.
+    The macro clusters are those DenStream.predict_one builds from the current
+    p-micro-clusters; they are computed on a copy so `model` is left untouched.
+    """
+    scaler, numeric_keys, encoder = _find_steps(pipeline)
+
+    dim = len(numeric_keys)
+    names = [f"vec_{i}" for i in range(dim)]
+    if set(names) != numeric_keys:
+        raise ValueError("Numeric features must be vec_0 .. vec_{dim-1}")
+
+    means = np.array([_stat(scaler.means.get(k)) for k in names], dtype=np.float32)
+    if scaler.with_std:
+        variances = np.array([_stat(scaler.vars.get(k)) for k in names])
+        stds = np.array([v**0.5 if v else 0.0 for v in variances], dtype=np.float32)
+    else:
+        stds = np.ones(dim, dtype=np.float32)
+
+    columns = [f"{feature}_{value}" for feature, values in encoder.values.items() for value in values]
+
+    if not model.initialized:
+        return InferencePlan(means, stds, columns, np.empty((0, dim)), np.empty((0, len(columns))), [], initialized=False)
+
+    probe = copy.deepcopy(model)
+    probe.predict_one({})
+    centers = {key: mc.calc_center(probe.timestamp) for key, mc in probe.clusters.items()}
+
+    # Centre keys outside the known columns (never set on an input row) still add c^2
+    numeric = set(names)
+    column_index = {name: i for i, name in enumerate(columns)}
+    for center in centers.values():
+        for key in center:
+            if key not in numeric and key not in column_index:
+                column_index[key] = len(columns)
+                columns.append(key)
+
+    numeric_centers = np.zeros((len(centers), dim))
+    categorical_centers = np.zeros((len(centers), len(columns)))
+    for row, center in enumerate(centers.values()):
+        for key, value in center.items():
+            if key in numeric:
+                numeric_centers[row, int(key[4:])] = value
+            else:
+                categorical_centers[row, column_index[key]] = value
+
+    return InferencePlan(
+        means,
+        stds,
+        columns,
+        numeric_centers,
+        categorical_centers,
+        list(centers.keys()),
+        count_unknown=getattr(encoder, "categories", None) is None,
+    )
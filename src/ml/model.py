@@ -1,6 +1,22 @@
+import hashlib
+import json
 import os
+import shutil
+import threading
+import time
 import joblib
-from river import cluster
+
+from src.ml.centroid_index import INDEX_FILE
+from src.ml.centroid_store import (
+    CENTROID_IDS_FILE,
+    CENTROID_STATS_FILE,
+    CENTROIDS_FILE,
+    CentroidStore,
+    open_centroids,
+)
+from src.ml.inference_plan import INFERENCE_PLAN_FILE, PLAN_PREFIX, InferencePlan
+from src.ml.state_lock import state_lock
+from src.ml.vector_engine import SemanticVectorEngine
 
 # Default file names
 MODEL_FILE = "denstream_model.pkl"
@@ -8,6 +24,8 @@ PIPELINE_FILE = "river_pipeline.pkl"
 
 
 def create_new_model():
+    from river import cluster
+
     return cluster.DenStream(
         decaying_factor=0.0005,
         epsilon=0.9,
@@ -44,3 +62,193 @@ def load_model(directory="models/production"):
     except FileNotFoundError:
         print(f"No model found in {directory}.")
         return None, None
+
+
+# ── Snapshot format ──────────────────────────────────────────────────────────
+# A snapshot is the prediction-only part of a model directory: the compiled
+# inference plan and the semantic centroid store as .npy arrays (memory-mapped
+# on load) plus manifest.json with their sha256 hashes and a version. The manifest
+# is written last, so a directory with a manifest is always complete.
+# Mutable state (template_miner.pkl, the embedding cache) is not part of it.
+MANIFEST_FILE = "manifest.json"
+SNAPSHOT_FORMAT = 1
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _snapshot_files(directory):
+    return sorted(
+        name
+        for name in os.listdir(directory)
+        if name in (INFERENCE_PLAN_FILE, CENTROIDS_FILE, CENTROID_IDS_FILE, CENTROID_STATS_FILE)
+        or (name.startswith(PLAN_PREFIX) and name.endswith(".npy"))
+    )
+
+
+class ModelSnapshot:
+    def __init__(self, directory, manifest, plan, centroids):
+        self.directory = directory
+        self.manifest = manifest
+        self.plan = plan
+        # (ids, open centroids.npy handle, stats), or None for a snapshot without centroids
+        self._centroids = centroids
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    @property
+    def centroid_ids(self):
+        return self._centroids[0] if self._centroids is not None else []
+
+    def load_centroid_store(self, mmap_mode="c"):
+        """
+        New copy-on-write mapping of this snapshot's centroids (file pages are
+        shared across processes), or None. Stays on this version after a promotion.
+        """
+        if self._centroids is None:
+            return None
+        return CentroidStore.from_file(*self._centroids, mmap_mode=mmap_mode)
+
+    def build_vector_engine(self, **engine_kwargs):
+        """SemanticVectorEngine on its own mapping of this snapshot's centroids."""
+        engine = SemanticVectorEngine(**engine_kwargs)
+        store = self.load_centroid_store()
+        if store is not None:
+            engine.use_store(store, index_path=os.path.join(self.directory, INDEX_FILE))
+        return engine
+
+
+def save_snapshot(directory, plan, vector_engine):
+    """
+    Writes the plan + centroid arrays into `directory`, then the manifest.
+    Returns the manifest.
+    """
+    plan.save(directory)
+    vector_engine.save_arrays(directory)
+
+    files = {name: _sha256(os.path.join(directory, name)) for name in _snapshot_files(directory)}
+    content_hash = hashlib.sha256(
+        "".join(f"{name}:{digest}\n" for name, digest in files.items()).encode()
+    ).hexdigest()
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{content_hash[:12]}",
+        "content_hash": content_hash,
+        "files": files,
+        "n_clusters": plan.n_clusters,
+        "n_centroids": len(vector_engine.centroid_ids),
+        "centroid_dtype": vector_engine.store.dtype.name,
+    }
+
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+    print(f"Saved model snapshot {manifest['version']} to {directory}")
+    return manifest
+
+
+def read_manifest(directory):
+    """The directory's manifest, or None if there is none (yet)."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(directory, verify=False, mmap_mode="r"):
+    """
+    Loads the snapshot in `directory`, or returns None if it has none.
+    Arrays are memory-mapped, so this costs milliseconds regardless of size.
+    :param verify: Re-hash every file against the manifest (raises ValueError on mismatch).
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    if manifest.get("format", 0) > SNAPSHOT_FORMAT:
+        raise ValueError(f"Snapshot format {manifest['format']} is newer than {SNAPSHOT_FORMAT}")
+
+    if verify:
+        for name, digest in manifest["files"].items():
+            if _sha256(os.path.join(directory, name)) != digest:
+                raise ValueError(f"Snapshot file {name} does not match manifest {manifest['version']}")
+
+    plan = InferencePlan.load(directory, mmap_mode=mmap_mode)
+    centroids = open_centroids(directory)
+    print(f"Loaded model snapshot {manifest['version']} from {directory}")
+    return ModelSnapshot(directory, manifest, plan, centroids)
+
+
+def promote_snapshot(staging_dir, production_dir, backup_dir):
+    """
+    Blue/green switch: verifies the staged snapshot, then moves production to
+    `backup_dir` and staging into its place (under production's state_lock).
+    Watchers pick the new version up from its manifest.
+    """
+    staged = load_snapshot(staging_dir, verify=True)
+    if staged is None:
+        raise ValueError(f"No snapshot manifest in {staging_dir}; refusing to promote")
+
+    if os.path.exists(backup_dir):
+        shutil.rmtree(backup_dir)
+    if os.path.exists(production_dir):
+        # Runners saving state into production hold this lock and re-check the
+        # version once they get it, so none writes into the retired directory
+        with state_lock(production_dir):
+            os.rename(production_dir, backup_dir)  # Move old live model aside
+            os.rename(staging_dir, production_dir)  # Move new model to live slot
+    else:
+        os.rename(staging_dir, production_dir)
+    print(f"Promoted snapshot {staged.version} to {production_dir}")
+    return staged.version
+
+
+class SnapshotWatcher:
+    def __init__(self, directory, verify=True):
+        """
+        Holds the current snapshot of `directory` for a long-lived process and
+        swaps to a newly promoted one on poll().
+        :param verify: Check file hashes before swapping to a new version.
+        """
+        self.directory = directory
+        self.verify = verify
+        self._lock = threading.Lock()
+        self._snapshot = load_snapshot(directory, verify=verify)
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def poll(self):
+        """
+        Loads and swaps in the snapshot if its manifest changed. The swap is a
+        single reference assignment, so readers see either the old or the new
+        snapshot, never a mix. Returns True when the version changed.
+        """
+        manifest = read_manifest(self.directory)
+        current = self._snapshot
+        if manifest is None or (current is not None and manifest == current.manifest):
+            return False
+
+        with self._lock:
+            try:
+                snapshot = load_snapshot(self.directory, verify=self.verify)
+            except (OSError, ValueError) as e:
+                # Mid-promotion or corrupt: keep serving the current version
+                print(f"Snapshot reload skipped: {e}")
+                return False
+            if snapshot is None or read_manifest(self.directory) != snapshot.manifest:
+                return False
+            self._snapshot = snapshot
+
+        previous = current.version if current is not None else None
+        print(f"Model snapshot swapped: {previous} -> {snapshot.version}")
+        return True
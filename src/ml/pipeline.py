@@ -1,12 +1,134 @@
-from river import compose, preprocessing
-from sentence_transformers import SentenceTransformer
+import os
+import threading
 
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+import numpy as np
+
+from src import metrics
+from src.ml.embedding_backends import DEFAULT_MODEL, make_backend
+
+EMBEDDING_MODEL_NAME = DEFAULT_MODEL
 embedding_dimension = 384
 
+# "sentence-transformers" (default), "int8", "onnx" or "onnx-int8"
+# (see src/ml/embedding_backends.py)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "sentence-transformers")
+
+# Created on first use; the backend itself loads its model on the first encode,
+# so importing src.ml does not pull in torch
+_embedding_backend = None
+_embedding_backend_lock = threading.Lock()
+
+
+def get_embedding_backend():
+    """Returns the shared embedding backend selected by EMBEDDING_BACKEND."""
+    global _embedding_backend
+    if _embedding_backend is None:
+        with _embedding_backend_lock:
+            if _embedding_backend is None:
+                _embedding_backend = make_backend(EMBEDDING_BACKEND)
+    return _embedding_backend
+
+
+def build_log_text(message, parsed_data):
+    """Text fed to the embedding model for a single log row."""
+    return f"{message}. Parsed: {parsed_data}"
+
 
 def get_text_embedding(text):
-    return embedding_model.encode(text)
+    return get_embedding_backend().encode([text])[0]
+
+
+def get_text_embeddings(texts, batch_size=64, cache=None, backend=None):
+    """
+    Encodes a whole batch of texts with batched forward passes.
+    The model is run on fixed-size chunks of `batch_size` texts, so memory
+    stays bounded no matter how many texts are passed in.
+    Exact duplicates are embedded once and fanned out; with an
+    `EmbeddingCache`, previously seen texts skip the model entirely.
+    `backend` defaults to the shared EMBEDDING_BACKEND one.
+    Returns a (len(texts), embedding_dimension) float32 matrix, row i
+    belonging to texts[i].
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, embedding_dimension), dtype=np.float32)
+
+    unique_rows = {}
+    inverse = np.fromiter(
+        (unique_rows.setdefault(t, len(unique_rows)) for t in texts),
+        dtype=np.int64,
+        count=len(texts),
+    )
+    unique_texts = list(unique_rows)
+
+    if backend is None:
+        backend = get_embedding_backend()
+
+    def encode(batch):
+        with metrics.timer("embedding_forward_seconds"):
+            return backend.encode(batch, batch_size=batch_size)
+
+    if cache is None:
+        vectors = encode(unique_texts)
+    else:
+        vectors = cache.get_or_compute(unique_texts, encode)
+
+    return vectors[inverse]
+
+
+def embed_and_group(
+    texts, log_ids, vector_engine, template_miner=None, embed_fn=None, learn_templates=True
+):
+    """
+    Embeds a batch of log texts and assigns their semantic groups.
+    With a TemplateMiner, logs are first mapped to templates so embedding and
+    semantic grouping run once per template, then fan out to every log.
+    :param learn_templates: False only matches existing templates (the tree is
+                            not modified); logs without a match are embedded
+                            on their own and get template id None.
+    Returns (embeddings, sem_ids, template_ids); template_ids is None without a miner.
+    """
+    if embed_fn is None:
+        embed_fn = get_text_embeddings
+
+    if template_miner is None:
+        with metrics.timer("embedding_seconds"):
+            embeddings = embed_fn(texts)
+        with metrics.timer("semantic_grouping_seconds"):
+            sem_ids = vector_engine.get_semantic_groups(embeddings, log_ids)
+        return embeddings, sem_ids, None
+
+    with metrics.timer("template_mining_seconds"):
+        if learn_templates:
+            template_ids = template_miner.add_logs(texts)
+        else:
+            template_ids = [template_miner.match(text) for text in texts]
+
+    # First log of each template names any new semantic group it creates;
+    # an unmatched log is keyed by its row so it is embedded as is
+    keys = [t if t is not None else ("row", i) for i, t in enumerate(template_ids)]
+    first_log = {}
+    for key, log_id in zip(keys, log_ids):
+        first_log.setdefault(key, log_id)
+    unique_keys = list(first_log)
+
+    with metrics.timer("embedding_seconds"):
+        template_embeddings = embed_fn(
+            [
+                texts[key[1]] if isinstance(key, tuple) else template_miner.get_template(key)
+                for key in unique_keys
+            ]
+        )
+    with metrics.timer("semantic_grouping_seconds"):
+        template_sem_ids = vector_engine.get_semantic_groups(
+            template_embeddings, list(first_log.values())
+        )
+    if learn_templates:
+        print(f"Mined {len(unique_keys)} templates from {len(template_ids)} logs.")
+
+    row_of = {key: i for i, key in enumerate(unique_keys)}
+    rows = np.fromiter((row_of[k] for k in keys), dtype=np.int64, count=len(keys))
+    return template_embeddings[rows], [template_sem_ids[r] for r in rows], template_ids
 
 
 def build_feature_dict(level, source, embedding_vector, semantic_id=None):
@@ -27,6 +149,8 @@ def build_feature_dict(level, source, embedding_vector, semantic_id=None):
 
 
 def create_streaming_pipeline():
+    from river import compose, preprocessing
+
     vec_keys = [f"vec_{i}" for i in range(embedding_dimension)]
 
     numeric_pipeline = compose.Select(*vec_keys) | preprocessing.StandardScaler()
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from src.ml.embedding_backends import SentenceTransformerBackend
+
+# Engine + backend of the pool being started. Set in the parent right before
+# the fork; workers use their inherited (copy-on-write) copy, nothing is pickled.
+_shared = {}
+
+
+def _init_worker(threads):
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    backend = _shared["backend"]
+    if hasattr(backend, "num_threads"):
+        backend.num_threads = threads
+
+
+def _encode_shard(args):
+    texts, batch_size = args
+    return _shared["backend"].encode(texts, batch_size=batch_size)
+
+
+def _search_shard(vectors):
+    return _shared["engine"]._nearest_existing(vectors)
+
+
+def shard_bounds(n_rows, n_shards):
+    """Contiguous (start, stop) ranges covering n_rows, empty ones dropped."""
+    edges = np.linspace(0, n_rows, n_shards + 1).astype(int)
+    return [(a, b) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+class ShardPool:
+    def __init__(self, vector_engine, backend, n_workers=None, threads_per_worker=None):
+        """
+        Fork-based worker pool for one classification run. Workers inherit the
+        engine (memory-mapped centroids) and the embedding model copy-on-write;
+        each embeds and searches a contiguous shard of every batch. New groups
+        are created in the parent (vector_engine.resolve_groups, in log order),
+        so results do not depend on which worker finishes first.
+        Drop-in for the backend of get_text_embeddings and the vector engine of
+        embed_and_group.
+        :param n_workers: Worker processes (default: one per CPU).
+        :param threads_per_worker: Torch / ONNX Runtime threads per worker
+                                   (default: CPUs // n_workers).
+        """
+        if vector_engine.max_centroids is not None or vector_engine.update_rate:
+            # Workers address centroids by row, so rows must not move or be evicted
+            raise ValueError("ShardPool needs fixed centroid rows (no max_centroids / update_rate)")
+
+        cpus = os.cpu_count() or 1
+        self.n_workers = n_workers or cpus
+        self.vector_engine = vector_engine
+        self.backend = backend
+        self.name = backend.name
+        self.cache_key = backend.cache_key
+
+        if isinstance(backend, SentenceTransformerBackend):
+            backend.model  # Load once here; the weights are shared after the fork
+        # (ONNX sessions own thread pools that do not survive a fork, so each
+        # worker opens its own; the model file is shared through the page cache.)
+
+        # Workers hold the first `searched` centroid rows; later ones are the parent's
+        self.searched = vector_engine._size
+        _shared.update(engine=vector_engine, backend=backend)
+        # Tokenizer threads are not fork-safe and workers are sized by process anyway
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        threads = threads_per_worker or max(1, cpus // self.n_workers)
+        self._pool = multiprocessing.get_context("fork").Pool(
+            self.n_workers, initializer=_init_worker, initargs=(threads,)
+        )
+        print(f"Started {self.n_workers} classification workers ({threads} threads each)")
+
+    def encode(self, texts, batch_size=64):
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        shards = [(texts[a:b], batch_size) for a, b in shard_bounds(len(texts), self.n_workers)]
+        return np.concatenate(self._pool.map(_encode_shard, shards))
+
+    def get_semantic_groups(self, matrix, log_ids):
+        vectors = np.ascontiguousarray(matrix, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        shards = [vectors[a:b] for a, b in shard_bounds(len(vectors), self.n_workers)]
+        results = self._pool.map(_search_shard, shards)
+        best_idx = np.concatenate([idx for idx, _ in results]) if results else np.empty(0, np.int64)
+        best_dist = np.concatenate([dist for _, dist in results]) if results else np.empty(0, np.float32)
+        return self.vector_engine.resolve_groups(
+            vectors, log_ids, best_idx, best_dist, searched=self.searched
+        )
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        _shared.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
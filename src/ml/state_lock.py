@@ -0,0 +1,33 @@
+import fcntl
+import os
+from contextlib import contextmanager
+
+STATE_LOCK_FILE = ".state.lock"
+
+
+@contextmanager
+def state_lock(directory):
+    """
+    Exclusive lock on the state that batch runners update in a model
+    directory (the template tree). Holders reload what changed, apply their
+    batch and save before releasing, so concurrent runners take turns instead
+    of overwriting each other's updates.
+    An flock(2) advisory lock: covers processes on the same host or sharing a
+    filesystem that supports it (local disk, a shared container volume).
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, STATE_LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def file_signature(path):
+    """Identifies one version of a file saved with os.replace; None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
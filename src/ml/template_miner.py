@@ -0,0 +1,171 @@
+import os
+import re
+import joblib
+
+# Default file name, saved next to the other models
+TEMPLATE_FILE = "template_miner.pkl"
+
+WILDCARD = "<*>"
+
+# Variable fields masked before mining (order matters: most specific first)
+MASKS = [
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?\b"), "<TS>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<UUID>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<IP>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "<HEX>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\s?(?:ms|us|ns|s|sec|secs|seconds|m|min|h)\b"), "<DUR>"),
+    (re.compile(r"\b[0-9a-fA-F]{16,}\b"), "<HEX>"),
+    (re.compile(r"(?<![\w<])[-+]?\d+(?:\.\d+)?\b"), "<NUM>"),
+]
+
+
+def mask_variables(text):
+    for pattern, token in MASKS:
+        text = pattern.sub(token, text)
+    return text
+
+
+def _has_digits(token):
+    return any(ch.isdigit() for ch in token)
+
+
+class LogTemplate:
+    __slots__ = ("template_id", "tokens", "size")
+
+    def __init__(self, template_id, tokens):
+        self.template_id = template_id
+        self.tokens = tokens
+        self.size = 1
+
+    @property
+    def text(self):
+        return " ".join(self.tokens)
+
+
+class TemplateMiner:
+    def __init__(self, depth=4, sim_threshold=0.4, max_children=100):
+        """
+        Streaming Drain-style template miner.
+        :param depth: Depth of the prefix tree (token-count level + depth-2 prefix tokens).
+        :param sim_threshold: Min fraction of matching tokens to join an existing template.
+        :param max_children: Max distinct children per tree node before falling back to <*>.
+        """
+        self.depth = depth
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+
+        # root: { token_count: node }, node: { token: node } ... leaf: [template_id, ...]
+        self.root = {}
+        self.templates = {}
+
+    def _leaf(self, tokens, create):
+        """Walks (or grows) the prefix tree and returns the leaf's template id list."""
+        node = self.root.setdefault(len(tokens), {}) if create else self.root.get(len(tokens))
+        if node is None:
+            return None
+
+        for token in tokens[: max(0, self.depth - 2)]:
+            key = WILDCARD if _has_digits(token) else token
+            if key not in node:
+                if create and len(node) < self.max_children:
+                    node[key] = {}
+                else:
+                    key = WILDCARD
+                    if key not in node:
+                        if not create:
+                            return None
+                        node[key] = {}
+            node = node[key]
+
+        return node.setdefault(None, []) if create else node.get(None)
+
+    def _similarity(self, template_tokens, tokens):
+        same = 0
+        params = 0
+        for t1, t2 in zip(template_tokens, tokens):
+            if t1 == WILDCARD:
+                params += 1
+            elif t1 == t2:
+                same += 1
+        return same / len(tokens) if tokens else 1.0, params
+
+    def _best_match(self, leaf, tokens):
+        best = None
+        best_key = (-1.0, -1)
+        for template_id in leaf:
+            template = self.templates[template_id]
+            sim, params = self._similarity(template.tokens, tokens)
+            if sim >= self.sim_threshold and (sim, params) > best_key:
+                best, best_key = template, (sim, params)
+        return best
+
+    def add_log(self, text):
+        """
+        Masks variables in `text`, assigns it to a template (creating or
+        generalising one) and returns the template id.
+        """
+        tokens = mask_variables(str(text)).split()
+        leaf = self._leaf(tokens, create=True)
+        template = self._best_match(leaf, tokens)
+
+        if template is None:
+            template = LogTemplate(len(self.templates), tokens)
+            self.templates[template.template_id] = template
+            leaf.append(template.template_id)
+            return template.template_id
+
+        template.size += 1
+        template.tokens = [
+            t1 if t1 == t2 else WILDCARD for t1, t2 in zip(template.tokens, tokens)
+        ]
+        return template.template_id
+
+    def add_logs(self, texts):
+        return [self.add_log(text) for text in texts]
+
+    def match(self, text):
+        """Read-only lookup: template id for `text`, or None if nothing matches."""
+        tokens = mask_variables(str(text)).split()
+        leaf = self._leaf(tokens, create=False)
+        if not leaf:
+            return None
+        template = self._best_match(leaf, tokens)
+        return template.template_id if template else None
+
+    def get_template(self, template_id):
+        return self.templates[template_id].text
+
+    def template_texts(self, template_ids):
+        """{template_id: text} snapshot, for use while later logs keep generalising the tree."""
+        return {template_id: self.get_template(template_id) for template_id in set(template_ids)}
+
+    def cluster_templates(self, cluster_ids, sources, levels, template_ids, texts=None):
+        """
+        Pattern text per cluster for save_pattern, built from the mined template
+        of the first log seen in each cluster: "source | level | template".
+        :param texts: Optional template_texts() snapshot to read instead of the live tree.
+        """
+        get_text = texts.__getitem__ if texts is not None else self.get_template
+        patterns = {}
+        for cluster_id, source, level, template_id in zip(
+            cluster_ids, sources, levels, template_ids
+        ):
+            if cluster_id not in patterns:
+                patterns[cluster_id] = f"{source} | {level} | {get_text(template_id)}"
+        return patterns
+
+    def save(self, filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_path = filepath + ".tmp"
+        joblib.dump(self, tmp_path)
+        os.replace(tmp_path, filepath)
+        print(f"Saved {len(self.templates)} log templates to {filepath}")
+
+    @staticmethod
+    def load(filepath):
+        """Returns the saved miner, or None when no template tree exists yet."""
+        if not os.path.exists(filepath):
+            return None
+        miner = joblib.load(filepath)
+        print(f"Loaded {len(miner.templates)} log templates from {filepath}")
+        return miner
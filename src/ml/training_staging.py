@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from src.ml.centroid_store import CentroidStore
+from src.ml.template_miner import TEMPLATE_FILE, TemplateMiner
+
+CHECKPOINT_FILE = "checkpoint.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+SEM_IDS_FILE = "sem_ids.npy"
+TEMPLATE_IDS_FILE = "template_ids.npy"
+
+# Fixed-width so the column can be memory-mapped like the others
+SEM_ID_DTYPE = "U64"
+
+
+def _fingerprint(log_ids, settings):
+    digest = hashlib.sha256(np.ascontiguousarray(log_ids, dtype=np.int64).tobytes())
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class TrainingStaging:
+    def __init__(self, directory, log_ids, dim, settings=None):
+        """
+        Crash-resumable buffer for the training run's embedding stage: one
+        memory-mapped .npy per column (embeddings, sem_ids, template_ids),
+        preallocated for every training log, plus checkpoint.json with the
+        number of committed rows and the vector engine / template miner state
+        as of that row. Rows are committed chunk by chunk with commit().
+
+        A directory holding a checkpoint for the same log_ids, dim and
+        `settings` (anything that changes grouping) is resumed from its last
+        commit; anything else is discarded.
+        """
+        self.directory = directory
+        self.n_rows = len(log_ids)
+        self.dim = dim
+        self.fingerprint = _fingerprint(log_ids, settings or {})
+
+        checkpoint = self._read_checkpoint()
+        if (
+            checkpoint is not None
+            and checkpoint["fingerprint"] == self.fingerprint
+            and checkpoint["n_rows"] == self.n_rows
+            and checkpoint["dim"] == dim
+        ):
+            self.checkpoint = checkpoint
+            mode = "r+"
+            print(f"[STAGING] Resuming at row {self.committed}/{self.n_rows} from {directory}")
+        else:
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            os.makedirs(directory)
+            self.checkpoint = {
+                "fingerprint": self.fingerprint,
+                "n_rows": self.n_rows,
+                "dim": dim,
+                "committed": 0,
+                "state": None,
+            }
+            mode = "w+"
+
+        def column(name, dtype, shape):
+            path = os.path.join(directory, name)
+            if mode == "r+":
+                return np.load(path, mmap_mode="r+")
+            return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+        self.embeddings = column(EMBEDDINGS_FILE, np.float32, (self.n_rows, dim))
+        self.sem_ids = column(SEM_IDS_FILE, SEM_ID_DTYPE, (self.n_rows,))
+        self.template_ids = column(TEMPLATE_IDS_FILE, np.int64, (self.n_rows,))
+        if mode == "w+":
+            self._write_checkpoint()
+
+    @property
+    def committed(self):
+        return self.checkpoint["committed"]
+
+    def _read_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.checkpoint, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def restore(self, vector_engine, template_miner=None):
+        """
+        Puts the vector engine (and template miner) back in the state of the
+        last commit. Returns the template miner to keep using.
+        """
+        state = self.checkpoint["state"]
+        if state is None:
+            return template_miner
+        state_dir = os.path.join(self.directory, state["dir"])
+        vector_engine.use_store(CentroidStore.load(state_dir, mmap_mode=None))
+        for name, value in state["engine"].items():
+            setattr(vector_engine, name, value)
+        if template_miner is not None:
+            template_miner = TemplateMiner.load(os.path.join(state_dir, TEMPLATE_FILE))
+        print(f"[STAGING] Restored {len(vector_engine.centroid_ids)} semantic centroids")
+        return template_miner
+
+    def commit(self, end, embeddings, sem_ids, template_ids, vector_engine, template_miner=None):
+        """
+        Stores rows committed..end and the state that produced them. The
+        checkpoint is written last, so a crash at any point leaves the previous
+        commit intact.
+        """
+        start = self.committed
+        self.embeddings[start:end] = embeddings
+        self.sem_ids[start:end] = sem_ids
+        self.template_ids[start:end] = -1 if template_ids is None else template_ids
+        for column in (self.embeddings, self.sem_ids, self.template_ids):
+            column.flush()
+
+        # A fresh state directory per commit; the checkpoint switches to it
+        state_name = f"state_{end}"
+        state_dir = os.path.join(self.directory, state_name)
+        if os.path.exists(state_dir):
+            shutil.rmtree(state_dir)
+        vector_engine.save_arrays(state_dir)
+        if template_miner is not None:
+            template_miner.save(os.path.join(state_dir, TEMPLATE_FILE))
+
+        previous = self.checkpoint["state"]
+        self.checkpoint["committed"] = end
+        self.checkpoint["state"] = {
+            "dir": state_name,
+            "engine": {
+                "clock": vector_engine.clock,
+                "created": vector_engine.created,
+                "merges": vector_engine.merges,
+                "evictions": vector_engine.evictions,
+            },
+        }
+        self._write_checkpoint()
+        if previous is not None and previous["dir"] != state_name:
+            shutil.rmtree(os.path.join(self.directory, previous["dir"]), ignore_errors=True)
+        print(f"[STAGING] Committed rows {start}-{end} of {self.n_rows}")
+
+    def columns(self):
+        """(embeddings, sem_ids, template_ids) of all rows; template_ids is None without mining."""
+        template_ids = self.template_ids.tolist()
+        if self.n_rows and template_ids[0] == -1:
+            template_ids = None
+        return self.embeddings, self.sem_ids.tolist(), template_ids
+
+    def cleanup(self):
+        self.embeddings = self.sem_ids = self.template_ids = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+        print(f"[STAGING] Removed {self.directory}")
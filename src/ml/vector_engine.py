@@ -1,61 +1,451 @@
 import os
+from types import MappingProxyType
+
 import joblib
 import numpy as np
-from scipy.spatial import distance
+
+from src import metrics
+from src.ml.centroid_index import INDEX_FILE, make_index, save_index, load_index
+from src.ml.centroid_store import CentroidStore
+
+# Upper bound on elements materialised per distance chunk (rows x centroids x dims).
+# Keeps the broadcasted Minkowski intermediate around 64MB of float32.
+MAX_CHUNK_ELEMENTS = 2**24
+
+# Rows of a float16 centroid matrix converted to float32 at a time for distances
+CENTROID_BLOCK_ROWS = 65536
+
+# Once over max_centroids, evict down to this fraction of it, so eviction (and
+# the index rebuild after it) runs once per ~10% of growth, not per new group
+EVICTION_TARGET = 0.9
 
 
 class SemanticVectorEngine:
-    def __init__(self, minkowski_p=1.5, threshold=0.35):
+    def __init__(
+        self,
+        minkowski_p=1.5,
+        threshold=0.35,
+        metric="minkowski",
+        index="exact",
+        index_params=None,
+        storage_dtype="float32",
+        max_centroids=None,
+        decay_half_life=None,
+        update_rate=0.0,
+        merge_threshold=None,
+    ):
         """
         :param minkowski_p: 1.5 is a robust balance between Manhattan (1) and Euclidean (2).
         :param threshold: Distance threshold. Lower = stricter grouping.
+        :param metric: "minkowski" (default) or "cosine". Cosine uses a single BLAS
+                       dot product and assumes vectors are already L2-normalised
+                       (MiniLM output is), so distance = 1 - dot(a, b).
+        :param index: Search backend for known centroids: "exact", "ivf", "lsh"
+                      (see src/ml/centroid_index.py) or an index instance.
+        :param index_params: Keyword args for the index, e.g. {"n_probe": 16}.
+        :param storage_dtype: "float32" or "float16" centroid storage (see
+                              src/ml/centroid_store.py); distances are always float32.
+        :param max_centroids: Hard cap on the number of groups; as soon as a new group
+                              exceeds it the groups with the lowest (decayed)
+                              weight are evicted. None = unbounded.
+        :param decay_half_life: Weights halve every this many logs (the engine's clock
+                                counts assigned logs). None = weight is the hit count.
+        :param update_rate: Move a matched centroid towards each member by this
+                            fraction. 0 keeps the first log as a fixed leader.
+        :param merge_threshold: Drifted centroids closer than this to another one are
+                                merged into it (default: `threshold`).
         """
+        if metric not in ("minkowski", "cosine"):
+            raise ValueError(f"Unknown metric: {metric}")
+
         self.minkowski_p = minkowski_p
         self.threshold = threshold
-        # Dictionary to hold active semantic centroids: { 'semantic_id': vector_array }
-        self.active_centroids = {}
+        self.metric = metric
+        self.max_centroids = max_centroids
+        self.decay_half_life = decay_half_life
+        self.update_rate = update_rate
+        self.merge_threshold = threshold if merge_threshold is None else merge_threshold
+
+        # Logical clock (logs assigned so far) for last_seen and decay; wall time
+        # would make grouping depend on when a batch happens to run
+        self.clock = 0.0
+        self.created = 0
+        self.merges = 0
+        self.evictions = 0
+
+        # Centroids live in one contiguous matrix; row i belongs to centroid_ids[i].
+        self.store = CentroidStore(dtype=storage_dtype)
+
+        self.index = make_index(index, **(index_params or {}))
+
+    @property
+    def centroid_ids(self):
+        return self.store.ids
+
+    @property
+    def _size(self):
+        return len(self.store)
+
+    @property
+    def active_centroids(self):
+        """
+        Read-only { 'semantic_id': vector_array } snapshot, kept for callers of
+        the old dict API. Built on every access, so it is a MappingProxyType:
+        item assignment raises instead of being silently lost. Assign a whole
+        dict to the property (or use set_centroids) to replace the centroids.
+        """
+        matrix = self.store.matrix
+        return MappingProxyType({sem_id: matrix[i] for i, sem_id in enumerate(self.store.ids)})
+
+    @active_centroids.setter
+    def active_centroids(self, centroids):
+        if centroids:
+            self.set_centroids(list(centroids.keys()), np.stack(list(centroids.values())))
+        else:
+            self.set_centroids([], None)
+
+    def set_centroids(self, sem_ids, matrix, index_path=None):
+        """
+        Replaces all centroids with the rows of `matrix` (copied into the
+        engine's storage dtype). With `index_path`, a persisted approximate index
+        is reused when it matches.
+        """
+        self.use_store(CentroidStore.from_arrays(sem_ids, matrix, dtype=self.store.dtype), index_path)
+
+    def use_store(self, store, index_path=None):
+        """
+        Adopts `store` as the centroid storage without copying it, e.g. a
+        CentroidStore.load() mapping shared with other processes. The index is
+        only rebuilt when no matching one is persisted at `index_path`.
+        """
+        self.store = store
+        if len(store):
+            self.clock = max(self.clock, float(store.last_seen[: len(store)].max()))
+        if not (index_path and self._load_index(index_path)):
+            self.index.rebuild(self.centroid_matrix)
+
+    @property
+    def centroid_matrix(self):
+        """Contiguous (n_centroids, dim) matrix of the active centroids, in storage dtype."""
+        return self.store.matrix
+
+    def _append(self, sem_ids, vectors, update_index=True, now=None):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(sem_ids), -1)
+        rows = self.store.append(sem_ids, vectors, now=self.clock if now is None else now)
+        self.created += len(sem_ids)
+        metrics.inc("centroids_created_total", len(sem_ids))
+        if update_index:
+            self.index.add(vectors, rows, matrix=self.centroid_matrix)
 
     def calculate_distance(self, vec_a, vec_b):
-        return distance.minkowski(vec_a, vec_b, p=self.minkowski_p)
+        return float(self.pairwise_distances(np.atleast_2d(vec_a), np.atleast_2d(vec_b))[0, 0])
 
-    def get_semantic_group(self, new_vector, log_id):
+    def pairwise_distances(self, vectors, centroids):
         """
-        Finds the closest semantic group for a new vector.
+        Distance from every row of `vectors` to every row of `centroids`.
+        Returns a (len(vectors), len(centroids)) float32 matrix.
         """
-        best_match_id = None
-        min_dist = float("inf")
+        if self.metric == "cosine":
+            return 1.0 - vectors @ centroids.T
+
+        p = self.minkowski_p
+        diff = np.abs(vectors[:, None, :] - centroids[None, :, :])
+        if p == 1:
+            return diff.sum(axis=2)
+        if p == 2:
+            return np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+        if p == 1.5:
+            # |x|^1.5 without the generic pow() call
+            powered = diff * np.sqrt(diff)
+        else:
+            powered = np.power(diff, p)
+        return powered.sum(axis=2) ** (1.0 / p)
 
-        # 1. Compare against known semantic centers
-        for sem_id, centroid in self.active_centroids.items():
-            dist = self.calculate_distance(new_vector, centroid)
+    def _nearest(self, vectors, centroids, exclude=None):
+        """
+        Nearest centroid row and its distance for each vector, chunked so the
+        broadcasted intermediate stays under MAX_CHUNK_ELEMENTS.
+        :param exclude: Optional centroid row per vector to skip (e.g. its own row).
+        """
+        n = len(vectors)
+        best_idx = np.full(n, -1, dtype=np.int64)
+        best_dist = np.full(n, np.inf, dtype=np.float32)
+        if n == 0 or len(centroids) == 0:
+            return best_idx, best_dist
 
-            if dist < self.threshold and dist < min_dist:
-                min_dist = dist
-                best_match_id = sem_id
+        if centroids.dtype != np.float32:
+            # Reduced-precision storage: widen one block of centroids at a time
+            for start in range(0, len(centroids), CENTROID_BLOCK_ROWS):
+                block = centroids[start : start + CENTROID_BLOCK_ROWS].astype(np.float32)
+                idx, dist = self._nearest(vectors, block, None if exclude is None else exclude - start)
+                better = dist < best_dist
+                best_idx[better] = idx[better] + start
+                best_dist[better] = dist[better]
+            return best_idx, best_dist
 
-        # 2. Decision Logic
-        if best_match_id:
-            # OPTIONAL: Weighted average to slowly drift the centroid (Evolution)
-            # self.active_centroids[best_match_id] = 0.9 * self.active_centroids[best_match_id] + 0.1 * new_vector
-            return best_match_id
+        if self.metric == "cosine":
+            chunk = max(1, MAX_CHUNK_ELEMENTS // len(centroids))
         else:
-            # Create new group
-            new_id = f"sem_grp_{log_id}"
-            self.active_centroids[new_id] = new_vector
-            return new_id
+            chunk = max(1, MAX_CHUNK_ELEMENTS // (len(centroids) * centroids.shape[1]))
+
+        for start in range(0, n, chunk):
+            dists = self.pairwise_distances(vectors[start : start + chunk], centroids)
+            if exclude is not None:
+                skip = exclude[start : start + chunk]
+                inside = (skip >= 0) & (skip < len(centroids))
+                dists[np.nonzero(inside)[0], skip[inside]] = np.inf
+            idx = np.argmin(dists, axis=1)
+            best_idx[start : start + chunk] = idx
+            best_dist[start : start + chunk] = dists[np.arange(len(idx)), idx]
+
+        return best_idx, best_dist
+
+    def _nearest_existing(self, vectors):
+        """
+        Nearest known centroid through the configured index. Approximate indexes
+        return a candidate set per query; only those rows get exact distances.
+        """
+        if self.index.exact:
+            return self._nearest(vectors, self.centroid_matrix)
+
+        best_idx = np.full(len(vectors), -1, dtype=np.int64)
+        best_dist = np.full(len(vectors), np.inf, dtype=np.float32)
+        for i, rows in enumerate(self.index.search(vectors)):
+            if len(rows) == 0:
+                continue
+            idx, dist = self._nearest(vectors[i : i + 1], self.store.rows(rows))
+            best_idx[i] = rows[idx[0]]
+            best_dist[i] = dist[0]
+        return best_idx, best_dist
+
+    def get_semantic_groups(self, matrix, log_ids):
+        """
+        Batch version of get_semantic_group.
+        Distances to the already-known centroids are computed for the whole batch
+        with array ops; rows are then resolved in order so that a centroid created
+        by an earlier row of this batch can still be matched by later rows
+        (same leader-clustering result as calling get_semantic_group per row).
+        Returns a list of semantic ids aligned with `log_ids`.
+        """
+        vectors = np.ascontiguousarray(matrix, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+
+        # 1. Compare the whole batch against known semantic centers
+        best_idx, best_dist = self._nearest_existing(vectors)
+
+        # 2. Resolve row by row against centroids created earlier in this batch
+        return self.resolve_groups(vectors, log_ids, best_idx, best_dist)
+
+    def resolve_groups(self, vectors, log_ids, best_idx, best_dist, searched=None):
+        """
+        Second half of get_semantic_groups: given each row's nearest centroid
+        among the first `searched` rows (default: all current centroids),
+        checks the rows added since then and resolves the batch in order,
+        creating new groups. Lets the nearest-centroid search run elsewhere,
+        e.g. in worker processes holding a copy of the first `searched` rows.
+        """
+        batch_start = self._size
+        best_idx = np.array(best_idx, dtype=np.int64)
+        best_dist = np.array(best_dist, dtype=np.float32)
+        if searched is not None and searched < batch_start:
+            # Strictly closer only, so ties keep the lower (older) row as argmin would
+            idx, dist = self._nearest(vectors, self.store.block(searched, batch_start))
+            closer = dist < best_dist
+            best_idx[closer] = idx[closer] + searched
+            best_dist[closer] = dist[closer]
+
+        now = self.clock + len(log_ids)
+        assigned = np.full(len(log_ids), -1, dtype=np.int64)
+        groups = []
+        # Rows before `settled` have had their usage stats / drift applied
+        settled = 0
+        for i, log_id in enumerate(log_ids):
+            idx = best_idx[i] if best_dist[i] < self.threshold else -1
+            dist = best_dist[i]
+
+            if self._size > batch_start:
+                new_idx, new_dist = self._nearest(
+                    vectors[i : i + 1], self.store.block(batch_start, self._size)
+                )
+                if new_dist[0] < self.threshold and new_dist[0] < dist:
+                    idx = batch_start + new_idx[0]
+
+            if idx >= 0:
+                assigned[i] = idx
+                groups.append(self.centroid_ids[idx])
+            else:
+                # Create new group
+                new_id = f"sem_grp_{log_id}"
+                self._append([new_id], vectors[i], now=now)
+                groups.append(new_id)
+
+                if self.max_centroids is not None and self._size > self.max_centroids:
+                    # Hard cap: evict now. Eviction compacts the rows, so settle
+                    # the rows resolved so far and search the rest again
+                    self._settle(assigned[settled : i + 1], vectors[settled : i + 1], now)
+                    settled = i + 1
+                    if settled < len(log_ids):
+                        best_idx[settled:], best_dist[settled:] = self._nearest_existing(
+                            vectors[settled:]
+                        )
+                    batch_start = self._size
+
+        # 3. Usage stats, drift, then merge/evict (rows are only removed once the
+        #    rows they shift are resolved, so returned ids always match)
+        self._settle(assigned[settled:], vectors[settled:], now)
+
+        return groups
+
+    def _settle(self, assigned, vectors, now):
+        """
+        Applies usage stats and drift for resolved rows (`assigned` = matched
+        centroid row or -1), then merges drifted centroids and evicts if over
+        max_centroids.
+        """
+        self.clock = now
+        matched = assigned >= 0
+        rows, counts = np.unique(assigned[matched], return_counts=True)
+        self.store.touch(rows, counts, now, self.decay_half_life)
+
+        drifted = np.empty(0, dtype=np.int64)
+        if self.update_rate and len(rows):
+            drifted = self._drift(assigned[matched], vectors[matched])
+        if len(drifted) or (self.max_centroids is not None and self._size > self.max_centroids):
+            self.maintain(drifted)
+
+    def _drift(self, rows, vectors):
+        """
+        Moves each matched centroid towards its members, in batch order:
+        c <- c + update_rate * (v - c) per member, applied in closed form.
+        Returns the updated rows.
+        """
+        rate = self.update_rate
+        order = np.argsort(rows, kind="stable")
+        updated, starts, counts = np.unique(rows[order], return_index=True, return_counts=True)
+        centers = self.store.rows(updated).astype(np.float32)
+        for i, (start, k) in enumerate(zip(starts, counts)):
+            members = vectors[order[start : start + k]]
+            member_weights = rate * (1.0 - rate) ** np.arange(k - 1, -1, -1)
+            centers[i] = (1.0 - rate) ** k * centers[i] + member_weights @ members
+        self.store.update(updated, centers)
+        # Approximate indexes bucket rows by their vector; move drifted rows along
+        self.index.update(centers, updated)
+        return updated
+
+    def _merge(self, rows):
+        """
+        Merges each of `rows` into its nearest other centroid when they are within
+        merge_threshold. The heavier centroid survives, moved to the weighted mean.
+        Returns (removed rows, [(merged_id, kept_id), ...]).
+        """
+        store = self.store
+        idx, dist = self._nearest(store.rows(rows), self.centroid_matrix, exclude=rows)
+        weights = store.decayed_weights(self.clock, self.decay_half_life)
+
+        removed, merged = set(), []
+        for row, other, d in zip(rows.tolist(), idx.tolist(), dist.tolist()):
+            if other < 0 or d >= self.merge_threshold or row in removed or other in removed:
+                continue
+            keep, drop = (row, other) if weights[row] >= weights[other] else (other, row)
+            w_keep, w_drop = max(weights[keep], 1e-12), max(weights[drop], 1e-12)
+            pair = store.rows([keep, drop])
+            store.update([keep], (w_keep * pair[0] + w_drop * pair[1]) / (w_keep + w_drop))
+
+            weights[keep] = weights[keep] + weights[drop]
+            store.weight[keep] = weights[keep]
+            store.hits[keep] += store.hits[drop]
+            store.last_seen[keep] = self.clock
+            removed.add(drop)
+            merged.append((store.ids[drop], store.ids[keep]))
+        return removed, merged
+
+    def maintain(self, rows=None):
+        """
+        Merges centroids in `rows` (default: all) that are within merge_threshold
+        of another one, then evicts the lowest-weight groups if over max_centroids.
+        Removed rows are compacted and the index is rebuilt.
+        Returns {"merged": [(merged_id, kept_id), ...], "evicted": [ids]}.
+        """
+        rows = np.arange(self._size) if rows is None else np.asarray(rows, dtype=np.int64)
+        removed, merged = self._merge(rows) if len(rows) else (set(), [])
+
+        evicted = []
+        remaining = self._size - len(removed)
+        if self.max_centroids is not None and remaining > self.max_centroids:
+            target = int(self.max_centroids * EVICTION_TARGET)
+            weights = self.store.decayed_weights(self.clock, self.decay_half_life)
+            weights[list(removed)] = np.inf
+            # Lowest weight first, least recently seen on ties
+            order = np.lexsort((self.store.last_seen[: self._size], weights))
+            evicted = order[: remaining - target].tolist()
+            removed.update(evicted)
+            evicted = [self.centroid_ids[r] for r in evicted]
+
+        if removed:
+            self.store.remove(sorted(removed))
+            self.index.rebuild(self.centroid_matrix)
+        self.merges += len(merged)
+        self.evictions += len(evicted)
+        metrics.inc("centroids_merged_total", len(merged))
+        metrics.inc("centroids_evicted_total", len(evicted))
+        return {"merged": merged, "evicted": evicted}
+
+    def stats(self):
+        """Size and lifetime counters, for tuning max_centroids / decay."""
+        return {
+            "size": self._size,
+            "max_centroids": self.max_centroids,
+            "created": self.created,
+            "merges": self.merges,
+            "evictions": self.evictions,
+            "clock": self.clock,
+        }
+
+    def get_semantic_group(self, new_vector, log_id):
+        """
+        Finds the closest semantic group for a new vector.
+        """
+        return self.get_semantic_groups(np.atleast_2d(new_vector), [log_id])[0]
 
     def save(self, filepath="models/vector_centroids.pkl"):
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        print(
-            f"Saving {len(self.active_centroids)} semantic centroids to {filepath}..."
-        )
-        joblib.dump(self.active_centroids, filepath)
+        print(f"Saving {self._size} semantic centroids to {filepath}...")
+        joblib.dump(dict(self.active_centroids), filepath)
+        if not self.index.exact:
+            save_index(self.index, os.path.join(os.path.dirname(filepath), INDEX_FILE))
+
+    def save_arrays(self, directory):
+        """Writes the centroid store as centroids.npy + centroid_ids.json (memory-mappable)."""
+        self.store.save(directory)
 
     def load(self, filepath="models/vector_centroids.pkl"):
         if os.path.exists(filepath):
-            self.active_centroids = joblib.load(filepath)
-            print(
-                f"Loaded {len(self.active_centroids)} semantic centroids from {filepath}."
+            centroids = joblib.load(filepath)
+            self.set_centroids(
+                list(centroids.keys()),
+                np.stack(list(centroids.values())) if centroids else None,
+                index_path=os.path.join(os.path.dirname(filepath), INDEX_FILE),
             )
+            print(f"Loaded {self._size} semantic centroids from {filepath}.")
         else:
             print("No existing vector centroids found. Starting fresh.")
+
+    def _load_index(self, index_path):
+        """
+        Reuses a persisted index of the same type when it matches the loaded
+        centroids; rows saved after the index was written are inserted
+        incrementally. Returns False when there is none to reuse (the caller
+        rebuilds the index).
+        """
+        if self.index.exact:
+            return False
+        saved = load_index(index_path)
+        if saved is None or saved.name != self.index.name or saved.n_rows > self._size:
+            return False
+        if saved.n_rows < self._size:
+            rows = np.arange(saved.n_rows, self._size)
+            saved.add(self.store.rows(rows), rows, matrix=self.centroid_matrix)
+        self.index = saved
+        return True
+
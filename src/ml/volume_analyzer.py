@@ -1,6 +1,4 @@
-import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
 import joblib
 import os
 
@@ -14,15 +12,22 @@ class VolumeAnomalyDetector:
         :param window_size: Number of past batches to consider for context.
         """
         self.window_size = window_size
+        # Built on first train(); load() replaces it with the saved forest.
+        # Keeps sklearn out of the import path of incident detection.
+        self.model = None
+        self.is_trained = False
+
+    def _new_model(self):
+        from sklearn.ensemble import IsolationForest
+
         # Isolation Forest Configuration
         # contamination=0.05 means we estimate roughly 5% of data might be anomalous
-        self.model = IsolationForest(
+        return IsolationForest(
             n_estimators=100,
             contamination=0.05,
             random_state=42,
             n_jobs=-1,  # Use all CPU cores
         )
-        self.is_trained = False
 
     def _extract_features(self, history_df):
         """
@@ -34,43 +39,50 @@ class VolumeAnomalyDetector:
         3. Rolling Average (Context)
         4. Deviation (How far from average?)
         """
-        features = []
-        cluster_ids = []
-
         if history_df.empty:
             return np.array([]), []
 
-        # Group by cluster to process each cluster's specific timeline
-        grouped = history_df.groupby("cluster_id")
+        # Rows ordered by cluster, then time, so each cluster is a contiguous run
+        cids = history_df["cluster_id"].to_numpy()
+        # .values keeps tz-aware timestamps as datetime64 (to_numpy() gives objects)
+        order = np.lexsort((history_df["batch_timestamp"].values, cids))
+        cids = cids[order]
+        counts = history_df["log_count"].to_numpy()[order]
+
+        starts = np.flatnonzero(np.r_[True, cids[1:] != cids[:-1]])
+        lengths = np.diff(np.r_[starts, len(cids)])
 
-        for cid, group in grouped:
-            # We need at least 2 data points to calculate velocity
-            if len(group) < self.window_size:
-                continue
+        # We need at least window_size data points per cluster
+        keep = np.flatnonzero(lengths >= self.window_size)
+        if len(keep) == 0:
+            return np.array([]), []
 
-            # Sort by time just in case
-            group = group.sort_values("batch_timestamp")
-            counts = group["log_count"].values
+        features = np.empty((len(keep), 4))
+        # Clusters with the same number of points form one (clusters, n) matrix,
+        # so mean/std reduce per row exactly like np.mean/np.std on each
+        # cluster's own array (at inference time every cluster has window_size)
+        kept_lengths = lengths[keep]
+        for n in np.unique(kept_lengths):
+            rows = np.flatnonzero(kept_lengths == n)
+            window = counts[starts[keep[rows]][:, None] + np.arange(n)]
 
             # 1. Current Volume (The latest entry)
-            current_vol = counts[-1]
+            current_vol = window[:, -1]
 
             # 2. Velocity (Current - Previous)
-            prev_vol = counts[-2]
-            velocity = current_vol - prev_vol
+            velocity = current_vol - window[:, -2]
 
             # 3. Rolling Average (Mean of the visible window)
-            rolling_avg = np.mean(counts)
+            rolling_avg = np.mean(window, axis=1)
 
             # 4. Deviation (Z-Score approximation)
             # Add small epsilon (1e-5) to prevent division by zero if std_dev is 0
-            std_dev = np.std(counts) + 1e-5
+            std_dev = np.std(window, axis=1) + 1e-5
             deviation = (current_vol - rolling_avg) / std_dev
 
-            features.append([current_vol, velocity, rolling_avg, deviation])
-            cluster_ids.append(cid)
+            features[rows] = np.column_stack([current_vol, velocity, rolling_avg, deviation])
 
-        return np.array(features), cluster_ids
+        return features, cids[starts[keep]].tolist()
 
     def train(self, historical_data_df):
         """
@@ -86,6 +98,8 @@ class VolumeAnomalyDetector:
             return
 
         print(f"Training Volume Model on {len(X)} samples...")
+        if self.model is None:
+            self.model = self._new_model()
         self.model.fit(X)
         self.is_trained = True
         print("✅ Volume Model Trained successfully.")
@@ -174,3 +188,131 @@ class VolumeAnomalyDetector:
             print(f"Volume model loaded from {path}")
         else:
             print("⚠️ No Volume model found. Inference will be skipped.")
+
+
+class EWMAVolumeDetector:
+    def __init__(self, alpha=0.3, z_threshold=4.0, warmup=5, capacity=256):
+        """
+        Streaming alternative to the Isolation Forest: per cluster, an
+        exponentially weighted mean and variance of its per-batch log count
+        (three numbers), updated after each batch in O(1) per cluster.
+        A batch count is scored against the state *before* it is absorbed.
+        :param alpha: Weight of the newest batch (higher = shorter memory).
+        :param z_threshold: Flag a cluster when its count is this many
+                            standard deviations above its running mean.
+        :param warmup: Batches a cluster needs before it is scored (the
+                       Isolation Forest's window_size plays the same role).
+        :param capacity: Initial number of cluster rows allocated.
+        """
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.cluster_ids = []
+        self.index = {}
+        self.mean = np.zeros(capacity)
+        self.var = np.zeros(capacity)
+        self.n = np.zeros(capacity, dtype=np.int64)
+        # Last cluster_volume_history id absorbed; catch_up() continues after it
+        self.history_id = 0
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    def _rows(self, cluster_ids):
+        rows = np.empty(len(cluster_ids), dtype=np.int64)
+        for i, cid in enumerate(cluster_ids):
+            row = self.index.get(cid)
+            if row is None:
+                row = len(self.cluster_ids)
+                if row == len(self.mean):
+                    self.mean = np.concatenate([self.mean, np.zeros_like(self.mean)])
+                    self.var = np.concatenate([self.var, np.zeros_like(self.var)])
+                    self.n = np.concatenate([self.n, np.zeros_like(self.n)])
+                self.cluster_ids.append(cid)
+                self.index[cid] = row
+            rows[i] = row
+        return rows
+
+    def score(self, batch_stats):
+        """
+        z-scores of a batch {cluster_id: log_count} against the current state,
+        without updating it. Returns (cluster_ids, z) for warmed-up clusters.
+        """
+        known, rows, counts = [], [], []
+        for cid, count in batch_stats.items():
+            row = self.index.get(int(cid))
+            if row is not None and self.n[row] >= self.warmup:
+                known.append(int(cid))
+                rows.append(row)
+                counts.append(count)
+        if not known:
+            return [], np.array([])
+        rows = np.array(rows)
+        counts = np.array(counts, dtype=np.float64)
+        # Counts are Poisson-like: the mean is a floor for the variance, so a
+        # flat cluster going from 10 to 12 logs is not a 1000-sigma event
+        std = np.sqrt(np.maximum(self.var[rows], self.mean[rows])) + 1e-5
+        return known, (counts - self.mean[rows]) / std
+
+    def update(self, batch_stats):
+        """Absorbs one batch {cluster_id: log_count}; clusters not in it are unchanged."""
+        if not batch_stats:
+            return
+        rows = self._rows([int(cid) for cid in batch_stats])
+        counts = np.fromiter(batch_stats.values(), dtype=np.float64, count=len(batch_stats))
+        first = self.n[rows] == 0
+        diff = counts - self.mean[rows]
+        incr = self.alpha * diff
+        self.mean[rows] = np.where(first, counts, self.mean[rows] + incr)
+        self.var[rows] = np.where(first, 0.0, (1 - self.alpha) * (self.var[rows] + diff * incr))
+        self.n[rows] += 1
+
+    def detect_anomalies(self, batch_stats, max_anomalies=3):
+        """
+        Scores the batch, then absorbs it.
+        Returns: List of cluster_ids that are anomalous (at most max_anomalies,
+        highest z first).
+        """
+        cluster_ids, z = self.score(batch_stats)
+        self.update(batch_stats)
+        print(
+            f"EWMA scoring: {len(cluster_ids)}/{len(batch_stats)} batch clusters warmed up "
+            f"(warmup={self.warmup}, {len(self)} tracked)"
+        )
+
+        flagged = sorted(
+            ((cid, zi) for cid, zi in zip(cluster_ids, z) if zi > self.z_threshold),
+            key=lambda item: -item[1],
+        )[:max_anomalies]
+        for cid, zi in flagged:
+            print(f"  🚨 FLAGGED Cluster {cid}: z={zi:.2f}")
+        return [cid for cid, _ in flagged]
+
+    def catch_up(self, history_df, exclude_timestamp=None):
+        """
+        Absorbs the batches in a history DataFrame [id, cluster_id, log_count,
+        batch_timestamp] in batch_timestamp order, skipping the batch saved at
+        `exclude_timestamp` (the one about to be scored), and remembers the
+        highest id so the next call only needs newer rows.
+        """
+        if history_df.empty:
+            return
+        batches = history_df
+        if exclude_timestamp is not None:
+            batches = batches[batches["batch_timestamp"] != exclude_timestamp]
+        for _, batch in batches.sort_values("batch_timestamp").groupby(
+            "batch_timestamp", sort=False
+        ):
+            self.update(dict(zip(batch["cluster_id"], batch["log_count"])))
+        if "id" in history_df:
+            self.history_id = max(self.history_id, int(history_df["id"].max()))
+
+    @classmethod
+    def from_history(cls, history_df, **kwargs):
+        """
+        Warms a detector up from a history DataFrame [id, cluster_id, log_count,
+        batch_timestamp], replaying batches in batch_timestamp order.
+        """
+        detector = cls(**kwargs)
+        detector.catch_up(history_df)
+        return detector
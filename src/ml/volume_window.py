@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class VolumeWindow:
+    def __init__(self, window_size=5, capacity=256):
+        """
+        Last `window_size` per-batch log counts of every cluster, kept in one
+        (clusters, window_size) ring buffer. Built once per process from
+        cluster_volume_history, then caught up with the rows saved since, so
+        anomaly detection does not re-rank the table on every batch.
+        :param window_size: Counts kept per cluster (the detector's window).
+        :param capacity: Initial number of cluster rows allocated.
+        """
+        self.window_size = window_size
+        self.cluster_ids = []
+        self.index = {}
+        self.counts = np.zeros((capacity, window_size), dtype=np.int64)
+        # Counts pushed per cluster so far; the next slot is pushes % window_size
+        self.pushes = np.zeros(capacity, dtype=np.int64)
+        self.batches = 0
+        # Last cluster_volume_history id pushed; catch_up() continues after it
+        self.history_id = 0
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    def _row(self, cluster_id):
+        row = self.index.get(cluster_id)
+        if row is None:
+            row = len(self.cluster_ids)
+            if row == len(self.counts):
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+                self.pushes = np.concatenate([self.pushes, np.zeros_like(self.pushes)])
+            self.cluster_ids.append(cluster_id)
+            self.index[cluster_id] = row
+        return row
+
+    def push(self, batch_stats):
+        """
+        Appends one batch: batch_stats is {cluster_id: log_count}.
+        Clusters absent from the batch keep their window unchanged, like
+        clusters without a row in cluster_volume_history for that batch.
+        """
+        for cluster_id, count in batch_stats.items():
+            row = self._row(int(cluster_id))
+            self.counts[row, self.pushes[row] % self.window_size] = count
+            self.pushes[row] += 1
+        self.batches += 1
+
+    def windows(self):
+        """
+        (cluster_ids, counts, lengths): counts is (clusters, window_size) with
+        each row oldest -> newest; rows with fewer than window_size counts are
+        left-padded with zeros and `lengths` says how many are real.
+        """
+        n = len(self.cluster_ids)
+        pushes = self.pushes[:n]
+        lengths = np.minimum(pushes, self.window_size)
+        # Column j holds the k-th oldest kept count, k = j - (padding); the oldest
+        # sits at the next write slot once the ring has wrapped
+        oldest = np.where(pushes >= self.window_size, pushes % self.window_size, 0)
+        k = np.arange(self.window_size) - (self.window_size - lengths)[:, None]
+        slots = (oldest[:, None] + np.maximum(k, 0)) % self.window_size
+        padded = np.where(k >= 0, np.take_along_axis(self.counts[:n], slots, axis=1), 0)
+        return list(self.cluster_ids), padded, lengths
+
+    def to_frame(self):
+        """
+        The window as a cluster_volume_history-shaped DataFrame
+        [cluster_id, log_count, batch_timestamp] (batch_timestamp is the
+        position in the cluster's window), for VolumeAnomalyDetector.
+        """
+        import pandas as pd
+
+        cluster_ids, counts, lengths = self.windows()
+        mask = np.arange(self.window_size) >= (self.window_size - lengths)[:, None]
+        rows, positions = np.nonzero(mask)
+        return pd.DataFrame(
+            {
+                "cluster_id": np.asarray(cluster_ids, dtype=np.int64)[rows],
+                "log_count": counts[rows, positions],
+                "batch_timestamp": positions,
+            }
+        )
+
+    def catch_up(self, history_df):
+        """
+        Pushes the batches in a history DataFrame [id, cluster_id, log_count,
+        batch_timestamp] (one batch per batch_timestamp, in time order) and
+        remembers the highest id, so the next call only needs newer rows.
+        """
+        if history_df.empty:
+            return
+        for _, batch in history_df.sort_values("batch_timestamp").groupby(
+            "batch_timestamp", sort=False
+        ):
+            self.push(dict(zip(batch["cluster_id"], batch["log_count"])))
+        if "id" in history_df:
+            self.history_id = max(self.history_id, int(history_df["id"].max()))
+
+    @classmethod
+    def from_history(cls, history_df, window_size=5):
+        """
+        Seeds a window from a history DataFrame [id, cluster_id, log_count,
+        batch_timestamp], replaying batches in batch_timestamp order.
+        """
+        window = cls(window_size=window_size)
+        window.catch_up(history_df)
+        return window